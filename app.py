@@ -1,15 +1,24 @@
 from utils.roi_calculator import ROICalculator
 from utils.cwv import CWVAnalyzer
 from flask import Flask, render_template, request, redirect, session, jsonify, send_file
+from werkzeug.middleware.proxy_fix import ProxyFix
 import os
 from datetime import datetime, timedelta
-import stripe
-from supabase import create_client, Client
-from utils.google_api import GoogleAPIClient
-from utils.report_generator import ReportGenerator
 from utils.email_sender import EmailSender
+from utils.outbox import outbox
 from utils.throttler import Throttler
+from utils.jobs import JobQueue
+from utils.http_client import http_client
+from utils.artifact_store import artifact_store
+from utils import audit
+from utils.psi_governor import psi_governor, PSIRejected
+from utils.metering import quota_meter
+from utils.repository import UsersRepo, ReportsRepo, MagicLinksRepo, GoogleTokensRepo, query_log
+from utils import repository
+from utils.warehouse import warehouse
+from utils.scheduler import scheduler
 import hashlib
+import hmac
 import secrets
 
 from dotenv import load_dotenv
@@ -18,19 +27,15 @@ load_dotenv()  # Load .env file
 app = Flask(__name__)
 app.secret_key = os.getenv('FLASK_SECRET_KEY', secrets.token_hex(32))
 
-# Initialize services
-stripe.api_key = os.getenv('STRIPE_SECRET_KEY')
-from supabase import create_client, Client
-import os
-
-# Safe reading of env vars with fallbacks for local testing
-supabase_url = os.environ.get("SUPABASE_URL")
-supabase_key = os.environ.get("SUPABASE_ANON_KEY")  # this is correct for anon/public key
+# Only trust the X-Forwarded-For entries our own proxies append (Vercel adds one);
+# anything further left is client-controlled
+app.wsgi_app = ProxyFix(app.wsgi_app, x_for=int(os.getenv('TRUSTED_PROXY_HOPS', 1)))
 
-if not supabase_url or not supabase_key:
-    raise ValueError("Missing SUPABASE_URL or SUPABASE_ANON_KEY in environment variables")
+# Heavy clients load on first use so cold starts only pay for what a route needs:
+# Supabase via utils.repository, Stripe via get_stripe(), the Google client
+# libraries, ReportLab (report jobs) and the email provider (outbox sender)
 
-supabase: Client = create_client(supabase_url, supabase_key)
+job_queue = JobQueue()
 
 PRICING = {
     'starter_monthly': {'price_id': os.getenv('STRIPE_STARTER_MONTHLY'), 'amount': 3900},
@@ -41,6 +46,35 @@ PRICING = {
     'enterprise_yearly': {'price_id': os.getenv('STRIPE_ENTERPRISE_YEARLY'), 'amount': 19900},
 }
 
+def get_stripe():
+    """The stripe module, imported and configured on first use"""
+    import stripe
+    
+    stripe.api_key = os.getenv('STRIPE_SECRET_KEY')
+    return stripe
+
+@app.before_request
+def start_query_log():
+    query_log.start()
+
+@app.after_request
+def finish_query_log(response):
+    query_log.finish(request.url_rule.rule if request.url_rule else request.path)
+    return response
+
+def current_tier():
+    """The user's tier read fresh from Supabase, falling back to the session copy.
+
+    Not cached: an upgrade or cancellation handled by another instance must apply at once.
+    """
+    try:
+        user = UsersRepo.get_live(session['user_id'])
+        if user:
+            return user['tier']
+    except Exception as e:
+        print(f"Tier lookup error: {e}")
+    return session.get('tier', 'free')
+
 @app.route('/')
 def index():
     if 'user_id' in session:
@@ -64,11 +98,7 @@ def login():
     expires_at = datetime.now() + timedelta(hours=1)
     
     # Store token in Supabase
-    supabase.table('magic_links').insert({
-        'email': email,
-        'token': token,
-        'expires_at': expires_at.isoformat()
-    }).execute()
+    MagicLinksRepo.create(email, token, expires_at)
     
     # Send email
     magic_link = f"https://reportriser.com/verify?token={token}"
@@ -80,33 +110,21 @@ def login():
 def verify():
     token = request.args.get('token')
     
-    # Verify token
-    result = supabase.table('magic_links').select('*').eq('token', token).execute()
+    # Verify and delete the token in one round trip (links are single-use either way)
+    link = MagicLinksRepo.consume(token)
     
-    if not result.data or datetime.fromisoformat(result.data[0]['expires_at']) < datetime.now():
+    if not link or datetime.fromisoformat(link['expires_at']) < datetime.now():
         return "Invalid or expired link", 400
     
-    email = result.data[0]['email']
+    email = link['email']
     
     # Get or create user
-    user_result = supabase.table('users').select('*').eq('email', email).execute()
-    
-    if not user_result.data:
-        user_result = supabase.table('users').insert({
-            'email': email,
-            'tier': 'free',
-            'reports_used': 0,
-            'sites_used': 0
-        }).execute()
+    user = UsersRepo.get_by_email(email) or UsersRepo.create(email)
     
-    user = user_result.data[0]
     session['user_id'] = user['id']
     session['email'] = user['email']
     session['tier'] = user['tier']
     
-    # Delete used token
-    supabase.table('magic_links').delete().eq('token', token).execute()
-    
     return redirect('/dashboard')
 
 @app.route('/dashboard')
@@ -127,8 +145,12 @@ def dashboard():
         reports = []
     else:
         try:
-            user = supabase.table('users').select('*').eq('id', session['user_id']).execute().data[0]
-            reports = supabase.table('reports').select('*').eq('user_id', session['user_id']).order('created_at', desc=True).limit(10).execute().data
+            # Read-through cache; webhook and report writes invalidate it
+            user = UsersRepo.get_cached(session['user_id'])
+            if user is None:
+                raise LookupError(session['user_id'])
+            reports = ReportsRepo.recent_cached(session['user_id'])
+            session['tier'] = user['tier']
         except:
             user = {
                 'id': session['user_id'],
@@ -140,6 +162,20 @@ def dashboard():
             }
             reports = []
     
+    # The cached row may predate a tier change on another instance, a reserve or a
+    # new month; overlay the live tier and this month's count
+    if user['id'] != 'mock-user':
+        try:
+            live = UsersRepo.get_live(user['id'])
+        except Exception as e:
+            print(f"Live user load error: {e}")
+            live = None
+        if live:
+            user = {**user, 'tier': live['tier'], 'reports_used': quota_meter.period_usage(live)}
+            session['tier'] = live['tier']
+        else:
+            user = {**user, 'reports_used': 0}
+    
     limits = {
         'reports_per_month': 1 if user['tier'] == 'free' else (50 if user['tier'] == 'starter' else 999999),
         'sites': 1 if user['tier'] == 'free' else (3 if user['tier'] == 'starter' else 999999)
@@ -159,23 +195,28 @@ def google_auth():
     if 'user_id' not in session:
         return redirect('/')
     
+    from utils.google_api import GoogleAPIClient
+    
     auth_url = GoogleAPIClient.get_auth_url(session['user_id'])
     return redirect(auth_url)
 
 @app.route('/google-callback')
 def google_callback():
+    from utils.google_api import GoogleAPIClient
+    
     code = request.args.get('code')
     state = request.args.get('state')
     
     tokens = GoogleAPIClient.exchange_code(code)
     
     # Store tokens
-    supabase.table('google_tokens').upsert({
+    GoogleTokensRepo.upsert({
         'user_id': state,
         'access_token': tokens['access_token'],
         'refresh_token': tokens.get('refresh_token'),
         'expires_at': (datetime.now() + timedelta(seconds=tokens['expires_in'])).isoformat()
-    }).execute()
+    })
+    GoogleAPIClient.invalidate_credentials(state)
     
     return redirect('/dashboard?connected=true')
 
@@ -187,74 +228,104 @@ def generate_report():
     site_url = request.form.get('site_url')
     avg_order_value = float(request.form.get('avg_order_value', 100))
     
+    tier = current_tier()
+    
+    # Reserve quota up front; the job refunds it if generation fails
     try:
-        from utils.report_generator import ReportGenerator
-        
-        print(f"📊 Generating report for: {site_url}")
-        
-        # Get analytics data (mock or real)
-        analytics_data = ReportGenerator.get_mock_analytics()
-        search_data = ReportGenerator.get_mock_search_data()
-        
-        # Get CWV data
-        cwv_data = CWVAnalyzer.get_cwv_data(site_url)
-        cwv_summary = CWVAnalyzer.get_cwv_summary(cwv_data)
-        
-        # Get conversion/ROI data
-        conversions_data = ROICalculator.get_mock_conversions()
-        roi_data = ROICalculator.get_roi_summary(
-            analytics_data['total_users'], 
-            conversions_data['conversions'],
-            avg_order_value
-        )
-        
-        print("✅ Data loaded (traffic, CWV, ROI)")
-        
-        # Generate PDF with enhanced data
-        pdf_path = ReportGenerator.generate_pdf(
-            site_url,
-            analytics_data,
-            search_data,
-            cwv_summary,
-            roi_data,
-            conversions_data,
-            session.get('tier', 'free')
-        )
-        
-        print(f"✅ PDF generated at: {pdf_path}")
-        
-        import time
-        report_id = f"report_{int(time.time())}"
-        session[f'report_{report_id}'] = pdf_path
-        
-        return jsonify({'success': True, 'report_id': report_id})
-        
+        reservation_id, error = Throttler.reserve_report({'id': session['user_id'], 'tier': tier})
     except Exception as e:
-        print(f"❌ Error generating report: {e}")
-        import traceback
-        traceback.print_exc()
-        return jsonify({'error': str(e)}), 500
+        print(f"Quota check error: {e}")
+        return jsonify({'error': "We couldn't check your report quota right now. Please try again in a minute."}), 503
+    if error:
+        return jsonify({'error': error, 'upgrade': Throttler.get_recommended_tier({'tier': tier})}), 403
+    
+    # PSI fetch + ReportLab rendering take 30s+: a job worker runs them when one is
+    # configured (JOB_RUNNER=worker), otherwise this request does before answering
+    job_id = job_queue.submit(
+        'report',
+        session['user_id'],
+        site_url=site_url,
+        avg_order_value=avg_order_value,
+        tier=tier,
+        reservation_id=reservation_id
+    )
+    
+    return jsonify({'success': True, 'job_id': job_id, 'report_id': job_id}), 202
+
+@app.route('/jobs/<job_id>')
+def job_status(job_id):
+    if 'user_id' not in session:
+        return jsonify({'error': 'Unauthorized'}), 401
+    
+    job = job_queue.get(job_id)
+    if not job or job['user_id'] != session['user_id']:
+        return jsonify({'error': 'Job not found'}), 404
+    
+    return jsonify(JobQueue.public_status(job))
 
 @app.route('/download-report/<report_id>')
 def download_report(report_id):
     if 'user_id' not in session:
         return redirect('/')
     
-    # Get PDF path from session
-    pdf_path = session.get(f'report_{report_id}')
+    job = job_queue.get(report_id)
     
-    if not pdf_path:
+    if not job or job['user_id'] != session['user_id']:
         return "Report not found. Try generating it again.", 404
     
+    if job['status'] != 'done':
+        return f"Report is not ready yet (status: {job['status']}).", 409
+    
+    pdf_path = artifact_store.path(job['result']['artifact_key'])
+    if not pdf_path:
+        return "Report file has expired. Try generating it again.", 404
+    
+    # Streams from disk; conditional=True adds ETag/If-None-Match and Range support
+    return send_file(
+        pdf_path,
+        mimetype='application/pdf',
+        as_attachment=True,
+        download_name=f"seo-report-{report_id}.pdf",
+        conditional=True,
+        etag=job['result']['artifact_key']
+    )
+
+@app.route('/schedules', methods=['GET', 'POST'])
+def schedules():
+    if 'user_id' not in session:
+        return jsonify({'error': 'Unauthorized'}), 401
+    
+    if request.method == 'GET':
+        return jsonify({'schedules': scheduler.for_user(session['user_id'])})
+    
+    tier = current_tier()
+    allowed, error = Throttler.can_schedule_reports({'tier': tier})
+    if not allowed:
+        return jsonify({'error': error, 'upgrade': Throttler.get_recommended_tier({'tier': tier})}), 403
+    
     try:
-        import os
-        if not os.path.exists(pdf_path):
-            return f"PDF file not found at: {pdf_path}", 404
-            
-        return send_file(pdf_path, as_attachment=True, download_name=f"seo-report-{report_id}.pdf")
-    except Exception as e:
-        print(f"❌ Download error: {e}")
-        return f"Error downloading report: {str(e)}", 500
+        schedule = scheduler.upsert(
+            session['user_id'],
+            request.form['site_url'],
+            frequency=request.form.get('frequency', 'monthly'),
+            day=int(request.form.get('day', 1)),
+            hour=int(request.form.get('hour', 9)),
+            avg_order_value=float(request.form.get('avg_order_value', 100))
+        )
+    except (KeyError, ValueError) as e:
+        return jsonify({'error': str(e)}), 400
+    
+    return jsonify({'success': True, 'schedule': schedule})
+
+@app.route('/schedules/<int:schedule_id>/delete', methods=['POST'])
+def delete_schedule(schedule_id):
+    if 'user_id' not in session:
+        return jsonify({'error': 'Unauthorized'}), 401
+    
+    if not scheduler.delete(session['user_id'], schedule_id):
+        return jsonify({'error': 'Schedule not found'}), 404
+    
+    return jsonify({'success': True})
 
 @app.route('/checkout', methods=['POST'])
 def create_checkout():
@@ -262,6 +333,7 @@ def create_checkout():
         return jsonify({'error': 'Unauthorized'}), 401
     
     price_key = request.form.get('price_key')
+    stripe = get_stripe()
     
     try:
         checkout_session = stripe.checkout.Session.create(
@@ -285,6 +357,7 @@ def create_checkout():
 def stripe_webhook():
     payload = request.data
     sig_header = request.headers.get('Stripe-Signature')
+    stripe = get_stripe()
     
     try:
         event = stripe.Webhook.construct_event(
@@ -314,22 +387,24 @@ def stripe_webhook():
                 break
         
         # Update user
-        supabase.table('users').update({
+        UsersRepo.update(user_id, {
             'tier': tier,
             'stripe_customer_id': session_obj['customer'],
             'stripe_subscription_id': session_obj['subscription']
-        }).eq('id', user_id).execute()
+        })
         
     elif event['type'] == 'customer.subscription.deleted':
         subscription = event['data']['object']
         
         # Downgrade to free
-        supabase.table('users').update({
-            'tier': 'free'
-        }).eq('stripe_subscription_id', subscription['id']).execute()
+        UsersRepo.update_by_subscription(subscription['id'], {'tier': 'free'})
     
     return jsonify({'success': True})
 
+def get_client_ip():
+    # ProxyFix has already replaced remote_addr with the address our proxy saw
+    return request.remote_addr
+
 @app.route('/audit')
 def public_audit():
     """Public SEO audit tool - no login required"""
@@ -339,56 +414,13 @@ def public_audit():
         return render_template('audit.html', audit_data=None)
     
     try:
-        # Get CWV data
-        cwv_data = CWVAnalyzer.get_cwv_data(site_url)
-        cwv_summary = CWVAnalyzer.get_cwv_summary(cwv_data)
-        
-        # Basic on-page SEO check
-        import requests
-        from bs4 import BeautifulSoup
-        
-        try:
-            response = requests.get(site_url, timeout=10, headers={'User-Agent': 'Mozilla/5.0'})
-            soup = BeautifulSoup(response.content, 'html.parser')
-            
-            # Extract SEO elements
-            title = soup.find('title')
-            title_text = title.text if title else ''
-            title_length = len(title_text)
-            
-            meta_desc = soup.find('meta', attrs={'name': 'description'})
-            meta_desc_text = meta_desc['content'] if meta_desc and meta_desc.get('content') else ''
-            meta_desc_length = len(meta_desc_text)
-            
-            h1_tags = soup.find_all('h1')
-            h1_count = len(h1_tags)
-            
-            images = soup.find_all('img')
-            images_without_alt = len([img for img in images if not img.get('alt')])
-            missing_alt_percent = round((images_without_alt / len(images) * 100), 1) if images else 0
-            
-            seo_checks = {
-                'title_length': title_length,
-                'title_status': 'good' if 30 <= title_length <= 60 else 'warning',
-                'meta_desc_length': meta_desc_length,
-                'meta_desc_status': 'good' if 120 <= meta_desc_length <= 160 else 'warning',
-                'h1_count': h1_count,
-                'h1_status': 'good' if h1_count == 1 else 'warning',
-                'missing_alt_percent': missing_alt_percent,
-                'alt_status': 'good' if missing_alt_percent < 10 else 'warning'
-            }
-        except:
-            seo_checks = None
-        
-        audit_data = {
-            'url': site_url,
-            'cwv': cwv_summary,
-            'seo': seo_checks,
-            'timestamp': datetime.now().strftime('%B %d, %Y at %I:%M %p')
-        }
+        # Only a cache miss is charged to the client's rate limit
+        audit_data = audit.get_audit(site_url, client_ip=get_client_ip())
         
         return render_template('audit.html', audit_data=audit_data)
         
+    except PSIRejected as e:
+        return render_template('audit.html', audit_data={'error': str(e)}), e.status_code, {'Retry-After': str(e.retry_after)}
     except Exception as e:
         print(f"Audit error: {e}")
         return render_template('audit.html', audit_data={'error': str(e)})
@@ -444,6 +476,26 @@ def demo_report():
     
     return render_template('demo.html', demo=demo_data)
 
+@app.route('/metrics')
+def metrics():
+    """Internal cache/latency counters (requires METRICS_TOKEN)"""
+    token = os.getenv('METRICS_TOKEN')
+    if not token or not hmac.compare_digest(request.args.get('token', '').encode(), token.encode()):
+        return "Not found", 404
+
+    return jsonify({
+        'cwv_cache': CWVAnalyzer.get_cache_stats(),
+        'audit_cache': audit.get_cache_stats(),
+        'psi': psi_governor.stats(),
+        'http': http_client.stats(),
+        'artifacts': artifact_store.stats(),
+        'supabase_queries': query_log.stats(),
+        'user_cache': repository.get_cache_stats(),
+        'warehouse': warehouse.stats(),
+        'outbox': outbox.stats(),
+        'scheduler': scheduler.stats()
+    })
+
 @app.route('/logout')
 def logout():
     session.clear()
@@ -0,0 +1,5 @@
+"""
+Offline micro-benchmarks. Run each module with `python -m benchmarks.<name>`;
+`python -m benchmarks.suite` runs the route-level suite against local fakes
+and compares it with a saved baseline.
+"""
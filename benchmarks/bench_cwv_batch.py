@@ -0,0 +1,70 @@
+"""
+Scalar vs vectorized CWV classification and scoring over many URLs
+
+Checks the batch path agrees with get_cwv_summary on every row (threshold
+boundaries included) and times both.
+
+    python -m benchmarks.bench_cwv_batch [--urls 100000]
+"""
+import argparse
+import time
+
+import numpy as np
+
+from utils.cwv import CWVAnalyzer
+
+
+def synthetic_rows(count, seed=7):
+    rng = np.random.default_rng(seed)
+    lcp = np.round(rng.gamma(2.0, 1.5, count), 2)
+    fid = np.round(rng.gamma(1.5, 0.12, count), 2)
+    cls = np.round(rng.gamma(1.2, 0.1, count), 3)
+
+    # Put values exactly on every threshold so the <= boundaries are exercised
+    for values, metric in ((lcp, 'lcp'), (fid, 'fid'), (cls, 'cls')):
+        thresholds = CWVAnalyzer.THRESHOLDS[metric]
+        values[:count // 20] = thresholds['good']
+        values[count // 20:count // 10] = thresholds['needs_improvement']
+        rng.shuffle(values)
+
+    return [{'lcp': float(a), 'fid': float(b), 'cls': float(c)} for a, b, c in zip(lcp, fid, cls)], lcp, fid, cls
+
+
+def scalar(rows):
+    return [CWVAnalyzer.get_cwv_summary(row) for row in rows]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--urls', type=int, default=100000)
+    args = parser.parse_args()
+
+    rows, lcp, fid, cls = synthetic_rows(args.urls)
+
+    started = time.perf_counter()
+    expected = scalar(rows)
+    scalar_s = time.perf_counter() - started
+
+    started = time.perf_counter()
+    batch = CWVAnalyzer.score_batch(lcp, fid, cls)
+    batch_s = time.perf_counter() - started
+
+    started = time.perf_counter()
+    summaries = CWVAnalyzer.get_cwv_summaries(rows)
+    summaries_s = time.perf_counter() - started
+
+    mismatches = sum(1 for a, b in zip(expected, summaries) if a != b)
+    score_mismatches = int((batch['score'] != np.array([s['score'] for s in expected])).sum())
+
+    print(f"{args.urls:,} URLs")
+    print(f"scalar get_cwv_summary     {scalar_s:8.3f} s")
+    print(f"score_batch (arrays)       {batch_s:8.3f} s  ({scalar_s / batch_s:,.0f}x)")
+    print(f"get_cwv_summaries (dicts)  {summaries_s:8.3f} s  ({scalar_s / summaries_s:,.1f}x)")
+    print(f"mismatches                 {mismatches} summaries, {score_mismatches} scores")
+
+    if mismatches or score_mismatches:
+        raise SystemExit(1)
+
+
+if __name__ == '__main__':
+    main()
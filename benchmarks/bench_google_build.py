@@ -0,0 +1,37 @@
+"""
+Cold vs warm cost of building Google API service objects
+
+    python -m benchmarks.bench_google_build
+"""
+import time
+from google.oauth2.credentials import Credentials
+from googleapiclient.discovery import build
+from utils.google_api import GoogleAPIClient
+
+APIS = [('analyticsdata', 'v1beta'), ('searchconsole', 'v1')]
+
+
+def timeit(fn, runs):
+    started = time.perf_counter()
+    for _ in range(runs):
+        fn()
+    return (time.perf_counter() - started) / runs * 1000
+
+
+def main(runs=20):
+    credentials = Credentials(token='benchmark-token')
+
+    for api, version in APIS:
+        # What every report did before: build() from scratch per call
+        cold = timeit(lambda: build(api, version, credentials=credentials, static_discovery=True), runs)
+        first = timeit(lambda: GoogleAPIClient.build_service(api, version, credentials, object()), 1)
+        warm = timeit(lambda: GoogleAPIClient.build_service(api, version, credentials, 'bench-user'), runs * 50)
+
+        print(f"{api} {version}:")
+        print(f"  build() per call      {cold:8.2f} ms")
+        print(f"  cached doc, new user  {first:8.2f} ms")
+        print(f"  cached service        {warm:8.4f} ms")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,93 @@
+"""
+Cold-start import budget for the web app
+
+Imports app in fresh interpreters under `python -X importtime`, reports the
+median cumulative import time and the most expensive modules, and fails
+(exit 1) if the median is over budget or any module that should load lazily
+(Stripe, Supabase, Google client libraries, ReportLab, NumPy, ...) is imported
+at cold start. Budget and lazy-module list live in import_budget.json.
+
+    python -m benchmarks.bench_import_time [--runs 5] [--budget-ms 600] [--top 15]
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+BUDGET_PATH = os.path.join(os.path.dirname(__file__), 'import_budget.json')
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def load_budget():
+    with open(BUDGET_PATH) as f:
+        return json.load(f)
+
+
+def parse_importtime(stderr):
+    """{module: (self_us, cumulative_us)} from -X importtime output"""
+    modules = {}
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|')
+        modules[name.strip()] = (int(self_us), int(cumulative_us))
+    return modules
+
+
+def profile(module):
+    # A fresh interpreter each time: this is what a cold start pays
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', f"import {module}"],
+        cwd=ROOT,
+        env={**os.environ, 'PYTHONPATH': ROOT, 'PYTHONDONTWRITEBYTECODE': '1'},
+        capture_output=True,
+        text=True
+    )
+    if result.returncode != 0:
+        raise SystemExit(f"import {module} failed:\n{result.stderr[-2000:]}")
+    return parse_importtime(result.stderr)
+
+
+def main():
+    budget = load_budget()
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--budget-ms', type=float, default=budget['max_ms'])
+    parser.add_argument('--top', type=int, default=15)
+    args = parser.parse_args()
+
+    module = budget['module']
+    profile(module)  # warm the bytecode and OS file caches
+    runs = [profile(module) for _ in range(args.runs)]
+    totals_ms = [run[module][1] / 1000 for run in runs]
+    median_ms = statistics.median(totals_ms)
+
+    last = runs[-1]
+    top_level = [name for name in last if '.' not in name]
+    print(f"import {module}: median {median_ms:.0f} ms over {args.runs} runs "
+          f"(min {min(totals_ms):.0f}, max {max(totals_ms):.0f}), budget {args.budget_ms:.0f} ms")
+    print(f"{'package':<32}{'cumulative ms':>14}")
+    for name in sorted(top_level, key=lambda name: -last[name][1])[:args.top]:
+        print(f"{name:<32}{last[name][1] / 1000:>14.1f}")
+
+    eager = sorted(
+        lazy for lazy in budget['lazy_modules']
+        if any(name == lazy or name.startswith(lazy + '.') for name in last)
+    )
+
+    failed = False
+    if eager:
+        print(f"FAIL: imported at cold start but should load on first use: {', '.join(eager)}")
+        failed = True
+    if median_ms > args.budget_ms:
+        print(f"FAIL: median {median_ms:.0f} ms is over the {args.budget_ms:.0f} ms budget")
+        failed = True
+    if failed:
+        raise SystemExit(1)
+    print('OK')
+
+
+if __name__ == '__main__':
+    main()
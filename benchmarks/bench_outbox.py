@@ -0,0 +1,109 @@
+"""
+Email outbox: request-path cost and drain throughput with a fake provider
+
+Compares a synchronous provider call per email with an outbox enqueue, then
+drains the queue in batches and one at a time, and checks retries, dead
+letters, lost batch responses, inline sends and idempotency along the way.
+
+    python -m benchmarks.bench_outbox [--emails 500] [--latency-ms 80]
+"""
+import argparse
+import os
+import tempfile
+import time
+
+from benchmarks.fakes import FakeEmailProvider
+from utils import outbox as outbox_module
+from utils.outbox import Outbox
+
+
+def message(i):
+    return {'from': 'ReportRiser <auth@reportriser.com>', 'to': [f"user{i}@example.com"],
+            'subject': 'Your ReportRiser Login Link', 'html': '<p>link</p>' * 40}
+
+
+def fresh_outbox(directory, name, provider):
+    return Outbox(path=os.path.join(directory, f"{name}.db"), provider=provider, poll_interval=0)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--emails', type=int, default=500)
+    parser.add_argument('--latency-ms', type=float, default=80)
+    args = parser.parse_args()
+    latency = args.latency_ms / 1000
+
+    with tempfile.TemporaryDirectory() as directory:
+        provider = FakeEmailProvider(latency=latency)
+        sample = min(args.emails, 50)
+        started = time.perf_counter()
+        for i in range(sample):
+            provider.send(message(i), f"sync-{i}")
+        sync_ms = (time.perf_counter() - started) / sample * 1000
+
+        batched = fresh_outbox(directory, 'batched', FakeEmailProvider(latency=latency))
+        started = time.perf_counter()
+        for i in range(args.emails):
+            batched.enqueue(message(i), idempotency_key=f"login-{i}")
+        enqueue_ms = (time.perf_counter() - started) / args.emails * 1000
+
+        # Enqueueing the same keys again must not add messages
+        for i in range(args.emails):
+            batched.enqueue(message(i), idempotency_key=f"login-{i}")
+
+        started = time.perf_counter()
+        batched.drain()
+        batch_s = time.perf_counter() - started
+
+        outbox_module.OUTBOX_BATCH_SIZE, batch_size = 1, outbox_module.OUTBOX_BATCH_SIZE
+        single = fresh_outbox(directory, 'single', FakeEmailProvider(latency=latency))
+        for i in range(sample):
+            single.enqueue(message(i))
+        started = time.perf_counter()
+        single.drain()
+        single_s = (time.perf_counter() - started) / sample * args.emails
+        outbox_module.OUTBOX_BATCH_SIZE = batch_size
+
+        # Two transient failures, then success; one recipient rejected permanently
+        outbox_module.OUTBOX_BACKOFF_BASE = 0
+        flaky_provider = FakeEmailProvider(fail_calls=2, rejects={'user3@example.com'})
+        flaky = fresh_outbox(directory, 'flaky', flaky_provider)
+        for i in range(10):
+            flaky.enqueue(message(i))
+        for _ in range(4):
+            flaky.drain()
+
+        # The first batch is delivered but its response is lost: the retry must replay
+        # the same batch under the same key, not deliver anything twice
+        lossy = fresh_outbox(directory, 'lossy', FakeEmailProvider(lose_responses=1))
+        for i in range(10):
+            lossy.enqueue(message(i))
+        for _ in range(3):
+            lossy.drain()
+        lossy_keys = {call['idempotency_key'] for call in lossy.provider.calls}
+
+        # A message sent inline (the login path) is not sent again by the sender
+        inline = fresh_outbox(directory, 'inline', FakeEmailProvider())
+        inline.send_now(inline.enqueue(message(0), idempotency_key='login-inline'))
+        inline.drain()
+
+        print(f"{args.emails} emails, provider latency {args.latency_ms:.0f} ms")
+        print(f"request path: synchronous send {sync_ms:7.2f} ms/email, outbox enqueue {enqueue_ms:5.2f} ms/email")
+        print(f"drain: batched {batch_s:6.2f} s ({len(batched.provider.calls)} calls), "
+              f"one per call ~{single_s:6.2f} s (extrapolated)")
+        print(f"batched outbox: {batched.stats()}, delivered {len(batched.provider.sent)}")
+        print(f"flaky provider: {flaky.stats()}, dead letters {[d['to'] for d in flaky.dead_letters()]}")
+        print(f"lost response: {len(lossy.provider.calls)} calls under {len(lossy_keys)} key(s), "
+              f"delivered {len(lossy.provider.sent)}, {lossy.stats()}")
+        print(f"inline send: {len(inline.provider.calls)} call(s), {inline.stats()}")
+
+        if len(batched.provider.sent) != args.emails or flaky.stats()['dead'] != 1 or flaky.stats()['sent'] != 9:
+            raise SystemExit(1)
+        if len(lossy.provider.sent) != 10 or len(lossy_keys) != 1 or lossy.stats()['sent'] != 10:
+            raise SystemExit(1)
+        if len(inline.provider.calls) != 1 or inline.stats()['sent'] != 1:
+            raise SystemExit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,65 @@
+"""
+Per-report CPU time and allocations of generate_pdf with a cold vs shared ReportTemplate
+
+    python -m benchmarks.bench_report_template
+"""
+import time
+import tracemalloc
+from utils.cwv import CWVAnalyzer
+from utils.roi_calculator import ROICalculator
+from utils.report_generator import ReportGenerator, ReportTemplate
+
+
+def report_args():
+    analytics_data = ReportGenerator.get_mock_analytics()
+    conversions_data = ROICalculator.get_mock_conversions()
+    return (
+        'example.com',
+        analytics_data,
+        ReportGenerator.get_mock_search_data(),
+        CWVAnalyzer.get_cwv_summary(CWVAnalyzer.get_mock_cwv()),
+        ROICalculator.get_roi_summary(analytics_data['total_users'], conversions_data['conversions'], 100),
+        conversions_data,
+        'free'
+    )
+
+
+def measure(args, runs, cold):
+    # cold=True rebuilds the template every report, like the old per-call styles
+    cpu = 0.0
+    allocated = 0
+    for _ in range(runs):
+        if cold:
+            ReportTemplate._instance = None
+        tracemalloc.start()
+        started = time.process_time()
+        ReportGenerator.generate_pdf(*args)
+        cpu += time.process_time() - started
+        snapshot = tracemalloc.take_snapshot()
+        tracemalloc.stop()
+        allocated += sum(stat.size for stat in snapshot.statistics('filename'))
+    return cpu / runs * 1000, allocated / runs / 1024
+
+
+def measure_template(runs):
+    started = time.process_time()
+    for _ in range(runs):
+        ReportTemplate()
+    return (time.process_time() - started) / runs * 1000
+
+
+def main(runs=50):
+    args = report_args()
+    ReportGenerator.generate_pdf(*args)  # warm imports and font caches
+
+    cold_cpu, cold_kib = measure(args, runs, cold=True)
+    warm_cpu, warm_kib = measure(args, runs, cold=False)
+
+    print(f"template construction   {measure_template(runs):7.2f} ms")
+    print(f"cold template / report  {cold_cpu:7.2f} ms CPU  {cold_kib:8.1f} KiB live")
+    print(f"shared template/report  {warm_cpu:7.2f} ms CPU  {warm_kib:8.1f} KiB live")
+    print(f"saved per report        {cold_cpu - warm_cpu:7.2f} ms CPU  {cold_kib - warm_kib:8.1f} KiB")
+
+
+if __name__ == '__main__':
+    main()
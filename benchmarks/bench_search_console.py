@@ -0,0 +1,69 @@
+"""
+Time and peak memory of Search Console aggregation on a synthetic property
+
+Compares streaming the paginated rows through SearchAggregator with
+materialising every row first and aggregating afterwards.
+
+    python -m benchmarks.bench_search_console [--rows 1000000]
+"""
+import argparse
+import time
+import tracemalloc
+from collections import defaultdict
+
+from benchmarks.fakes import FakeSearchConsole
+from utils.search_console import SearchAggregator, iter_search_rows
+
+
+def streaming(service, rows):
+    return SearchAggregator().consume(iter_search_rows(service, 'sc-domain:example.com', {}, max_rows=rows)).summary()
+
+
+def materialised(service, rows):
+    all_rows = list(iter_search_rows(service, 'sc-domain:example.com', {}, max_rows=rows))
+    queries = defaultdict(lambda: [0, 0])
+    pages = defaultdict(lambda: [0, 0])
+    for row in all_rows:
+        queries[row['keys'][0]][0] += row['clicks']
+        pages[row['keys'][1]][0] += row['clicks']
+    return sorted(queries.items(), key=lambda item: -item[1][0])[:5], sorted(pages.items(), key=lambda item: -item[1][0])[:10]
+
+
+def generate_only(service, rows):
+    for _ in iter_search_rows(service, 'sc-domain:example.com', {}, max_rows=rows):
+        pass
+
+
+def measure(fn, rows):
+    """Wall time (untraced run) and peak traced memory (second run) of fn"""
+    service = FakeSearchConsole(rows)
+    started = time.perf_counter()
+    result = fn(service, rows)
+    elapsed = time.perf_counter() - started
+
+    tracemalloc.start()
+    fn(FakeSearchConsole(rows), rows)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return result, elapsed, peak / 1024 / 1024, service.calls
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--rows', type=int, default=1000000)
+    args = parser.parse_args()
+
+    _, gen_s, gen_mib, _ = measure(generate_only, args.rows)
+    summary, stream_s, stream_mib, calls = measure(streaming, args.rows)
+    _, full_s, full_mib, _ = measure(materialised, args.rows)
+
+    # Synthetic row generation is included in every line; the first line is that cost alone
+    print(f"rows {summary['totals']['rows']:,} in {calls} pages; {summary['totals']['queries']:,} queries, {summary['totals']['pages']:,} pages")
+    print(f"generate only {gen_s:7.2f} s  peak {gen_mib:8.1f} MiB")
+    print(f"streaming     {stream_s:7.2f} s  peak {stream_mib:8.1f} MiB  (aggregation {(args.rows / max(stream_s - gen_s, 1e-9)):,.0f} rows/s)")
+    print(f"materialised  {full_s:7.2f} s  peak {full_mib:8.1f} MiB")
+    print(f"top keyword   {summary['top_keywords'][0]['keyword']} ({summary['top_keywords'][0]['clicks']:,} clicks)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,101 @@
+"""
+Site crawl throughput against a local HTTP server
+
+Serves robots.txt -> sitemap index -> plain + gzipped sitemaps -> N pages
+(with a fixed per-request latency so concurrency matters) and reports
+pages/sec for several concurrency limits.
+
+    python -m benchmarks.bench_site_crawler [--pages 400] [--latency-ms 20]
+"""
+import argparse
+import gzip
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from utils.site_crawler import crawl_site
+
+
+def make_site(base, pages):
+    urls = [f"{base}/page-{i}" for i in range(pages)]
+    half = len(urls) // 2
+
+    def urlset(chunk):
+        entries = ''.join(f"<url><loc>{url}</loc></url>" for url in chunk)
+        return f'<?xml version="1.0"?><urlset xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">{entries}</urlset>'.encode()
+
+    files = {
+        '/robots.txt': (b"User-agent: *\nDisallow: /private\nSitemap: " + f"{base}/sitemap_index.xml".encode(), 'text/plain'),
+        '/sitemap_index.xml': (
+            f'<?xml version="1.0"?><sitemapindex xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">'
+            f'<sitemap><loc>{base}/sitemap-1.xml</loc></sitemap>'
+            f'<sitemap><loc>{base}/sitemap-2.xml.gz</loc></sitemap></sitemapindex>'.encode(),
+            'application/xml'
+        ),
+        '/sitemap-1.xml': (urlset(urls[:half] + [f"{base}/private/hidden"]), 'application/xml'),
+        '/sitemap-2.xml.gz': (gzip.compress(urlset(urls[half:])), 'application/gzip')
+    }
+
+    for i in range(pages):
+        title = 'A well sized page title for testing' if i % 3 else 'Short'
+        images = ''.join(
+            f'<img src="/{n}.png" alt="x">' if (i + n) % 4 else f'<img src="/{n}.png">' for n in range(8)
+        )
+        body = (
+            f"<html><head><title>{title}</title>"
+            f"<meta name='description' content='{'d' * (140 if i % 5 else 20)}'></head>"
+            f"<body>{'<h1>Heading</h1>' * (1 if i % 7 else 2)}{images}<p>{'lorem ipsum ' * 400}</p></body></html>"
+        )
+        files[f"/page-{i}"] = (body.encode(), 'text/html; charset=utf-8')
+
+    return files
+
+
+def serve(pages, latency):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def do_GET(self):
+            time.sleep(latency)
+            body, content_type = self.server.files.get(self.path, (b'not found', 'text/plain'))
+            self.send_response(200 if self.path in self.server.files else 404)
+            self.send_header('Content-Type', content_type)
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    server.daemon_threads = True
+    server.files = make_site(f"http://127.0.0.1:{server.server_port}", pages)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--pages', type=int, default=400)
+    parser.add_argument('--latency-ms', type=float, default=20)
+    args = parser.parse_args()
+
+    server = serve(args.pages, args.latency_ms / 1000)
+    site = f"http://127.0.0.1:{server.server_port}/"
+
+    try:
+        for concurrency in (1, 4, 16):
+            result = crawl_site(site, max_pages=args.pages, concurrency=concurrency, host_delay=0)
+            print(f"concurrency {concurrency:3d}: {result['pages_audited']:4d} pages in {result['crawl_seconds']:6.2f} s "
+                  f"= {result['pages_per_second']:7.1f} pages/s (discovery {result['discovery_seconds']:.2f} s)")
+
+        polite = crawl_site(site, max_pages=50, concurrency=16, host_delay=0.05)
+        print(f"host delay 50 ms: {polite['pages_per_second']:.1f} pages/s (capped near 20/s)")
+        print(f"aggregates: {result['aggregates']}")
+        print(f"worst page: {result['worst_pages'][0]['url']} {result['worst_pages'][0]['issues']}")
+    finally:
+        server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
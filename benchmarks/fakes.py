@@ -0,0 +1,558 @@
+"""
+Offline stand-ins for external services
+
+In-process fakes for the Supabase client, Stripe, the Google Analytics and
+Search Console APIs and the email provider, plus FakeServices: a local HTTP
+server answering PageSpeed Insights (multi-MB Lighthouse JSON), site pages
+and the Resend API, so the real HTTP client code runs against them.
+
+    from benchmarks.fakes import recorded_ga4_report
+    analytics_data, conversions_data = recorded_ga4_report().fetch()
+"""
+import base64
+import json
+import os
+import random
+import threading
+import time
+import uuid
+from datetime import date, datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from types import SimpleNamespace
+from urllib.parse import parse_qs, urlsplit
+
+FIXTURES = os.path.join(os.path.dirname(__file__), 'fixtures')
+
+
+def load_fixture(name):
+    with open(os.path.join(FIXTURES, name)) as f:
+        return json.load(f)
+
+
+class _Call:
+    """What googleapiclient request objects look like to callers: .execute()"""
+
+    def __init__(self, result):
+        self.result = result
+
+    def execute(self):
+        return self.result
+
+
+class RecordedGA4DataService:
+    """analyticsdata v1beta replaying fixtures/ga4_batch_run_reports.json"""
+
+    def __init__(self, fixture='ga4_batch_run_reports.json'):
+        self.response = load_fixture(fixture)
+        self.calls = []
+
+    def properties(self):
+        return self
+
+    def batchRunReports(self, property, body):
+        """The recorded response, or daily rows when the requests ask for ISO date ranges (warehouse sync)"""
+        self.calls.append({'property': property, 'body': body})
+        if 'daysAgo' in body['requests'][0]['dateRanges'][0]['startDate']:
+            return _Call(self.response)
+        return _Call({'reports': [self._daily(request) for request in body['requests']]})
+
+    def _daily(self, request):
+        """Daily rows for the requested range, cycling through the recorded daily users"""
+        recorded = [int(row['metricValues'][0]['value']) for row in self.response['reports'][0]['rows']]
+        date_range = request['dateRanges'][0]
+        day, end = date.fromisoformat(date_range['startDate']), date.fromisoformat(date_range['endDate'])
+
+        rows = []
+        while day <= end:
+            users = recorded[day.toordinal() % len(recorded)]
+            rows.append({
+                'dimensionValues': [{'value': day.strftime('%Y%m%d')}],
+                'metricValues': [{'value': str(users)}, {'value': str(users // 30)}, {'value': f"{users * 2.5:.2f}"}]
+            })
+            day += timedelta(days=1)
+        return {'rows': rows, 'rowCount': len(rows)}
+
+
+class RecordedGA4AdminService:
+    """analyticsadmin v1beta replaying fixtures/ga4_admin.json"""
+
+    def __init__(self, fixture='ga4_admin.json'):
+        self.recorded = load_fixture(fixture)
+        self.calls = 0
+
+    def accountSummaries(self):
+        return self
+
+    def properties(self):
+        return self
+
+    def dataStreams(self):
+        return self
+
+    def list(self, pageSize=None, parent=None, **kwargs):
+        self.calls += 1
+        if parent is None:
+            return _Call({'accountSummaries': self.recorded['accountSummaries']})
+        return _Call({'dataStreams': self.recorded['dataStreams'].get(parent, [])})
+
+    def list_next(self, previous_request, previous_response):
+        return None
+
+
+def recorded_ga4_report(site_url='https://example.com', cache_key='recorded', warehouse=None):
+    """A GA4Report wired to the recorded services"""
+    from utils.ga4 import GA4Report
+
+    return GA4Report(RecordedGA4DataService(), RecordedGA4AdminService(), cache_key, site_url, warehouse=warehouse)
+
+
+class FakeEmailProvider:
+    """Outbox provider that records messages instead of sending them.
+
+    latency is added to every call; fail_calls makes that many calls raise
+    before the provider starts succeeding, lose_responses makes that many
+    calls deliver and then raise (the response was lost), and rejects lists
+    recipients that fail permanently.
+    """
+
+    def __init__(self, latency=0.0, fail_calls=0, rejects=(), lose_responses=0):
+        self.latency = latency
+        self.fail_calls = fail_calls
+        self.lose_responses = lose_responses
+        self.rejects = set(rejects)
+        self.sent = []
+        self.calls = []
+        self.keys = set()
+
+    def _call(self, kind, messages, idempotency_key):
+        from utils.outbox import PermanentSendError
+
+        time.sleep(self.latency)
+        self.calls.append({'kind': kind, 'messages': len(messages), 'idempotency_key': idempotency_key})
+        if self.fail_calls > 0:
+            self.fail_calls -= 1
+            raise RuntimeError('503 provider unavailable')
+        if any(to in self.rejects for message in messages for to in message['to']):
+            raise PermanentSendError('422 invalid recipient')
+
+        # A replayed idempotency key is acknowledged without delivering again
+        if idempotency_key not in self.keys:
+            self.keys.add(idempotency_key)
+            self.sent.extend(messages)
+        if self.lose_responses > 0:
+            self.lose_responses -= 1
+            raise RuntimeError('connection reset after delivery')
+        return [f"fake-{len(self.calls)}-{i}" for i in range(len(messages))]
+
+    def send(self, message, idempotency_key):
+        return self._call('single', [message], idempotency_key)[0]
+
+    def send_batch(self, messages, idempotency_key):
+        return self._call('batch', messages, idempotency_key)
+
+
+class FakeSearchConsole:
+    """Stands in for service.searchanalytics().query(...).execute() over a fixed row set"""
+
+    def __init__(self, total_rows, queries=200000, pages=20000, seed=1):
+        self.total_rows = total_rows
+        self.queries = queries
+        self.pages = pages
+        self.seed = seed
+        self.calls = 0
+
+    def searchanalytics(self):
+        return self
+
+    def query(self, siteUrl, body):
+        self._body = body
+        return self
+
+    def execute(self):
+        self.calls += 1
+        start, limit = self._body['startRow'], self._body['rowLimit']
+        rng = random.Random(self.seed + start)
+        rows = []
+        for _ in range(start, min(start + limit, self.total_rows)):
+            # Zipf-ish: a few head terms carry most of the clicks
+            q = int(self.queries ** rng.random()) - 1
+            p = int(self.pages ** rng.random()) - 1
+            impressions = rng.randint(1, 500)
+            clicks = rng.randint(0, impressions // 5)
+            rows.append({
+                'keys': [f"query {q}", f"https://example.com/page-{p}"],
+                'clicks': clicks,
+                'impressions': impressions,
+                'ctr': clicks / impressions,
+                'position': rng.uniform(1, 60)
+            })
+        return {'rows': rows}
+
+
+class _Result:
+    """What postgrest's execute() returns: .data rows and an optional .count"""
+
+    def __init__(self, data, count=None):
+        self.data = data
+        self.count = count
+
+
+class FakeQuery:
+    """The subset of the postgrest query builder utils.repository uses"""
+
+    def __init__(self, client, table):
+        self.client = client
+        self.table = table
+        self.operation = 'select'
+        self.columns = None
+        self.count = None
+        self.filters = []
+        self.order_by = None
+        self.row_limit = None
+        self.row_offset = 0
+        self.payload = None
+        self.on_conflict = None
+
+    def select(self, *columns, count=None):
+        self.columns = columns if columns and columns != ('*',) else None
+        self.count = count
+        return self
+
+    def eq(self, column, value):
+        self.filters.append(lambda row: row.get(column) == value)
+        return self
+
+    def lte(self, column, value):
+        self.filters.append(lambda row: row.get(column) is not None and row.get(column) <= value)
+        return self
+
+    def lt(self, column, value):
+        self.filters.append(lambda row: row.get(column) is not None and row.get(column) < value)
+        return self
+
+    def in_(self, column, values):
+        values = set(values)
+        self.filters.append(lambda row: row.get(column) in values)
+        return self
+
+    def order(self, column, desc=False):
+        self.order_by = (column, desc)
+        return self
+
+    def limit(self, count):
+        self.row_limit = count
+        return self
+
+    def range(self, start, end):
+        self.row_offset, self.row_limit = start, end - start + 1
+        return self
+
+    def insert(self, rows):
+        self.operation, self.payload = 'insert', rows
+        return self
+
+    def upsert(self, rows, on_conflict=None):
+        self.operation, self.payload, self.on_conflict = 'upsert', rows, on_conflict
+        return self
+
+    def update(self, fields):
+        self.operation, self.payload = 'update', fields
+        return self
+
+    def delete(self):
+        self.operation = 'delete'
+        return self
+
+    def _project(self, row):
+        return {column: row.get(column) for column in self.columns} if self.columns else dict(row)
+
+    def execute(self):
+        return self.client.execute(self)
+
+
+class FakeRpc:
+    """A postgrest rpc() call; FakeSupabase runs the matching _rpc_<name> method"""
+
+    def __init__(self, client, name, params):
+        self.client = client
+        self.table = name
+        self.params = params
+
+    def execute(self):
+        return self.client.call(self.table, self.params)
+
+
+class FakeSupabase:
+    """Supabase client over in-memory tables; every execute() costs `latency` seconds like a round trip.
+
+    Like PostgREST, a select returns at most max_rows rows.
+    """
+
+    def __init__(self, tables=None, latency=0.0, keys=None, max_rows=1000):
+        self.tables = {name: [dict(row) for row in rows] for name, rows in (tables or {}).items()}
+        self.latency = latency
+        self.max_rows = max_rows
+        self.keys = {'google_tokens': 'user_id', **(keys or {})}
+        self.queries = 0
+        self._lock = threading.Lock()
+
+    def table(self, name):
+        return FakeQuery(self, name)
+
+    def rpc(self, name, params):
+        return FakeRpc(self, name, params)
+
+    def call(self, name, params):
+        time.sleep(self.latency)
+        with self._lock:
+            self.queries += 1
+            return _Result([{'reservation_id': r} for r in getattr(self, f"_rpc_{name}")(**params)])
+
+    # The functions of supabase/migrations/20261017090000_report_quota.sql, run under self._lock
+
+    def _rpc_refund_report_quota(self, p_reservation_id, p_status='refunded'):
+        reservation = next((r for r in self.tables.get('report_reservations', [])
+                            if r['id'] == p_reservation_id and r['status'] == 'reserved'), None)
+        if reservation is None:
+            return []
+        reservation['status'] = p_status
+        for user in self.tables.get('users', []):
+            if user['id'] == reservation['user_id'] and user.get('reports_period') == reservation['period']:
+                user['reports_used'] = max(user['reports_used'] - reservation['units'], 0)
+        return [p_reservation_id]
+
+    def _rpc_reserve_report_quota(self, p_user_id, p_period, p_limit, p_units=1, p_ttl_seconds=3600):
+        user = next((u for u in self.tables.get('users', []) if u['id'] == p_user_id), None)
+        if user is None:
+            return []
+        if user.get('reports_period') != p_period:
+            user.update(reports_used=0, reports_period=p_period)
+        reservations = self.tables.setdefault('report_reservations', [])
+        for stale in [r['id'] for r in reservations if r['user_id'] == p_user_id and r['status'] == 'reserved'
+                      and r['created_at'] < time.time() - p_ttl_seconds]:
+            self._rpc_refund_report_quota(stale, 'expired')
+        if (user.get('reports_used') or 0) + p_units > p_limit:
+            return []
+        user['reports_used'] = (user.get('reports_used') or 0) + p_units
+        reservation_id = uuid.uuid4().hex
+        reservations.append({'id': reservation_id, 'user_id': p_user_id, 'period': p_period,
+                             'units': p_units, 'status': 'reserved', 'created_at': time.time()})
+        return [reservation_id]
+
+    def _rpc_expire_report_quota(self, p_ttl_seconds=3600):
+        return [reservation_id
+                for r in list(self.tables.get('report_reservations', []))
+                if r['status'] == 'reserved' and r['created_at'] < time.time() - p_ttl_seconds
+                for reservation_id in self._rpc_refund_report_quota(r['id'], 'expired')]
+
+    def execute(self, query):
+        time.sleep(self.latency)
+        with self._lock:
+            self.queries += 1
+            rows = self.tables.setdefault(query.table, [])
+            matched = [row for row in rows if all(f(row) for f in query.filters)]
+
+            if query.operation in ('insert', 'upsert'):
+                key = query.on_conflict.split(',') if query.on_conflict else [self.keys.get(query.table, 'id')]
+                written = []
+                for new in (query.payload if isinstance(query.payload, list) else [query.payload]):
+                    existing = next((row for row in rows
+                                     if all(k in new and row.get(k) == new[k] for k in key)), None)
+                    if existing is not None and query.operation == 'upsert':
+                        existing.update(new)
+                        written.append(dict(existing))
+                        continue
+                    row = {'id': uuid.uuid4().hex, 'created_at': datetime.now().isoformat(), **new}
+                    rows.append(row)
+                    written.append(dict(row))
+                return _Result(written)
+
+            if query.operation == 'update':
+                for row in matched:
+                    row.update(query.payload)
+                return _Result([dict(row) for row in matched])
+
+            if query.operation == 'delete':
+                self.tables[query.table] = [row for row in rows if row not in matched]
+                return _Result([dict(row) for row in matched])
+
+            if query.order_by:
+                column, desc = query.order_by
+                matched.sort(key=lambda row: row.get(column) or '', reverse=desc)
+            total = len(matched)
+            limit = min(query.row_limit or self.max_rows, self.max_rows)
+            matched = matched[query.row_offset:query.row_offset + limit]
+            return _Result([query._project(row) for row in matched], total if query.count else None)
+
+
+class FakeStripe:
+    """The parts of the stripe module app.py uses. Webhook signatures are valid when equal to `secret`"""
+
+    class SignatureVerificationError(Exception):
+        pass
+
+    def __init__(self, price_id='price_premium', secret='whsec_bench'):
+        self.api_key = None
+        self.secret = secret
+        self.sessions = []
+        self.error = SimpleNamespace(SignatureVerificationError=FakeStripe.SignatureVerificationError)
+        self.checkout = SimpleNamespace(Session=SimpleNamespace(create=self._create_session))
+        self.Webhook = SimpleNamespace(construct_event=self._construct_event)
+        self.Subscription = SimpleNamespace(retrieve=lambda subscription_id: {
+            'id': subscription_id, 'items': {'data': [{'price': {'id': price_id}}]}
+        })
+
+    def _create_session(self, **params):
+        self.sessions.append(params)
+        return SimpleNamespace(id=f"cs_{len(self.sessions)}", url=f"https://checkout.stripe.test/cs_{len(self.sessions)}")
+
+    def _construct_event(self, payload, sig_header, secret):
+        if sig_header != self.secret:
+            raise FakeStripe.SignatureVerificationError('bad signature')
+        return json.loads(payload)
+
+
+def lighthouse_response(url, size_mb=3.0, seed=0):
+    """A PSI v5 response shaped like a real one, padded to about size_mb by screenshots and audit details"""
+    rng = random.Random(seed)
+
+    def screenshot(size):
+        return 'data:image/jpeg;base64,' + base64.b64encode(rng.randbytes(size)).decode('ascii')
+
+    audits = {
+        'largest-contentful-paint': {'id': 'largest-contentful-paint', 'score': 0.6, 'numericValue': 2834.5, 'displayValue': '2.8 s'},
+        'max-potential-fid': {'id': 'max-potential-fid', 'score': 0.8, 'numericValue': 132.0, 'displayValue': '130 ms'},
+        'cumulative-layout-shift': {'id': 'cumulative-layout-shift', 'score': 0.9, 'numericValue': 0.084, 'displayValue': '0.084'},
+        'screenshot-thumbnails': {'id': 'screenshot-thumbnails', 'details': {
+            'type': 'filmstrip',
+            'items': [{'timing': 300 * i, 'data': screenshot(12000)} for i in range(1, 11)]
+        }},
+        'final-screenshot': {'id': 'final-screenshot', 'details': {'type': 'screenshot', 'data': screenshot(60000)}}
+    }
+    # Opportunity/diagnostic audits with per-resource tables, as PSI returns for a typical page
+    for i in range(120):
+        audits[f"audit-{i}"] = {
+            'id': f"audit-{i}",
+            'title': f"Diagnostic {i}",
+            'description': 'Lorem ipsum dolor sit amet. [Learn more](https://web.dev/).',
+            'score': round(rng.random(), 2),
+            'details': {'type': 'table', 'items': [
+                {'url': f"{url}/static/asset-{i}-{j}.js", 'totalBytes': rng.randint(1000, 500000),
+                 'wastedBytes': rng.randint(0, 100000), 'wastedMs': rng.random() * 500}
+                for j in range(12)
+            ]}
+        }
+
+    response = {
+        'id': url,
+        'loadingExperience': {'id': url, 'overall_category': 'AVERAGE', 'metrics': {
+            'LARGEST_CONTENTFUL_PAINT_MS': {'percentile': 2800, 'category': 'AVERAGE'},
+            'CUMULATIVE_LAYOUT_SHIFT_SCORE': {'percentile': 8, 'category': 'FAST'}
+        }},
+        'lighthouseResult': {
+            'requestedUrl': url,
+            'finalUrl': url,
+            'lighthouseVersion': '12.0.0',
+            'audits': audits,
+            'categories': {
+                'performance': {'id': 'performance', 'score': 0.72},
+                'accessibility': {'id': 'accessibility', 'score': 0.91},
+                'best-practices': {'id': 'best-practices', 'score': 0.96},
+                'seo': {'id': 'seo', 'score': 0.88}
+            }
+        }
+    }
+    body = json.dumps(response)
+    # The full-page screenshot is most of a real response's size
+    padding = max(int(size_mb * 1024 * 1024) - len(body), 0) * 3 // 4
+    response['lighthouseResult']['fullPageScreenshot'] = {
+        'screenshot': {'data': screenshot(padding), 'width': 412, 'height': 8000}
+    }
+    return json.dumps(response).encode()
+
+
+def site_page(path, images=40):
+    """An HTML page large enough (~100 KB) that /audit's streaming parser does real work"""
+    name = path.strip('/') or 'index'
+    tags = ''.join(
+        f'<img src="/img/{name}-{n}.png" alt="x">' if n % 5 else f'<img src="/img/{name}-{n}.png">' for n in range(images)
+    )
+    body = ''.join(f"<p>{'Lorem ipsum dolor sit amet, consectetur adipiscing elit. ' * 12}</p>" for _ in range(120))
+    return (
+        f"<!DOCTYPE html><html><head><title>Benchmark page {path} with a reasonable title</title>"
+        f"<meta name='description' content='{'A description of the benchmark page. ' * 4}'>"
+        f"<script>{'var x = 1;' * 2000}</script></head><body><h1>Benchmark</h1>{tags}{body}</body></html>"
+    ).encode()
+
+
+class FakeServices:
+    """Local HTTP server for PageSpeed Insights, site pages and the Resend API.
+
+    Point utils.cwv.PSI_ENDPOINT at psi_endpoint and ResendProvider at url;
+    any other GET path is served as an HTML page. latency is added to every
+    request.
+    """
+
+    def __init__(self, psi_mb=3.0, latency=0.0):
+        self.psi_body = lighthouse_response('https://example.com', psi_mb)
+        self.latency = latency
+        self.emails = []
+        self.requests = 0
+        self._pages = {}
+        self._lock = threading.Lock()
+
+        services = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def _reply(self, status, body, content_type):
+                self.send_response(status)
+                self.send_header('Content-Type', content_type)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_GET(self):
+                services._hit()
+                path = urlsplit(self.path).path
+                if path.startswith('/pagespeedonline/'):
+                    if not parse_qs(urlsplit(self.path).query).get('url'):
+                        return self._reply(400, b'{"error": {"code": 400}}', 'application/json')
+                    return self._reply(200, services.psi_body, 'application/json')
+                self._reply(200, services.page(path), 'text/html; charset=utf-8')
+
+            def do_POST(self):
+                services._hit()
+                messages = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))))
+                batch = isinstance(messages, list)
+                with services._lock:
+                    ids = []
+                    for message in (messages if batch else [messages]):
+                        services.emails.append({'message': message, 'idempotency_key': self.headers.get('Idempotency-Key')})
+                        ids.append({'id': uuid.uuid4().hex})
+                self._reply(200, json.dumps({'data': ids} if batch else ids[0]).encode(), 'application/json')
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.server.daemon_threads = True
+        self.url = f"http://127.0.0.1:{self.server.server_port}"
+        self.psi_endpoint = f"{self.url}/pagespeedonline/v5/runPagespeed"
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def _hit(self):
+        with self._lock:
+            self.requests += 1
+        if self.latency:
+            time.sleep(self.latency)
+
+    def page(self, path):
+        if path not in self._pages:
+            self._pages[path] = site_page(path)
+        return self._pages[path]
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
@@ -0,0 +1,318 @@
+"""
+Offline benchmark suite for the app's hot paths
+
+Every external service is replaced by a fake from benchmarks.fakes: Supabase
+(in-process, with a per-query latency), PageSpeed Insights, site pages and
+Resend (a local HTTP server, so the real HTTP client runs), the recorded GA4
+responses, a synthetic Search Console property and Stripe. State (caches,
+locks, artifacts) lives in a throwaway directory.
+
+Results are written as JSON; given a baseline from an earlier run, any case
+whose median got slower by more than --tolerance fails the run (exit 1).
+
+    python -m benchmarks.suite --output bench.json
+    python -m benchmarks.suite --baseline bench.json --only dashboard_cold,generate_report
+"""
+import argparse
+import json
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+from benchmarks.fakes import FakeSearchConsole, FakeServices, FakeStripe, FakeSupabase, recorded_ga4_report
+
+USER_ID = 'bench-user'
+USER = {'id': USER_ID, 'email': 'bench@example.com', 'tier': 'premium', 'reports_used': 0,
+        'sites_used': 1, 'stripe_customer_id': 'cus_bench', 'stripe_subscription_id': 'sub_bench'}
+
+
+def isolate(directory):
+    """Point every cache, lock, job and artifact path at directory; must run before utils is imported"""
+    tempfile.tempdir = directory
+    os.environ.update({
+        'PSI_RATE_PER_SECOND': '100000',
+        'PSI_BURST': '100000',
+        'PSI_MAX_CONCURRENCY': '16',
+        'OUTBOX_POLL_INTERVAL': '0',
+        'QUERY_LOG': '0',
+        'STRIPE_WEBHOOK_SECRET': 'whsec_bench'
+    })
+    for name in ('OUTBOX_PATH', 'SCHEDULER_PATH', 'PSI_GOVERNOR_PATH', 'WAREHOUSE_PATH',
+                 'USER_CACHE_PATH', 'AUDIT_CACHE_PATH', 'GA4_PROPERTY_CACHE_PATH', 'ARTIFACT_DIR', 'JOB_RUNNER', 'LOCK_DIR'):
+        os.environ.pop(name, None)
+
+
+class Bench:
+    """Fakes wired into the app for one suite run"""
+
+    def __init__(self, db_latency, net_latency, psi_mb):
+        import app
+        from utils import cwv, repository
+        from utils.outbox import ResendProvider, outbox
+
+        self.services = FakeServices(psi_mb=psi_mb, latency=net_latency)
+        self.supabase = FakeSupabase({
+            'users': [USER],
+            'reports': [
+                {'id': f"r{i}", 'user_id': USER_ID, 'site_url': f"https://site-{i}.example.com",
+                 'traffic': 1000 + i, 'roi': 250.0 * i, 'created_at': f"2026-01-{i + 1:02d}T09:00:00"}
+                for i in range(25)
+            ]
+        }, latency=db_latency)
+        self.stripe = FakeStripe(price_id=app.PRICING['premium_monthly']['price_id'])
+
+        repository._client = self.supabase
+        cwv.PSI_ENDPOINT = self.services.psi_endpoint
+        app.get_stripe = lambda: self.stripe
+        outbox.provider = ResendProvider(api_key='re_bench', api_url=self.services.url)
+
+        self.app = app
+        self.client = app.app.test_client()
+        with self.client.session_transaction() as session:
+            session.update({'user_id': USER_ID, 'email': USER['email'], 'tier': USER['tier']})
+        self.counter = 0
+
+    def unique(self, prefix):
+        """A URL nothing has cached yet"""
+        self.counter += 1
+        return f"{self.services.url}/{prefix}-{self.counter}"
+
+    def close(self):
+        self.services.close()
+
+
+def timed(fn, repeat, warmup=1):
+    for _ in range(warmup):
+        fn()
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - started)
+    return samples
+
+
+def case_generate_pdf(bench, repeat):
+    from benchmarks.bench_report_template import report_args
+    from utils.report_generator import ReportGenerator
+
+    args = report_args()
+    return timed(lambda: ReportGenerator.generate_pdf(*args), repeat)
+
+
+def case_get_cwv_summary_x1000(bench, repeat):
+    from utils.cwv import CWVAnalyzer
+
+    data = CWVAnalyzer.get_mock_cwv()
+
+    def run():
+        for _ in range(1000):
+            CWVAnalyzer.get_cwv_summary(data)
+    return timed(run, repeat)
+
+
+def case_psi_fetch_parse(bench, repeat):
+    from utils.cwv import CWVAnalyzer
+
+    return timed(lambda: CWVAnalyzer.fetch_cwv_data(bench.unique('psi')), repeat)
+
+
+def case_audit(bench, repeat):
+    from utils import audit
+
+    return timed(lambda: audit.run_audit(bench.unique('audit')), repeat)
+
+
+def case_dashboard_cold(bench, repeat):
+    from utils import repository
+
+    def run():
+        repository.invalidate_user(USER_ID)
+        assert bench.client.get('/dashboard').status_code == 200
+    return timed(run, repeat)
+
+
+def case_dashboard_warm(bench, repeat):
+    return timed(lambda: bench.client.get('/dashboard').status_code, repeat)
+
+
+def case_generate_report(bench, repeat):
+    """POST /generate-report, poll the job until done, download the PDF"""
+    def run():
+        response = bench.client.post('/generate-report', data={'site_url': bench.unique('report'), 'avg_order_value': 120})
+        job_id = response.get_json()['job_id']
+        while True:
+            status = bench.client.get(f"/jobs/{job_id}").get_json()
+            if status['status'] in ('done', 'failed'):
+                break
+            time.sleep(0.005)
+        if status['status'] != 'done':
+            raise RuntimeError(f"report job failed: {status}")
+        assert bench.client.get(f"/download-report/{job_id}").status_code == 200
+    return timed(run, repeat)
+
+
+def case_report_google_data(bench, repeat):
+    """Report pipeline on the Google fakes: recorded GA4 batch, 50k Search Console rows, fake PSI"""
+    from utils.cwv import CWVAnalyzer
+    from utils.report_pipeline import collect_report_data, render_report
+    from utils.search_console import SearchAggregator, iter_search_rows
+
+    def run():
+        site_url = bench.unique('google')
+        # The recorded GA4 account has a web stream for example.com only
+        report = recorded_ga4_report('https://example.com', cache_key=site_url)
+        fetchers = {
+            'analytics': report.analytics,
+            'conversions': report.conversions,
+            'search': lambda: SearchAggregator().consume(
+                iter_search_rows(FakeSearchConsole(50000), site_url, {}, max_rows=50000)
+            ).summary(),
+            'cwv': lambda: CWVAnalyzer.get_cwv_data(site_url, fallback=False)
+        }
+        render_report(collect_report_data(site_url, 120, fetchers=fetchers), 'premium')
+    return timed(run, repeat)
+
+
+def case_stripe_webhook(bench, repeat):
+    event = json.dumps({'type': 'checkout.session.completed', 'data': {'object': {
+        'client_reference_id': USER_ID, 'customer': 'cus_bench', 'subscription': 'sub_bench'
+    }}})
+
+    def run():
+        response = bench.client.post('/webhook', data=event, headers={'Stripe-Signature': 'whsec_bench'})
+        assert response.status_code == 200
+    return timed(run, repeat)
+
+
+def case_email_outbox_100(bench, repeat):
+    """Queue 100 upgrade emails and drain them through the Resend batch endpoint"""
+    from utils.email_sender import EmailSender
+    from utils.outbox import outbox
+
+    def run():
+        for _ in range(100):
+            EmailSender.send_upgrade_notification('bench@example.com', 'premium', idempotency_key=bench.unique('upgrade'))
+        outbox.drain()
+    return timed(run, repeat)
+
+
+CASES = {
+    'generate_pdf': case_generate_pdf,
+    'get_cwv_summary_x1000': case_get_cwv_summary_x1000,
+    'psi_fetch_parse': case_psi_fetch_parse,
+    'audit': case_audit,
+    'dashboard_cold': case_dashboard_cold,
+    'dashboard_warm': case_dashboard_warm,
+    'generate_report': case_generate_report,
+    'report_google_data': case_report_google_data,
+    'stripe_webhook': case_stripe_webhook,
+    'email_outbox_100': case_email_outbox_100
+}
+
+
+def summarize(samples):
+    from utils.jobs import percentile
+
+    ms = [s * 1000 for s in samples]
+    return {
+        'runs': len(ms),
+        'median_ms': round(statistics.median(ms), 3),
+        'p95_ms': round(percentile(ms, 95), 3),
+        'min_ms': round(min(ms), 3),
+        'mean_ms': round(statistics.fmean(ms), 3)
+    }
+
+
+def compare(results, baseline, tolerance):
+    """Print current vs baseline medians; returns the names of regressed cases"""
+    regressions = []
+    print(f"\n{'case':<24}{'baseline ms':>12}{'now ms':>10}{'change':>9}")
+    for name, result in results.items():
+        before = baseline.get('results', {}).get(name)
+        if not before:
+            print(f"{name:<24}{'-':>12}{result['median_ms']:>10.2f}{'new':>9}")
+            continue
+        change = result['median_ms'] / before['median_ms'] - 1 if before['median_ms'] else 0
+        regressed = change > tolerance
+        if regressed:
+            regressions.append(name)
+        print(f"{name:<24}{before['median_ms']:>12.2f}{result['median_ms']:>10.2f}{change:>+8.0%}{'  REGRESSION' if regressed else ''}")
+    return regressions
+
+
+def git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__)))).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--only', help=f"comma-separated cases (default: all of {', '.join(CASES)})")
+    parser.add_argument('--repeat', type=int, default=10)
+    parser.add_argument('--output', help='write results JSON here')
+    parser.add_argument('--baseline', help='results JSON from an earlier run to compare against')
+    parser.add_argument('--tolerance', type=float, default=0.25, help='allowed median slowdown (default: %(default)s)')
+    parser.add_argument('--db-latency-ms', type=float, default=10, help='per Supabase query (default: %(default)s)')
+    parser.add_argument('--net-latency-ms', type=float, default=0, help='per fake HTTP request (default: %(default)s)')
+    parser.add_argument('--psi-mb', type=float, default=3.0, help='PSI response size (default: %(default)s)')
+    args = parser.parse_args()
+
+    names = args.only.split(',') if args.only else list(CASES)
+    unknown = [name for name in names if name not in CASES]
+    if unknown:
+        parser.error(f"unknown cases: {', '.join(unknown)}")
+
+    directory = tempfile.mkdtemp(prefix='reportriser-bench-')
+    isolate(directory)
+    bench = Bench(args.db_latency_ms / 1000, args.net_latency_ms / 1000, args.psi_mb)
+
+    results = {}
+    try:
+        for name in names:
+            results[name] = summarize(CASES[name](bench, args.repeat))
+            print(f"{name:<24} median {results[name]['median_ms']:9.2f} ms  p95 {results[name]['p95_ms']:9.2f} ms")
+    finally:
+        bench.close()
+        shutil.rmtree(directory, ignore_errors=True)
+
+    report = {
+        'meta': {
+            'timestamp': datetime.now().isoformat(timespec='seconds'),
+            'revision': git_revision(),
+            'python': sys.version.split()[0],
+            'platform': platform.platform(),
+            'options': {key: value for key, value in vars(args).items() if key not in ('output', 'baseline')}
+        },
+        'results': results
+    }
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"\nResults written to {args.output}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        # Latency and payload settings change every number; only compare like with like
+        settings = ('db_latency_ms', 'net_latency_ms', 'psi_mb')
+        before = baseline.get('meta', {}).get('options', {})
+        if any(before.get(key) != report['meta']['options'][key] for key in settings if key in before):
+            print(f"\nWarning: baseline was run with {', '.join(f'{key}={before.get(key)}' for key in settings)}")
+        regressions = compare(results, baseline, args.tolerance)
+        if regressions:
+            print(f"\nFAIL: slower than baseline by more than {args.tolerance:.0%}: {', '.join(regressions)}")
+            raise SystemExit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,104 @@
+-- Monthly report quota, enforced in the database so every app instance shares one count.
+--
+-- users.reports_used counts the reports of users.reports_period (YYYY-MM). The app
+-- never writes either column directly: reserve_report_quota increments it only while
+-- the result stays within the caller's limit, and refund_report_quota /
+-- expire_report_quota give units back. Each function returns the affected
+-- reservation ids as rows (PostgREST clients parse rows, not scalars); no row means
+-- "over the limit" or "nothing to refund". See utils/metering.py.
+
+alter table users add column if not exists reports_period text;
+
+-- Rows written before the column existed counted the current month
+update users set reports_period = to_char(now(), 'YYYY-MM') where reports_period is null;
+update users set reports_used = 0 where reports_used is null;
+
+create table if not exists report_reservations (
+    id uuid primary key default gen_random_uuid(),
+    user_id uuid not null references users (id) on delete cascade,
+    period text not null,
+    units integer not null,
+    status text not null default 'reserved',  -- reserved | committed | refunded | expired
+    created_at timestamptz not null default now()
+);
+
+create index if not exists report_reservations_open
+    on report_reservations (user_id, created_at) where status = 'reserved';
+
+
+create or replace function refund_report_quota(p_reservation_id uuid, p_status text default 'refunded')
+returns table (reservation_id uuid)
+language plpgsql as $$
+declare
+    v_user_id uuid;
+    v_period text;
+    v_units integer;
+begin
+    update report_reservations set status = p_status
+     where id = p_reservation_id and status = 'reserved'
+    returning user_id, period, units into v_user_id, v_period, v_units;
+    if not found then
+        return;
+    end if;
+
+    -- A unit from an earlier month was already reset away
+    update users set reports_used = greatest(reports_used - v_units, 0)
+     where id = v_user_id and reports_period = v_period;
+
+    reservation_id := p_reservation_id;
+    return next;
+end $$;
+
+
+create or replace function reserve_report_quota(
+    p_user_id uuid, p_period text, p_limit integer, p_units integer default 1, p_ttl_seconds integer default 3600
+)
+returns table (reservation_id uuid)
+language plpgsql as $$
+declare
+    v_stale uuid;
+begin
+    -- Concurrent reserves for one user queue on the row lock
+    perform 1 from users where id = p_user_id for update;
+    if not found then
+        return;
+    end if;
+
+    update users set reports_used = 0, reports_period = p_period
+     where id = p_user_id and reports_period is distinct from p_period;
+
+    -- Reservations nobody committed or refunded in time belong to jobs that died
+    for v_stale in
+        select id from report_reservations
+         where user_id = p_user_id and status = 'reserved'
+           and created_at < now() - make_interval(secs => p_ttl_seconds)
+    loop
+        perform refund_report_quota(v_stale, 'expired');
+    end loop;
+
+    update users set reports_used = reports_used + p_units
+     where id = p_user_id and reports_used + p_units <= p_limit;
+    if not found then
+        return;
+    end if;
+
+    insert into report_reservations (user_id, period, units)
+    values (p_user_id, p_period, p_units)
+    returning id into reservation_id;
+    return next;
+end $$;
+
+
+create or replace function expire_report_quota(p_ttl_seconds integer default 3600)
+returns table (reservation_id uuid)
+language plpgsql as $$
+declare
+    v_stale uuid;
+begin
+    for v_stale in
+        select id from report_reservations
+         where status = 'reserved' and created_at < now() - make_interval(secs => p_ttl_seconds)
+    loop
+        return query select * from refund_report_quota(v_stale, 'expired');
+    end loop;
+end $$;
@@ -0,0 +1,25 @@
+-- Background job records (utils/jobs.py), shared by every app instance and the job worker.
+--
+-- Times are epoch seconds. updated_at moves on every stage a job records; a queued or
+-- running job whose updated_at falls more than JOB_STALE_SECONDS behind is failed.
+-- Workers claim a job with a conditional update (status 'queued' -> 'running').
+
+create table if not exists report_jobs (
+    id text primary key,
+    kind text not null,
+    user_id uuid not null references users (id) on delete cascade,
+    status text not null default 'queued',  -- queued | running | done | failed
+    params jsonb not null default '{}',
+    stages jsonb not null default '[]',
+    result jsonb,
+    error text,
+    created_at double precision not null,
+    updated_at double precision not null,
+    started_at double precision,
+    finished_at double precision
+);
+
+-- The worker's queue scan and the stale-job sweep
+create index if not exists report_jobs_queued on report_jobs (created_at) where status = 'queued';
+create index if not exists report_jobs_open on report_jobs (updated_at) where status in ('queued', 'running');
+create index if not exists report_jobs_created on report_jobs (created_at);
@@ -0,0 +1,27 @@
+-- Scheduled reports (utils/scheduler.py), shared by every app instance and scheduler.
+--
+-- One schedule per (user_id, site_url): SchedulesRepo.upsert relies on the unique
+-- constraint for on_conflict. Times are UTC epoch seconds. next_due_at is the period
+-- the next report covers; next_run_at is when a scheduler may take it next (equal to
+-- next_due_at, pushed forward by a claim's lease or a retry backoff). A claim is a
+-- conditional update on next_run_at, so two schedulers never run the same period.
+
+create table if not exists report_schedules (
+    id bigint generated always as identity primary key,
+    user_id uuid not null references users (id) on delete cascade,
+    site_url text not null,
+    frequency text not null default 'monthly' check (frequency in ('weekly', 'monthly')),
+    day integer not null default 1,
+    hour integer not null default 9 check (hour between 0 and 23),
+    avg_order_value numeric not null default 100,
+    active boolean not null default true,
+    next_due_at bigint not null,
+    next_run_at bigint not null,
+    attempts integer not null default 0,
+    created_at timestamptz not null default now(),
+    constraint report_schedules_user_site unique (user_id, site_url)
+);
+
+-- The scheduler's due scan and next-wakeup lookup
+create index if not exists report_schedules_next_run
+    on report_schedules (next_run_at) where active;
@@ -0,0 +1,125 @@
+"""
+Content-addressed artifact store (generated PDFs) on the local filesystem
+
+Artifacts are named by the SHA-256 of their bytes, so identical renders are
+stored once. The store is kept under a size budget by evicting the least
+recently used files (mtime is bumped on every read). Each process keeps a
+running byte count and only walks the directory when that count goes over
+budget, or every ARTIFACT_RESCAN_SECONDS to pick up other processes' writes.
+Eviction goes down to ARTIFACT_EVICT_TO of the budget so a full store isn't
+walked again on the very next write.
+"""
+import hashlib
+import os
+import re
+import tempfile
+import threading
+import time
+
+KEY_PATTERN = re.compile(r'^[0-9a-f]{64}$')
+ARTIFACT_RESCAN_SECONDS = float(os.getenv('ARTIFACT_RESCAN_SECONDS', 60))
+ARTIFACT_EVICT_TO = float(os.getenv('ARTIFACT_EVICT_TO', 0.9))
+
+
+class ArtifactStore:
+
+    def __init__(self, root=None, max_bytes=None):
+        self.root = root or os.getenv('ARTIFACT_DIR', os.path.join(tempfile.gettempdir(), 'reportriser_artifacts'))
+        self.max_bytes = max_bytes or int(os.getenv('ARTIFACT_MAX_BYTES', 512 * 1024 * 1024))
+        self.evictions = 0
+        self._bytes = None  # unknown until the first walk
+        self._rescan_at = 0
+        self._lock = threading.Lock()
+        os.makedirs(self.root, exist_ok=True)
+
+    def _path(self, key):
+        return os.path.join(self.root, key[:2], key)
+
+    def put(self, data):
+        """Store bytes and return their content key"""
+        key = hashlib.sha256(data).hexdigest()
+        path = self._path(key)
+
+        if os.path.exists(path):
+            os.utime(path)
+            return key
+
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+
+        self._added(len(data))
+        return key
+
+    def _added(self, size):
+        """Count a new artifact, evicting only if the count is over budget or a rescan is due"""
+        with self._lock:
+            if self._bytes is not None and time.monotonic() < self._rescan_at:
+                self._bytes += size
+                if self._bytes <= self.max_bytes:
+                    return
+        self.evict()
+
+    def path(self, key):
+        """Filesystem path for key (marking it recently used), or None if missing"""
+        if not KEY_PATTERN.match(key or ''):
+            return None
+        path = self._path(key)
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            return None
+        return path
+
+    def get(self, key):
+        path = self.path(key)
+        if path is None:
+            return None
+        with open(path, 'rb') as f:
+            return f.read()
+
+    def _entries(self):
+        entries = []
+        for dirpath, _, filenames in os.walk(self.root):
+            for name in filenames:
+                if not KEY_PATTERN.match(name):
+                    continue
+                try:
+                    st = os.stat(os.path.join(dirpath, name))
+                except FileNotFoundError:
+                    continue
+                entries.append((st.st_mtime, st.st_size, os.path.join(dirpath, name)))
+        return entries
+
+    def evict(self):
+        """If the store exceeds max_bytes, delete least recently used artifacts down to ARTIFACT_EVICT_TO of it"""
+        with self._lock:
+            entries = self._entries()
+            total = sum(size for _, size, _ in entries)
+            target = self.max_bytes * ARTIFACT_EVICT_TO if total > self.max_bytes else total
+            for _, size, path in sorted(entries):
+                if total <= target:
+                    break
+                try:
+                    os.remove(path)
+                    self.evictions += 1
+                except FileNotFoundError:
+                    pass
+                total -= size
+            self._bytes = total
+            self._rescan_at = time.monotonic() + ARTIFACT_RESCAN_SECONDS
+
+    def stats(self):
+        entries = self._entries()
+        return {
+            'artifacts': len(entries),
+            'bytes': sum(size for _, size, _ in entries),
+            'max_bytes': self.max_bytes,
+            'evictions': self.evictions
+        }
+
+
+# Shared by the web app, job workers and CLI tools
+artifact_store = ArtifactStore()
@@ -0,0 +1,113 @@
+"""
+Public /audit computation with caching, single-flight and stale-while-revalidate
+
+Results are cached per normalized URL in a store shared by all workers
+(SQLite by default). Fresh results are served directly; stale ones are
+served immediately while one background refresh runs. Concurrent misses
+for the same URL are coalesced onto one computation per process (threads)
+and per host (file lock).
+"""
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+from utils.cache import TTLCache
+from utils.cwv import CWVAnalyzer
+from utils.locks import SingleFlight, file_lock
+from utils.page_scraper import get_seo_checks
+from utils.psi_governor import psi_governor, PSIRejected
+
+AUDIT_FRESH_SECONDS = int(os.getenv('AUDIT_FRESH_SECONDS', 15 * 60))
+AUDIT_STALE_SECONDS = int(os.getenv('AUDIT_STALE_SECONDS', 24 * 3600))
+AUDIT_LOCK_TIMEOUT = 60
+
+audit_cache = TTLCache.from_env('AUDIT', ttl=AUDIT_STALE_SECONDS, max_entries=5000, backend='sqlite')
+_flights = SingleFlight()
+_refresher = ThreadPoolExecutor(max_workers=2, thread_name_prefix='audit-refresh')
+
+
+def run_audit(site_url):
+    """Compute audit_data for site_url. Returns (audit_data, cacheable)"""
+    cacheable = True
+
+    # Get CWV data
+    try:
+        cwv_summary = CWVAnalyzer.get_cwv_summary(CWVAnalyzer.get_cwv_data(site_url, fallback=False))
+    except PSIRejected:
+        raise
+    except Exception as e:
+        # PSI failed (including upstream 429s): show "CWV unavailable" and don't cache it
+        print(f"Audit CWV unavailable for {site_url}: {e}")
+        cwv_summary = None
+        cacheable = False
+
+    # Basic on-page SEO check (streamed, size-capped, parsed incrementally)
+    try:
+        seo_checks = get_seo_checks(site_url)
+    except:
+        seo_checks = None
+
+    audit_data = {
+        'url': site_url,
+        'cwv': cwv_summary,
+        'seo': seo_checks,
+        'timestamp': datetime.now().strftime('%B %d, %Y at %I:%M %p')
+    }
+
+    return audit_data, cacheable
+
+
+def _is_fresh(entry):
+    return entry is not None and time.time() - entry['computed_at'] < AUDIT_FRESH_SECONDS
+
+
+def _compute(site_url, key):
+    try:
+        with file_lock(f"audit:{key}", timeout=AUDIT_LOCK_TIMEOUT):
+            # Another worker may have finished this URL while we waited
+            entry = audit_cache.get(key)
+            if _is_fresh(entry):
+                return entry['audit_data']
+            return _compute_and_store(site_url, key)
+    except TimeoutError:
+        return _compute_and_store(site_url, key)
+
+
+def _compute_and_store(site_url, key):
+    audit_data, cacheable = run_audit(site_url)
+    if cacheable:
+        audit_cache.set(key, {'audit_data': audit_data, 'computed_at': time.time()})
+    return audit_data
+
+
+def _refresh(site_url, key):
+    try:
+        _flights.do(key, lambda: _compute(site_url, key))
+    except Exception as e:
+        print(f"Audit refresh error for {site_url}: {e}")
+
+
+def get_audit(site_url, client_ip=None):
+    """audit_data for site_url, from cache when possible.
+
+    client_ip is charged against its /audit rate limit only when this call
+    starts a computation: cache hits and callers joining an in-flight
+    computation of the same URL cost no PSI call, so they are free.
+    """
+    key = CWVAnalyzer.normalize_url(site_url)
+
+    entry = audit_cache.get(key)
+    if entry is not None:
+        if not _is_fresh(entry) and not _flights.in_flight(key):
+            _refresher.submit(_refresh, site_url, key)
+        return entry['audit_data']
+
+    if client_ip is not None and not _flights.in_flight(key):
+        psi_governor.admit_client(client_ip)
+
+    return _flights.do(key, lambda: _compute(site_url, key))
+
+
+def get_cache_stats():
+    return audit_cache.stats()
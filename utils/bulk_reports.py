@@ -0,0 +1,196 @@
+"""
+Bulk report generation for month-end runs
+
+Data gathering runs on a bounded thread pool (I/O), PDF rendering on a
+process pool sized to the available cores (ReportLab holds the GIL). Render
+processes are spawned, not forked, because the parent already runs threads.
+At most max_in_flight targets are gathering or rendering at once, so
+gathered report data waiting for a render process stays bounded.
+Finished reports are added to each user's report history (the reports
+table) in batches of RECORD_BATCH_SIZE, and only then appended to a
+checkpoint file, so a crashed run can be resumed with the same command.
+
+    python -m utils.bulk_reports --targets targets.csv
+    python -m utils.bulk_reports --from-supabase --checkpoint month_end.jsonl
+"""
+import argparse
+import csv
+import json
+import multiprocessing
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, wait, FIRST_COMPLETED
+
+from utils.jobs import StageTimer, percentile
+from utils.report_pipeline import collect_report_data, render_report
+from utils.repository import ReportsRepo
+
+RECORD_BATCH_SIZE = 100
+
+
+def target_key(target):
+    return f"{target['user_id']}|{target['site_url']}"
+
+
+def load_targets_csv(path):
+    """CSV with user_id,site_url[,tier,avg_order_value] columns"""
+    with open(path, newline='') as f:
+        return [
+            {
+                'user_id': row['user_id'],
+                'site_url': row['site_url'],
+                'tier': row.get('tier') or 'free',
+                'avg_order_value': float(row.get('avg_order_value') or 100)
+            }
+            for row in csv.DictReader(f)
+        ]
+
+
+def load_targets_supabase():
+    """Every row in the Supabase sites table, with the owner's tier"""
+    from utils.repository import SitesRepo, UsersRepo
+
+    sites = SitesRepo.all_targets()
+    tiers = UsersRepo.get_tiers(site['user_id'] for site in sites)
+
+    return [
+        {'user_id': site['user_id'], 'site_url': site['url'], 'tier': tiers.get(site['user_id'], 'free'), 'avg_order_value': 100}
+        for site in sites
+    ]
+
+
+def load_checkpoint(path):
+    done = set()
+    if os.path.exists(path):
+        with open(path) as f:
+            for line in f:
+                try:
+                    done.add(json.loads(line)['key'])
+                except (ValueError, KeyError):
+                    continue  # torn last line from a crash
+    return done
+
+
+def gather_target(target):
+    timer = StageTimer()
+    report_data = collect_report_data(target['site_url'], target['avg_order_value'], timer=timer,
+                                      user_id=target['user_id'])
+    return report_data, sum(s['seconds'] for s in timer.stages if s['name'] in ('fetch', 'analyze'))
+
+
+def render_target(report_data, tier):
+    """Runs in a worker process"""
+    timer = StageTimer()
+    result = render_report(report_data, tier, timer=timer)
+    return result, sum(s['seconds'] for s in timer.stages)
+
+
+def run(targets, checkpoint_path, io_workers=8, render_workers=None, max_in_flight=None):
+    render_workers = render_workers or os.cpu_count() or 1
+    max_in_flight = max_in_flight or io_workers + 2 * render_workers
+    done = load_checkpoint(checkpoint_path)
+    pending = [t for t in targets if target_key(t) not in done]
+
+    print(f"📦 {len(targets)} targets, {len(targets) - len(pending)} already done, {len(pending)} to run "
+          f"({io_workers} I/O workers, {render_workers} render processes)")
+
+    latencies = {'gather': [], 'render': [], 'total': []}
+    failures = []
+    unrecorded = []
+    recorded = []
+    started = time.perf_counter()
+
+    def record(checkpoint):
+        """Insert the finished reports into their users' history, then checkpoint them"""
+        batch = unrecorded[:]
+        unrecorded.clear()
+        try:
+            ReportsRepo.insert_many([
+                {'user_id': target['user_id'], 'site_url': target['site_url'], 'traffic': result['traffic'], 'roi': result['roi']}
+                for target, result in batch
+            ])
+        except Exception as e:
+            print(f"❌ Recording {len(batch)} reports failed: {e}")
+            failures.extend(target_key(target) for target, _ in batch)
+            return
+        recorded.extend(batch)
+        for target, result in batch:
+            checkpoint.write(json.dumps({'key': target_key(target), 'artifact_key': result['artifact_key']}) + '\n')
+        checkpoint.flush()
+        os.fsync(checkpoint.fileno())
+
+    with ProcessPoolExecutor(max_workers=render_workers, mp_context=multiprocessing.get_context('spawn')) as cpu_pool, \
+            ThreadPoolExecutor(max_workers=io_workers) as io_pool, \
+            open(checkpoint_path, 'a') as checkpoint:
+
+        in_flight = {}
+        remaining = iter(pending)
+
+        def submit_next():
+            target = next(remaining, None)
+            if target is not None:
+                in_flight[io_pool.submit(gather_target, target)] = ('gather', target, time.perf_counter())
+
+        for _ in range(max_in_flight):
+            submit_next()
+
+        while in_flight:
+            finished, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+            for future in finished:
+                stage, target, submitted = in_flight.pop(future)
+                try:
+                    value, seconds = future.result()
+                except Exception as e:
+                    print(f"❌ {target['site_url']} ({stage}): {e}")
+                    failures.append(target_key(target))
+                    submit_next()
+                    continue
+
+                latencies[stage].append(seconds)
+
+                if stage == 'gather':
+                    render_future = cpu_pool.submit(render_target, value, target['tier'])
+                    in_flight[render_future] = ('render', target, submitted)
+                else:
+                    latencies['total'].append(time.perf_counter() - submitted)
+                    submit_next()
+                    unrecorded.append((target, value))
+                    if len(unrecorded) >= RECORD_BATCH_SIZE:
+                        record(checkpoint)
+
+        if unrecorded:
+            record(checkpoint)
+
+    elapsed = time.perf_counter() - started
+    completed = len(recorded)
+
+    print(f"\n✅ {completed} reports in {elapsed:.1f}s "
+          f"({completed / elapsed * 60 if elapsed else 0:.1f} reports/min), {len(failures)} failed")
+    for stage, values in latencies.items():
+        print(f"  {stage:<7} p50 {percentile(values, 50):6.2f}s  p90 {percentile(values, 90):6.2f}s  "
+              f"p99 {percentile(values, 99):6.2f}s  max {max(values, default=0):6.2f}s")
+
+    return {'completed': completed, 'failed': failures, 'seconds': elapsed, 'latencies': latencies}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Generate reports for many (user, site) targets')
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument('--targets', help='CSV file with user_id,site_url[,tier,avg_order_value]')
+    source.add_argument('--from-supabase', action='store_true', help='Use every row of the sites table')
+    parser.add_argument('--checkpoint', default='bulk_reports_checkpoint.jsonl', help='Resume file (default: %(default)s)')
+    parser.add_argument('--io-workers', type=int, default=8, help='Concurrent data-gathering threads')
+    parser.add_argument('--render-workers', type=int, default=None, help='Render processes (default: CPU count)')
+    parser.add_argument('--max-in-flight', type=int, default=None,
+                        help='Targets gathering or rendering at once (default: I/O workers + 2 x render processes)')
+    args = parser.parse_args()
+
+    targets = load_targets_csv(args.targets) if args.targets else load_targets_supabase()
+    result = run(targets, args.checkpoint, io_workers=args.io_workers, render_workers=args.render_workers,
+                 max_in_flight=args.max_in_flight)
+
+    raise SystemExit(1 if result['failed'] else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,194 @@
+"""
+TTL + LRU result cache with swappable in-process and SQLite backends
+"""
+import json
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+
+DEFAULT_CACHE_PATH = os.path.join(tempfile.gettempdir(), 'reportriser_cache.sqlite3')
+
+
+class MemoryBackend:
+    """Per-process LRU store (fastest, not shared between gunicorn workers)"""
+
+    def __init__(self, max_entries=1000):
+        self.max_entries = max_entries
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return None
+            self._data.move_to_end(key)
+            return entry
+
+    def set(self, key, value, expires_at):
+        with self._lock:
+            self._data[key] = (value, expires_at)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+
+class SQLiteBackend:
+    """On-disk LRU store shared by every worker on the host"""
+
+    def __init__(self, path=DEFAULT_CACHE_PATH, table='cache', max_entries=1000):
+        self.path = path
+        self.table = table
+        self.max_entries = max_entries
+        self._local = threading.local()
+        conn = self._conn()
+        with conn:
+            conn.execute(
+                f"CREATE TABLE IF NOT EXISTS {table} ("
+                "key TEXT PRIMARY KEY, value TEXT NOT NULL, "
+                "expires_at REAL NOT NULL, accessed_at REAL NOT NULL)"
+            )
+            conn.execute(f"CREATE INDEX IF NOT EXISTS {table}_accessed ON {table} (accessed_at)")
+
+    def _conn(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+        return conn
+
+    def get(self, key):
+        conn = self._conn()
+        row = conn.execute(
+            f"SELECT value, expires_at FROM {self.table} WHERE key = ?", (key,)
+        ).fetchone()
+        if row is None:
+            return None
+        conn.execute(
+            f"UPDATE {self.table} SET accessed_at = ? WHERE key = ?", (time.time(), key)
+        )
+        return json.loads(row[0]), row[1]
+
+    def set(self, key, value, expires_at):
+        conn = self._conn()
+        with conn:
+            conn.execute('BEGIN IMMEDIATE')
+            conn.execute(
+                f"INSERT OR REPLACE INTO {self.table} (key, value, expires_at, accessed_at) "
+                "VALUES (?, ?, ?, ?)",
+                (key, json.dumps(value), expires_at, time.time())
+            )
+            overflow = conn.execute(f"SELECT COUNT(*) FROM {self.table}").fetchone()[0] - self.max_entries
+            if overflow > 0:
+                conn.execute(
+                    f"DELETE FROM {self.table} WHERE key IN "
+                    f"(SELECT key FROM {self.table} ORDER BY accessed_at LIMIT ?)",
+                    (overflow,)
+                )
+
+    def delete(self, key):
+        self._conn().execute(f"DELETE FROM {self.table} WHERE key = ?", (key,))
+
+    def clear(self):
+        self._conn().execute(f"DELETE FROM {self.table}")
+
+    def __len__(self):
+        return self._conn().execute(f"SELECT COUNT(*) FROM {self.table}").fetchone()[0]
+
+
+class TTLCache:
+    """Expiring cache in front of a backend, with hit/miss accounting"""
+
+    def __init__(self, backend, ttl=3600):
+        self.backend = backend
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.computes = 0
+        self.compute_seconds = 0.0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def from_env(prefix, ttl=3600, max_entries=1000, backend='memory'):
+        """Build a cache configured from PREFIX_CACHE_BACKEND / _TTL / _MAX_ENTRIES / _PATH"""
+        backend_name = os.getenv(f'{prefix}_CACHE_BACKEND', backend).lower()
+        ttl = int(os.getenv(f'{prefix}_CACHE_TTL', ttl))
+        max_entries = int(os.getenv(f'{prefix}_CACHE_MAX_ENTRIES', max_entries))
+
+        if backend_name == 'sqlite':
+            path = os.getenv(f'{prefix}_CACHE_PATH', DEFAULT_CACHE_PATH)
+            backend = SQLiteBackend(path, table=f'{prefix.lower()}_cache', max_entries=max_entries)
+        else:
+            backend = MemoryBackend(max_entries=max_entries)
+
+        return TTLCache(backend, ttl=ttl)
+
+    def get(self, key):
+        entry = self.backend.get(key)
+        if entry is not None and entry[1] > time.time():
+            with self._lock:
+                self.hits += 1
+            return entry[0]
+
+        if entry is not None:
+            self.backend.delete(key)
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def set(self, key, value, ttl=None):
+        self.backend.set(key, value, time.time() + (self.ttl if ttl is None else ttl))
+
+    def delete(self, key):
+        self.backend.delete(key)
+
+    def clear(self):
+        self.backend.clear()
+
+    def get_or_compute(self, key, compute, ttl=None):
+        """Return the cached value, or run compute() and cache what it returns.
+
+        Exceptions from compute() propagate and nothing is cached.
+        """
+        value = self.get(key)
+        if value is not None:
+            return value
+
+        started = time.perf_counter()
+        value = compute()
+        with self._lock:
+            self.computes += 1
+            self.compute_seconds += time.perf_counter() - started
+
+        self.set(key, value, ttl)
+        return value
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            avg_compute = self.compute_seconds / self.computes if self.computes else 0.0
+            return {
+                'backend': type(self.backend).__name__,
+                'entries': len(self.backend),
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / lookups, 3) if lookups else 0.0,
+                'avg_compute_seconds': round(avg_compute, 3),
+                'estimated_seconds_saved': round(self.hits * avg_compute, 1)
+            }
@@ -1,8 +1,17 @@
 """
 Core Web Vitals analyzer with recommendations
 """
-import requests
 import os
+from urllib.parse import urlsplit, urlunsplit, parse_qsl, urlencode
+from utils.cache import TTLCache
+from utils.psi_governor import psi_governor, PSIRejected
+
+PSI_ENDPOINT = 'https://www.googleapis.com/pagespeedonline/v5/runPagespeed'
+
+# PSI results are stable for hours; share them across /audit and /generate-report.
+# Set CWV_CACHE_BACKEND=sqlite so every gunicorn worker reads the same entries.
+cwv_cache = TTLCache.from_env('CWV', ttl=6 * 3600, max_entries=2000)
+
 
 class CWVAnalyzer:
     
@@ -13,34 +22,96 @@ class CWVAnalyzer:
         'cls': {'good': 0.1, 'needs_improvement': 0.25}
     }
     
+    # Batch API: status index 0/1/2 maps to these, and to the score points per metric
+    STATUSES = ('good', 'needs_improvement', 'poor')
+    ICONS = ('✅', '⚠️', '❌')
+    SCORE_POINTS = {
+        'lcp': (40, 25, 10),
+        'fid': (30, 20, 5),
+        'cls': (30, 20, 5)
+    }
+    PRIORITY_FIXES = (
+        "Priority: Fix LCP for +12% conversions",
+        "Priority: Fix FID to improve user engagement",
+        "Priority: Fix CLS to reduce bounce rate",
+        "Opportunity: Improve LCP for +8% conversions",
+        "CWV passing — maintain current performance"
+    )
+    
     @staticmethod
-    def get_cwv_data(site_url):
-        """Get Core Web Vitals from PageSpeed Insights"""
+    def normalize_url(site_url):
+        """Canonical form of a URL for cache keys (scheme, www, trailing slash, query order)"""
+        site_url = site_url.strip()
+        if '://' not in site_url:
+            site_url = f"https://{site_url}"
+
+        parts = urlsplit(site_url)
+        host = (parts.hostname or '').lower()
+        if host.startswith('www.'):
+            host = host[4:]
+        if parts.port and parts.port not in (80, 443):
+            host = f"{host}:{parts.port}"
+
+        path = parts.path.rstrip('/')
+        query = urlencode(sorted(parse_qsl(parts.query, keep_blank_values=True)))
+
+        return urlunsplit(('https', host, path, query, ''))
+
+    @staticmethod
+    def get_cwv_data(site_url, strategy='mobile', fallback=True):
+        """Get Core Web Vitals from PageSpeed Insights (cached per normalized URL + strategy).
+
+        On failure returns mock data, or raises if fallback is False. Calls the
+        PSI governor refuses always raise PSIRejected so users never get mock
+        numbers presented as real ones.
+        """
+        cache_key = f"{strategy}:{CWVAnalyzer.normalize_url(site_url)}"
+
         try:
-            api_key = os.getenv('GOOGLE_PAGESPEED_API_KEY', '')
-            url = f"https://www.googleapis.com/pagespeedonline/v5/runPagespeed?url={site_url}&strategy=mobile&key={api_key}"
-            
-            response = requests.get(url, timeout=30).json()
-            
-            lighthouse = response['lighthouseResult']
-            audits = lighthouse['audits']
-            
-            # Extract CWV metrics
-            lcp = audits.get('largest-contentful-paint', {}).get('numericValue', 0) / 1000
-            fid = audits.get('max-potential-fid', {}).get('numericValue', 0) / 1000
-            cls = audits.get('cumulative-layout-shift', {}).get('numericValue', 0)
-            
-            return {
-                'lcp': round(lcp, 2),
-                'fid': round(fid, 2),
-                'cls': round(cls, 3),
-                'performance': int(lighthouse['categories']['performance']['score'] * 100),
-                'accessibility': int(lighthouse['categories']['accessibility']['score'] * 100),
-                'seo': int(lighthouse['categories']['seo']['score'] * 100)
-            }
+            return cwv_cache.get_or_compute(
+                cache_key,
+                lambda: CWVAnalyzer.fetch_cwv_data(site_url, strategy)
+            )
+        except PSIRejected:
+            raise
         except Exception as e:
             print(f"CWV error: {e}")
+            if not fallback:
+                raise
             return CWVAnalyzer.get_mock_cwv()
+
+    @staticmethod
+    def fetch_cwv_data(site_url, strategy='mobile'):
+        """Call PageSpeed Insights directly, bypassing the cache"""
+        api_key = os.getenv('GOOGLE_PAGESPEED_API_KEY', '')
+
+        response = psi_governor.get(
+            PSI_ENDPOINT,
+            params={'url': site_url, 'strategy': strategy, 'key': api_key},
+            timeout=(5, 30)
+        ).json()
+
+        lighthouse = response['lighthouseResult']
+        audits = lighthouse['audits']
+
+        # Extract CWV metrics
+        lcp = audits.get('largest-contentful-paint', {}).get('numericValue', 0) / 1000
+        fid = audits.get('max-potential-fid', {}).get('numericValue', 0) / 1000
+        cls = audits.get('cumulative-layout-shift', {}).get('numericValue', 0)
+
+        return {
+            'lcp': round(lcp, 2),
+            'fid': round(fid, 2),
+            'cls': round(cls, 3),
+            'performance': int(lighthouse['categories']['performance']['score'] * 100),
+            'accessibility': int(lighthouse['categories']['accessibility']['score'] * 100),
+            'seo': int(lighthouse['categories']['seo']['score'] * 100)
+        }
+
+    @staticmethod
+    def get_cache_stats():
+        """Hit/miss counters for the PSI result cache"""
+        return cwv_cache.stats()
     
     @staticmethod
     def get_mock_cwv():
@@ -170,3 +241,77 @@ class CWVAnalyzer:
             return "Opportunity: Improve LCP for +8% conversions"
         else:
             return "CWV passing — maintain current performance"
+    
+    @staticmethod
+    def classify_batch(metric, values):
+        """Status index per value (0 good, 1 needs_improvement, 2 poor), same bins as get_cwv_status"""
+        import numpy as np  # only the batch paths need NumPy; keeps it off the web cold start
+        
+        thresholds = CWVAnalyzer.THRESHOLDS[metric]
+        # side='left': value <= good -> 0, <= needs_improvement -> 1, else (and NaN) -> 2
+        return np.searchsorted(
+            np.array([thresholds['good'], thresholds['needs_improvement']]),
+            np.asarray(values, dtype=np.float64),
+            side='left'
+        )
+    
+    @staticmethod
+    def score_batch(lcp, fid, cls):
+        """Scores, status indexes and priority-fix indexes for arrays of lcp/fid/cls values"""
+        import numpy as np
+        
+        statuses = {
+            'lcp': CWVAnalyzer.classify_batch('lcp', lcp),
+            'fid': CWVAnalyzer.classify_batch('fid', fid),
+            'cls': CWVAnalyzer.classify_batch('cls', cls)
+        }
+        
+        score = sum(
+            np.array(CWVAnalyzer.SCORE_POINTS[metric])[status]
+            for metric, status in statuses.items()
+        )
+        
+        # Same precedence as get_priority_fix; the default (index 4) is "passing"
+        priority = np.select(
+            [statuses['lcp'] == 2, statuses['fid'] == 2, statuses['cls'] == 2, statuses['lcp'] == 1],
+            [0, 1, 2, 3],
+            default=4
+        )
+        
+        return {'score': score, 'statuses': statuses, 'priority': priority}
+    
+    @staticmethod
+    def get_cwv_summaries(cwv_rows):
+        """get_cwv_summary for many {'lcp', 'fid', 'cls'} rows, scored in one vectorized pass"""
+        values = {metric: [row[metric] for row in cwv_rows] for metric in ('lcp', 'fid', 'cls')}
+        batch = CWVAnalyzer.score_batch(values['lcp'], values['fid'], values['cls'])
+        
+        labels = {'lcp': 'Largest Contentful Paint', 'fid': 'First Input Delay', 'cls': 'Cumulative Layout Shift'}
+        # Status and recommendation text depend only on (metric, status): look them up once
+        recommendations = {
+            metric: [CWVAnalyzer.get_cwv_recommendation(metric, None, status) for status in CWVAnalyzer.STATUSES]
+            for metric in labels
+        }
+        statuses = {metric: batch['statuses'][metric].tolist() for metric in labels}
+        scores = batch['score'].tolist()
+        priorities = batch['priority'].tolist()
+        
+        summaries = []
+        for i, row in enumerate(cwv_rows):
+            metrics = {}
+            for metric, label in labels.items():
+                status_index = statuses[metric][i]
+                metrics[metric] = {
+                    'value': row[metric],
+                    'status': CWVAnalyzer.STATUSES[status_index],
+                    'icon': CWVAnalyzer.ICONS[status_index],
+                    'label': label,
+                    'recommendation': recommendations[metric][status_index]
+                }
+            summaries.append({
+                'score': scores[i],
+                'metrics': metrics,
+                'overall_recommendation': CWVAnalyzer.PRIORITY_FIXES[priorities[i]]
+            })
+        
+        return summaries
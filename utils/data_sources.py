@@ -0,0 +1,96 @@
+"""
+Concurrent data gathering for reports
+
+Independent sources (analytics, search, CWV, conversions) are fetched in
+parallel so report latency is the slowest source rather than the sum.
+
+The pool is shared by every report in the process, so a source may queue
+behind other reports' sources. Its timeout starts when a pool thread picks
+it up; time spent queued is bounded separately by SOURCE_QUEUE_TIMEOUT.
+"""
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError
+
+# Per-source timeouts in seconds; override with SOURCE_TIMEOUT_<NAME>
+SOURCE_TIMEOUTS = {
+    'analytics': 20,
+    'search': 20,
+    'cwv': 35,
+    'conversions': 20
+}
+DEFAULT_TIMEOUT = 20
+SOURCE_QUEUE_TIMEOUT = float(os.getenv('SOURCE_QUEUE_TIMEOUT', 30))
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def _pool():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=int(os.getenv('SOURCE_WORKERS', 16)),
+                thread_name_prefix='source'
+            )
+        return _executor
+
+
+def get_timeout(name):
+    return float(os.getenv(f'SOURCE_TIMEOUT_{name.upper()}', SOURCE_TIMEOUTS.get(name, DEFAULT_TIMEOUT)))
+
+
+class _SourceRun:
+    """A source callable that records when a pool thread starts running it"""
+
+    def __init__(self, fn):
+        self.fn = fn
+        self.started_at = None
+        self.running = threading.Event()
+
+    def __call__(self):
+        self.started_at = time.perf_counter()
+        self.running.set()
+        value = self.fn()
+        return value, time.perf_counter() - self.started_at
+
+
+def gather(fetchers, required=()):
+    """Run {name: callable} concurrently with per-source timeouts.
+
+    Returns {'data': {...}, 'timings': {...}, 'errors': {...}}. Sources that
+    fail or time out are left out of data (partial result) unless they are
+    listed in required, in which case the error is raised.
+    """
+    started = time.perf_counter()
+    runs = {name: _SourceRun(fn) for name, fn in fetchers.items()}
+    futures = {name: _pool().submit(run) for name, run in runs.items()}
+
+    data, timings, errors = {}, {}, {}
+
+    for name, future in futures.items():
+        run = runs[name]
+        try:
+            if not run.running.wait(timeout=max(started + SOURCE_QUEUE_TIMEOUT - time.perf_counter(), 0)):
+                if future.cancel():
+                    raise TimeoutError(f"not started within {SOURCE_QUEUE_TIMEOUT:g}s (source pool busy)")
+                run.running.wait()  # a thread picked it up just now
+            remaining = run.started_at + get_timeout(name) - time.perf_counter()
+            try:
+                data[name], elapsed = future.result(timeout=max(remaining, 0))
+            except TimeoutError:
+                # The thread cannot be killed; its result is simply discarded
+                raise TimeoutError(f"timed out after {get_timeout(name):g}s")
+            timings[name] = round(elapsed, 3)
+        except Exception as e:
+            errors[name] = str(e)
+            timings[name] = round(time.perf_counter() - (run.started_at or started), 3)
+
+    for name, error in errors.items():
+        print(f"⚠️ Source '{name}' unavailable: {error}")
+        if name in required:
+            raise RuntimeError(f"Required data source '{name}' failed: {error}")
+
+    return {'data': data, 'timings': timings, 'errors': errors}
@@ -1,10 +1,12 @@
-import os
-import resend
+import hashlib
 
-resend.api_key = os.getenv('RESEND_API_KEY')
+from utils.outbox import outbox
 
 class EmailSender:
     
+    # Every method queues the message in the outbox and returns its idempotency key;
+    # the outbox sender delivers it in the background (the login link is also sent inline)
+
     @staticmethod
     def send_magic_link(email, magic_link):
         try:
@@ -50,18 +52,21 @@ class EmailSender:
                 """
             }
             
-            email_response = resend.Emails.send(params)
-            return email_response
+            key = outbox.enqueue(
+                params, idempotency_key=f"magic-link:{hashlib.sha256(magic_link.encode()).hexdigest()}"
+            )
+            # The user is waiting for it, and a serverless instance may be frozen before
+            # the background sender runs; the outbox keeps it only for retries
+            outbox.send_now(key)
+            return key
         except Exception as e:
             print(f"Email error: {e}")
             raise
     
     @staticmethod
-    def send_report(email, site_url, pdf_path):
+    def send_report(email, site_url, artifact_key, idempotency_key=None):
+        """Queue the report email; the PDF is attached from the artifact store at send time"""
         try:
-            with open(pdf_path, 'rb') as f:
-                pdf_content = f.read()
-            
             params = {
                 "from": "ReportRiser <reports@reportriser.com>",
                 "to": [email],
@@ -111,21 +116,20 @@ class EmailSender:
                     </div>
                 </body>
                 </html>
-                """,
-                "attachments": [{
-                    "filename": f"seo-report-{site_url.replace('https://', '').replace('http://', '')}.pdf",
-                    "content": pdf_content
-                }]
+                """
             }
+            attachments = [{
+                "filename": f"seo-report-{site_url.replace('https://', '').replace('http://', '')}.pdf",
+                "artifact_key": artifact_key
+            }]
             
-            email_response = resend.Emails.send(params)
-            return email_response
+            return outbox.enqueue(params, attachments=attachments, idempotency_key=idempotency_key)
         except Exception as e:
             print(f"Email error: {e}")
             raise
     
     @staticmethod
-    def send_upgrade_notification(email, tier):
+    def send_upgrade_notification(email, tier, idempotency_key=None):
         try:
             params = {
                 "from": "ReportRiser <hello@reportriser.com>",
@@ -169,7 +173,7 @@ class EmailSender:
                 """
             }
             
-            return resend.Emails.send(params)
+            return outbox.enqueue(params, idempotency_key=idempotency_key)
         except Exception as e:
             print(f"Email error: {e}")
             raise
@@ -0,0 +1,229 @@
+"""
+GA4 reporting in one round trip
+
+The GA4 property for a site is found once through the Admin API (the web
+data stream whose URL matches the site's host) and cached. Daily active
+users, conversions and conversion value are synced into the local warehouse
+with one batchRunReports call covering only the days it is missing, and the
+current and previous period are read from there. Without a warehouse, both
+periods come from a single batchRunReports call as well.
+"""
+import os
+import threading
+from datetime import datetime
+from urllib.parse import urlparse
+
+from utils.cache import TTLCache
+from utils.roi_calculator import ROICalculator
+
+GA4_PERIOD_DAYS = 30
+GA4_CONVERSIONS_METRIC = os.getenv('GA4_CONVERSIONS_METRIC', 'keyEvents')
+GA4_VALUE_METRIC = os.getenv('GA4_VALUE_METRIC', 'totalRevenue')
+
+property_cache = TTLCache.from_env('GA4_PROPERTY', ttl=7 * 24 * 3600, max_entries=10000, backend='sqlite')
+
+
+def site_host(site_url):
+    """Bare host of a site URL, without scheme, port or www."""
+    parsed = urlparse(site_url if '://' in site_url else f"https://{site_url}")
+    host = (parsed.hostname or '').lower()
+    return host[4:] if host.startswith('www.') else host
+
+
+def find_property(admin_service, site_url):
+    """properties/<id> whose web stream points at site_url's host, or None"""
+    host = site_host(site_url)
+    request = admin_service.accountSummaries().list(pageSize=200)
+
+    while request is not None:
+        response = request.execute()
+        for account in response.get('accountSummaries', []):
+            for summary in account.get('propertySummaries', []):
+                streams = admin_service.properties().dataStreams().list(parent=summary['property']).execute()
+                for stream in streams.get('dataStreams', []):
+                    uri = stream.get('webStreamData', {}).get('defaultUri', '')
+                    if uri and site_host(uri) == host:
+                        return summary['property']
+        request = admin_service.accountSummaries().list_next(request, response)
+
+    return None
+
+
+def resolve_property(admin_service, cache_key, site_url):
+    """find_property through the shared property cache (keyed per user and host)"""
+    key = f"{cache_key}:{site_host(site_url)}"
+    property_id = property_cache.get(key)
+    if property_id is None:
+        property_id = find_property(admin_service, site_url)
+        if property_id is None:
+            raise LookupError(f"No GA4 property with a web stream for {site_host(site_url)}")
+        property_cache.set(key, property_id)
+    return property_id
+
+
+def batch_request_body(days=GA4_PERIOD_DAYS):
+    # Two windows of `days` complete days each; today is partial and would skew growth
+    current = {'startDate': f'{days}daysAgo', 'endDate': 'yesterday'}
+    previous = {'startDate': f'{days * 2}daysAgo', 'endDate': f'{days + 1}daysAgo'}
+
+    return {
+        'requests': [
+            {
+                'dateRanges': [current],
+                'dimensions': [{'name': 'date'}],
+                'metrics': [{'name': 'activeUsers'}],
+                'orderBys': [{'dimension': {'dimensionName': 'date'}}]
+            },
+            {
+                'dateRanges': [current, previous],
+                'metrics': [
+                    {'name': 'activeUsers'},
+                    {'name': GA4_CONVERSIONS_METRIC},
+                    {'name': GA4_VALUE_METRIC}
+                ]
+            }
+        ]
+    }
+
+
+def _number(value):
+    number = float(value)
+    return int(number) if number.is_integer() else number
+
+
+def parse_batch_response(response):
+    """(analytics_data, conversions_data) from a batchRunReports response"""
+    daily, totals = response['reports']
+
+    traffic_data = []
+    total_users = 0
+    for row in daily.get('rows', []):
+        users = int(row['metricValues'][0]['value'])
+        traffic_data.append({'date': row['dimensionValues'][0]['value'], 'users': users})
+        total_users += users
+
+    # With two date ranges GA4 adds a dateRange dimension: date_range_0 / date_range_1
+    periods = {}
+    for row in totals.get('rows', []):
+        label = row['dimensionValues'][0]['value'] if row.get('dimensionValues') else 'date_range_0'
+        periods[label] = [_number(metric['value']) for metric in row['metricValues']]
+
+    users, conversions, value = periods.get('date_range_0', [0, 0, 0])
+    _, previous_conversions, previous_value = periods.get('date_range_1', [0, 0, 0])
+
+    analytics_data = {
+        'total_users': total_users,
+        'traffic_data': traffic_data
+    }
+    conversions_data = {
+        'conversions': conversions,
+        'conversion_rate': round(conversions / users * 100, 2) if users else 0,
+        'previous_conversions': previous_conversions,
+        'conversion_value': value,
+        'previous_value': previous_value,
+        'revenue': value
+    }
+    return analytics_data, conversions_data
+
+
+def daily_request_body(start, end):
+    """One report of users, conversions and value per day in [start, end]"""
+    return {
+        'requests': [
+            {
+                'dateRanges': [{'startDate': start.isoformat(), 'endDate': end.isoformat()}],
+                'dimensions': [{'name': 'date'}],
+                'metrics': [
+                    {'name': 'activeUsers'},
+                    {'name': GA4_CONVERSIONS_METRIC},
+                    {'name': GA4_VALUE_METRIC}
+                ],
+                'limit': 100000
+            }
+        ]
+    }
+
+
+def fetch_daily(data_service, property_id, start, end):
+    """{date: {'users', 'conversions', 'value'}} for every day in [start, end] with data.
+
+    Traffic, conversions and value come back in one report, so the sync is a
+    single batchRunReports call whatever the range.
+    """
+    response = data_service.properties().batchRunReports(
+        property=property_id,
+        body=daily_request_body(start, end)
+    ).execute()
+
+    days = {}
+    for row in response['reports'][0].get('rows', []):
+        users, conversions, value = [_number(metric['value']) for metric in row['metricValues']]
+        day = datetime.strptime(row['dimensionValues'][0]['value'], '%Y%m%d').date()
+        days[day] = {'users': users, 'conversions': conversions, 'value': value}
+    return days
+
+
+def read_windows(warehouse, site, days=GA4_PERIOD_DAYS):
+    """(analytics_data, conversions_data) for the last `days` days and the `days` before them"""
+    daily, current = warehouse.window(site, 'ga4', days)
+    _, previous = warehouse.window(site, 'ga4', days, offset=days)
+
+    analytics_data = {
+        'total_users': current['users'],
+        'traffic_data': [
+            {'date': day.strftime('%Y%m%d'), 'users': payload.get('users', 0)}
+            for day, payload in sorted(daily.items())
+        ],
+        'previous_users': previous['users'],
+        'growth': ROICalculator.calculate_growth(current['users'], previous['users'])
+    }
+    conversions_data = {
+        'conversions': current['conversions'],
+        'conversion_rate': round(current['conversions'] / current['users'] * 100, 2) if current['users'] else 0,
+        'previous_conversions': previous['conversions'],
+        'conversion_value': current['value'],
+        'previous_value': previous['value'],
+        'revenue': current['value']
+    }
+    return analytics_data, conversions_data
+
+
+class GA4Report:
+    """One GA4 fetch shared by the analytics and conversions fetchers"""
+
+    def __init__(self, data_service, admin_service, cache_key, site_url, warehouse=None):
+        self.data_service = data_service
+        self.admin_service = admin_service
+        self.cache_key = cache_key
+        self.site_url = site_url
+        self.warehouse = warehouse
+        self._lock = threading.Lock()
+        self._result = None
+
+    def _property(self):
+        return resolve_property(self.admin_service, self.cache_key, self.site_url)
+
+    def fetch(self):
+        with self._lock:
+            if self._result is None:
+                if self.warehouse is None:
+                    response = self.data_service.properties().batchRunReports(
+                        property=self._property(),
+                        body=batch_request_body()
+                    ).execute()
+                    self._result = parse_batch_response(response)
+                else:
+                    site = f"{self.cache_key}:{site_host(self.site_url)}"
+                    self.warehouse.sync(
+                        site, 'ga4',
+                        lambda start, end: fetch_daily(self.data_service, self._property(), start, end),
+                        days=GA4_PERIOD_DAYS * 2
+                    )
+                    self._result = read_windows(self.warehouse, site)
+            return self._result
+
+    def analytics(self):
+        return self.fetch()[0]
+
+    def conversions(self):
+        return self.fetch()[1]
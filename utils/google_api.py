@@ -1,9 +1,38 @@
 import os
-from datetime import datetime, timedelta
+import weakref
+from datetime import datetime, timedelta, timezone
 from google.oauth2.credentials import Credentials
 from google_auth_oauthlib.flow import Flow
-from googleapiclient.discovery import build
-import requests
+from googleapiclient.discovery import build_from_document
+from googleapiclient.discovery_cache import get_static_doc
+from google.auth.transport.requests import Request as GoogleAuthRequest
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+import threading
+from utils.http_client import http_client
+from utils.cwv import CWVAnalyzer, PSI_ENDPOINT
+from utils.psi_governor import psi_governor
+from utils.repository import GoogleTokensRepo
+from utils.ga4 import GA4Report, site_host
+from utils.search_console import fetch_daily_totals, search_data_from_totals
+from utils.warehouse import warehouse, SEARCH_KEYS_PER_DAY, SEARCH_SYNC_MAX_DAYS
+
+# Discovery documents bundled with google-api-python-client, read once per process
+_discovery_docs = {}
+_discovery_lock = threading.Lock()
+
+# Built service objects per thread (httplib2 is not thread-safe), keyed by API/version/user
+_services = threading.local()
+MAX_SERVICES_PER_THREAD = 32
+
+# Per-user credentials shared by every request/job in the process
+_credentials = {}
+_credentials_lock = threading.Lock()
+# Held only while a user's credentials load/refresh; dropped once nobody holds them
+_refresh_locks = weakref.WeakValueDictionary()
+_token_writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix='token-writer')
+CREDENTIAL_SAFETY_MARGIN = timedelta(minutes=5)
+
 
 class GoogleAPIClient:
     SCOPES = [
@@ -11,6 +40,43 @@ class GoogleAPIClient:
         'https://www.googleapis.com/auth/webmasters.readonly'
     ]
     
+    @staticmethod
+    def get_discovery_document(api, version):
+        """Static discovery document for api/version (no network)"""
+        key = (api, version)
+        with _discovery_lock:
+            if key not in _discovery_docs:
+                doc = get_static_doc(api, version)
+                if doc is None:
+                    raise ValueError(f"No bundled discovery document for {api} {version}")
+                _discovery_docs[key] = doc
+            return _discovery_docs[key]
+    
+    @staticmethod
+    def build_service(api, version, credentials, cache_key):
+        """Return a cached service object for (api, version, cache_key), building it on first use"""
+        cache = getattr(_services, 'cache', None)
+        if cache is None:
+            cache = _services.cache = OrderedDict()
+        
+        key = (api, version, cache_key)
+        cached = cache.get(key)
+        # Rebuild if the caller now holds a different credentials object
+        if cached is not None and cached[0] is credentials:
+            cache.move_to_end(key)
+            return cached[1]
+        
+        service = build_from_document(
+            GoogleAPIClient.get_discovery_document(api, version),
+            credentials=credentials
+        )
+        cache[key] = (credentials, service)
+        cache.move_to_end(key)
+        while len(cache) > MAX_SERVICES_PER_THREAD:
+            cache.popitem(last=False)
+        
+        return service
+    
     @staticmethod
     def get_auth_url(user_id):
         flow = Flow.from_client_config(
@@ -53,20 +119,79 @@ class GoogleAPIClient:
         )
         
         flow.fetch_token(code=code)
-        return flow.credentials.to_json()
+        creds = flow.credentials
+        # The shape /google-callback stores in google_tokens (expiry is naive UTC)
+        return {
+            'access_token': creds.token,
+            'refresh_token': creds.refresh_token,
+            'expires_in': int((creds.expiry - datetime.utcnow()).total_seconds()) if creds.expiry else 3600
+        }
     
-    def __init__(self, user_id, supabase):
+    def __init__(self, user_id):
         self.user_id = user_id
-        self.supabase = supabase
         self.credentials = self._get_credentials()
+        self._ga4_reports = {}
+        self._ga4_lock = threading.Lock()
+    
+    @staticmethod
+    def invalidate_credentials(user_id):
+        """Drop cached credentials (e.g. after the user reconnects Google)"""
+        with _credentials_lock:
+            _credentials.pop(user_id, None)
+    
+    @staticmethod
+    def _refresh_lock(user_id):
+        with _credentials_lock:
+            lock = _refresh_locks.get(user_id)
+            if lock is None:
+                lock = _refresh_locks[user_id] = threading.Lock()
+            return lock
+    
+    @staticmethod
+    def _local_expiry(creds):
+        """creds.expiry (naive UTC, as google-auth sets it) as naive local time, like expires_at"""
+        if creds.expiry is None:
+            return datetime.now() + timedelta(seconds=3600)
+        return creds.expiry.replace(tzinfo=timezone.utc).astimezone().replace(tzinfo=None)
+    
+    @staticmethod
+    def _is_fresh(entry):
+        return entry is not None and entry['expires_at'] - CREDENTIAL_SAFETY_MARGIN > datetime.now()
     
     def _get_credentials(self):
-        token_data = self.supabase.table('google_tokens').select('*').eq('user_id', self.user_id).execute()
+        entry = _credentials.get(self.user_id)
+        if GoogleAPIClient._is_fresh(entry):
+            return entry['credentials']
         
-        if not token_data.data:
-            raise Exception("No Google tokens found")
+        # Single-flight: one thread per user loads/refreshes, the rest wait and reuse it
+        with GoogleAPIClient._refresh_lock(self.user_id):
+            entry = _credentials.get(self.user_id)
+            if GoogleAPIClient._is_fresh(entry):
+                return entry['credentials']
+            
+            if entry is None:
+                entry = self._load_credentials()
+            
+            if not GoogleAPIClient._is_fresh(entry):
+                creds = entry['credentials']
+                creds.refresh(GoogleAuthRequest(session=http_client.session))
+                entry = {
+                    'credentials': creds,
+                    'expires_at': GoogleAPIClient._local_expiry(creds)
+                }
+                # Write-behind: persist the new token without blocking the report
+                _token_writer.submit(self._save_token, creds.token, entry['expires_at'])
+            
+            with _credentials_lock:
+                _credentials[self.user_id] = entry
+            
+            return entry['credentials']
+    
+    def _load_credentials(self):
+        token = GoogleTokensRepo.get(self.user_id)
         
-        token = token_data.data[0]
+        if not token:
+            raise Exception("No Google tokens found")
         
         creds = Credentials(
             token=token['access_token'],
@@ -76,98 +201,85 @@ class GoogleAPIClient:
             client_secret=os.getenv('GOOGLE_CLIENT_SECRET')
         )
         
-        # Refresh if expired
-        if datetime.fromisoformat(token['expires_at']) < datetime.now():
-            creds.refresh(requests.Request())
-            
-            self.supabase.table('google_tokens').update({
-                'access_token': creds.token,
-                'expires_at': (datetime.now() + timedelta(seconds=3600)).isoformat()
-            }).eq('user_id', self.user_id).execute()
-        
-        return creds
+        return {
+            'credentials': creds,
+            'expires_at': datetime.fromisoformat(token['expires_at']).astimezone().replace(tzinfo=None)
+        }
+    
+    def _save_token(self, access_token, expires_at):
+        try:
+            GoogleTokensRepo.update(self.user_id, {
+                'access_token': access_token,
+                'expires_at': expires_at.isoformat()
+            })
+        except Exception as e:
+            print(f"Token save error: {e}")
+    
+    def ga4_report(self, site_url):
+        """Shared GA4Report for site_url: property lookup + one batchRunReports call"""
+        # The analytics and conversions fetchers run concurrently; both must get the same report
+        with self._ga4_lock:
+            if site_url not in self._ga4_reports:
+                self._ga4_reports[site_url] = GA4Report(
+                    GoogleAPIClient.build_service('analyticsdata', 'v1beta', self.credentials, self.user_id),
+                    GoogleAPIClient.build_service('analyticsadmin', 'v1beta', self.credentials, self.user_id),
+                    self.user_id,
+                    site_url,
+                    warehouse=warehouse
+                )
+            return self._ga4_reports[site_url]
     
     def get_analytics_data(self, site_url):
         try:
-            service = build('analyticsdata', 'v1beta', credentials=self.credentials)
-            
-            # Get property ID (simplified - in production, store this per site)
-            property_id = 'properties/YOUR_PROPERTY_ID'
-            
-            response = service.properties().runReport(
-                property=property_id,
-                body={
-                    'dateRanges': [{'startDate': '30daysAgo', 'endDate': 'today'}],
-                    'dimensions': [{'name': 'date'}],
-                    'metrics': [{'name': 'activeUsers'}]
-                }
-            ).execute()
-            
-            # Parse response
-            traffic_data = []
-            total_users = 0
-            
-            for row in response.get('rows', []):
-                date = row['dimensionValues'][0]['value']
-                users = int(row['metricValues'][0]['value'])
-                traffic_data.append({'date': date, 'users': users})
-                total_users += users
-            
-            return {
-                'total_users': total_users,
-                'traffic_data': traffic_data
-            }
+            return self.ga4_report(site_url).analytics()
         except Exception as e:
             print(f"Analytics error: {e}")
             raise
     
+    def get_conversions_data(self, site_url):
+        try:
+            return self.ga4_report(site_url).conversions()
+        except Exception as e:
+            print(f"Conversions error: {e}")
+            raise
+    
     def get_search_console_data(self, site_url):
         try:
-            service = build('searchconsole', 'v1', credentials=self.credentials)
-            
-            response = service.searchanalytics().query(
-                siteUrl=site_url,
-                body={
-                    'startDate': (datetime.now() - timedelta(days=30)).strftime('%Y-%m-%d'),
-                    'endDate': datetime.now().strftime('%Y-%m-%d'),
-                    'dimensions': ['query', 'page'],
-                    'rowLimit': 10
-                }
-            ).execute()
+            service = GoogleAPIClient.build_service('searchconsole', 'v1', self.credentials, self.user_id)
             
-            top_keywords = []
-            top_pages = []
-            
-            for row in response.get('rows', [])[:5]:
-                top_keywords.append({
-                    'keyword': row['keys'][0],
-                    'clicks': row['clicks'],
-                    'impressions': row['impressions'],
-                    'ctr': round(row['ctr'] * 100, 2),
-                    'position': round(row['position'], 1)
-                })
-            
-            for row in response.get('rows', [])[:10]:
-                if len(row['keys']) > 1:
-                    top_pages.append({
-                        'page': row['keys'][1],
-                        'clicks': row['clicks']
-                    })
-            
-            return {
-                'top_keywords': top_keywords,
-                'top_pages': top_pages[:10]
-            }
+            # Only the days missing from the warehouse are fetched (paged, aggregated per day),
+            # at most SEARCH_SYNC_MAX_DAYS of them per report; later reports fill the rest
+            site = f"{self.user_id}:{site_host(site_url)}"
+            warehouse.sync(
+                site, 'search',
+                lambda start, end: fetch_daily_totals(service, site_url, start, end, SEARCH_KEYS_PER_DAY),
+                days=30,
+                max_days=SEARCH_SYNC_MAX_DAYS
+            )
+            daily, totals = warehouse.window(site, 'search', 30)
+            return search_data_from_totals(totals, days=len(daily))
         except Exception as e:
             print(f"Search Console error: {e}")
             raise
     
+    def get_report_fetchers(self, site_url):
+        """Independent fetch callables for utils.data_sources.gather (see utils.report_pipeline)"""
+        return {
+            'analytics': lambda: self.get_analytics_data(site_url),
+            'search': lambda: self.get_search_console_data(site_url),
+            'conversions': lambda: self.get_conversions_data(site_url),
+            'cwv': lambda: CWVAnalyzer.get_cwv_data(site_url, fallback=False)
+        }
+    
     def get_pagespeed_data(self, site_url):
         try:
             api_key = os.getenv('GOOGLE_PAGESPEED_API_KEY')
-            url = f"https://www.googleapis.com/pagespeedonline/v5/runPagespeed?url={site_url}&key={api_key}"
             
-            response = requests.get(url).json()
+            response = psi_governor.get(
+                PSI_ENDPOINT,
+                params={'url': site_url, 'key': api_key},
+                timeout=(5, 30)
+            ).json()
             
             lighthouse = response['lighthouseResult']['categories']
             
@@ -0,0 +1,123 @@
+"""
+Shared outbound HTTP client: pooled keep-alive connections, bounded retries
+with jittered exponential backoff, consistent timeouts and per-host stats
+"""
+import os
+import random
+import threading
+import time
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+IDEMPOTENT_METHODS = {'GET', 'HEAD', 'OPTIONS'}
+
+# (connect, read) seconds
+DEFAULT_TIMEOUT = (5, 30)
+
+
+class HTTPClient:
+
+    def __init__(self, pool_connections=None, pool_maxsize=None, max_retries=None,
+                 backoff_base=None, backoff_cap=8.0, timeout=DEFAULT_TIMEOUT):
+        self.pool_connections = pool_connections or int(os.getenv('HTTP_POOL_CONNECTIONS', 10))
+        self.pool_maxsize = pool_maxsize or int(os.getenv('HTTP_POOL_MAXSIZE', 20))
+        self.max_retries = int(os.getenv('HTTP_MAX_RETRIES', 3)) if max_retries is None else max_retries
+        self.backoff_base = backoff_base or float(os.getenv('HTTP_BACKOFF_BASE', 0.5))
+        self.backoff_cap = backoff_cap
+        self.timeout = timeout
+
+        # One adapter keeps a keep-alive pool per host (up to pool_connections hosts)
+        self.adapter = HTTPAdapter(
+            pool_connections=self.pool_connections,
+            pool_maxsize=self.pool_maxsize,
+            max_retries=0
+        )
+        self.session = requests.Session()
+        self.session.mount('https://', self.adapter)
+        self.session.mount('http://', self.adapter)
+
+        self._stats = {}
+        self._lock = threading.Lock()
+
+    def _count(self, host, field):
+        with self._lock:
+            host_stats = self._stats.setdefault(host, {'requests': 0, 'retries': 0, 'errors': 0})
+            host_stats[field] += 1
+
+    def backoff(self, attempt, retry_after=None):
+        """Full-jitter exponential backoff, honoring a numeric Retry-After"""
+        delay = random.uniform(0, min(self.backoff_cap, self.backoff_base * (2 ** attempt)))
+        if retry_after and retry_after.isdigit():
+            delay = max(delay, min(float(retry_after), self.backoff_cap))
+        return delay
+
+    def request(self, method, url, retry=None, **kwargs):
+        """Send a request through the shared pool.
+
+        Connection failures and 429/5xx responses are retried up to
+        max_retries times (idempotent methods only unless retry=True).
+        Read timeouts are not retried.
+        """
+        method = method.upper()
+        host = urlsplit(url).netloc
+        kwargs.setdefault('timeout', self.timeout)
+
+        if retry is None:
+            retry = method in IDEMPOTENT_METHODS
+        attempts = self.max_retries + 1 if retry else 1
+
+        for attempt in range(attempts):
+            last_attempt = attempt == attempts - 1
+            self._count(host, 'requests')
+
+            try:
+                response = self.session.request(method, url, **kwargs)
+            except requests.ConnectionError:
+                if last_attempt:
+                    self._count(host, 'errors')
+                    raise
+                self._count(host, 'retries')
+                time.sleep(self.backoff(attempt))
+                continue
+            except requests.RequestException:
+                self._count(host, 'errors')
+                raise
+
+            if response.status_code in RETRY_STATUSES and not last_attempt:
+                retry_after = response.headers.get('Retry-After')
+                response.close()
+                self._count(host, 'retries')
+                time.sleep(self.backoff(attempt, retry_after))
+                continue
+
+            return response
+
+    def get(self, url, **kwargs):
+        return self.request('GET', url, **kwargs)
+
+    def post(self, url, **kwargs):
+        return self.request('POST', url, **kwargs)
+
+    def stats(self):
+        """Per-host request/retry counters plus urllib3 connection reuse"""
+        with self._lock:
+            stats = {host: dict(values) for host, values in self._stats.items()}
+
+        pools = self.adapter.poolmanager.pools
+        for key in list(pools.keys()):
+            pool = pools.get(key)
+            if pool is None:
+                continue
+            host = key.key_host if key.key_port in (None, 80, 443) else f"{key.key_host}:{key.key_port}"
+            host_stats = stats.setdefault(host, {'requests': 0, 'retries': 0, 'errors': 0})
+            host_stats['connections_opened'] = host_stats.get('connections_opened', 0) + pool.num_connections
+            host_stats['connections_reused'] = host_stats.get('connections_reused', 0) + max(pool.num_requests - pool.num_connections, 0)
+
+        return stats
+
+
+# Shared by every outbound call in the process
+http_client = HTTPClient()
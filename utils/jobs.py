@@ -0,0 +1,244 @@
+"""
+Background job queue for long-running work (report generation)
+
+Job records live in Supabase (report_jobs) so a status poll can land on
+any instance. Where the work runs depends on JOB_RUNNER:
+
+    inline  (default) run in the submitting request, which on a serverless
+            host is the only place the work is guaranteed to keep running
+    worker  leave the job queued for a worker process:
+            python -m utils.jobs
+
+A job whose record hasn't been touched for JOB_STALE_SECONDS (its process
+died or was frozen mid-run) is failed by the next status poll or worker pass.
+"""
+import argparse
+import importlib
+import math
+import os
+import re
+import time
+import traceback
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+from utils.repository import JobsRepo
+
+JOB_RUNNER = os.getenv('JOB_RUNNER', 'inline')
+JOB_WORKERS = int(os.getenv('JOB_WORKERS', 2))
+JOB_POLL_INTERVAL = float(os.getenv('JOB_POLL_INTERVAL', 2))
+JOB_STALE_SECONDS = float(os.getenv('JOB_STALE_SECONDS', 10 * 60))
+JOB_SAVE_INTERVAL = 1.0
+JOB_MAX_AGE = 24 * 3600
+
+# kind -> "module:function" called as fn(job, user_id=..., **params); resolved lazily so
+# the web app doesn't import the pipeline until a job runs
+JOB_HANDLERS = {
+    'report': 'utils.report_pipeline:report_job'
+}
+
+JOB_ID_PATTERN = re.compile(r'^[0-9a-f]{32}$')
+
+
+def percentile(values, pct):
+    """Nearest-rank percentile of values (0.0 when empty)"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, math.ceil(pct / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+class StageTimer:
+    """Collects wall-clock timings for named pipeline stages"""
+
+    def __init__(self):
+        self.stages = []
+
+    @contextmanager
+    def stage(self, name):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record_stage(name, time.perf_counter() - started)
+
+    def record_stage(self, name, seconds):
+        self.stages.append({'name': name, 'seconds': round(seconds, 3)})
+        self.on_stage()
+
+    def on_stage(self):
+        pass
+
+
+class Job(StageTimer):
+    """A single queued unit of work and its persisted status record"""
+
+    def __init__(self, queue, record):
+        super().__init__()
+        self.queue = queue
+        self.record = record
+
+    @property
+    def id(self):
+        return self.record['id']
+
+    def on_stage(self):
+        self.record['stages'] = list(self.stages)
+        # Progress and the liveness heartbeat, at most one write per JOB_SAVE_INTERVAL
+        if time.time() - self.record['updated_at'] >= JOB_SAVE_INTERVAL:
+            self.queue.save(self.record, ('stages',))
+
+
+class JobQueue:
+
+    def __init__(self, runner=None, max_workers=JOB_WORKERS, max_age=JOB_MAX_AGE, stale_after=JOB_STALE_SECONDS):
+        self.runner = runner or JOB_RUNNER
+        self.max_workers = max_workers
+        self.max_age = max_age
+        self.stale_after = stale_after
+        self._pruned_at = 0
+
+    def save(self, record, fields):
+        """Write fields of record, marking the job as alive"""
+        record['updated_at'] = time.time()
+        JobsRepo.update(record['id'], {**{name: record[name] for name in fields}, 'updated_at': record['updated_at']})
+
+    def get(self, job_id):
+        if not JOB_ID_PATTERN.match(job_id or ''):
+            return None
+        record = JobsRepo.get(job_id)
+        if record and record['status'] in ('queued', 'running') and self._is_stale(record):
+            # Conditional on the status we read, so a job finishing right now wins
+            error = 'Job stopped responding'
+            if JobsRepo.update(job_id, {'status': 'failed', 'error': error, 'finished_at': time.time()},
+                               status=record['status']):
+                print(f"❌ Job {job_id} failed: {error}")
+            record = JobsRepo.get(job_id)
+        return record
+
+    def _is_stale(self, record):
+        return time.time() - record['updated_at'] > self.stale_after
+
+    def submit(self, kind, user_id, **params):
+        """Create a job for JOB_HANDLERS[kind](job, **params) and return its id.
+
+        Runs it before returning when runner is 'inline'.
+        """
+        if kind not in JOB_HANDLERS:
+            raise ValueError(f"unknown job kind: {kind}")
+        now = time.time()
+        record = {
+            'id': uuid.uuid4().hex,
+            'kind': kind,
+            'user_id': user_id,
+            'status': 'queued',
+            'params': params,
+            'stages': [],
+            'result': None,
+            'error': None,
+            'created_at': now,
+            'updated_at': now,
+            'started_at': None,
+            'finished_at': None
+        }
+        if self.runner == 'inline':
+            # Created already claimed: no worker will look at it
+            record.update(status='running', started_at=now)
+            JobsRepo.insert(record)
+            self._execute(record)
+        else:
+            JobsRepo.insert(record)
+        return record['id']
+
+    def _claim(self, record):
+        record['status'] = 'running'
+        record['started_at'] = record['updated_at'] = time.time()
+        return JobsRepo.update(record['id'], {
+            'status': 'running', 'started_at': record['started_at'], 'updated_at': record['updated_at']
+        }, status='queued')
+
+    def _run(self, record):
+        """Claim and run one queued job; False if another process took it first"""
+        if not self._claim(record):
+            return False
+        self._execute(record)
+        return True
+
+    def _execute(self, record):
+        try:
+            module, name = JOB_HANDLERS[record['kind']].split(':')
+            fn = getattr(importlib.import_module(module), name)
+            record['result'] = fn(Job(self, record), user_id=record['user_id'], **record['params'])
+            record['status'] = 'done'
+        except Exception as e:
+            print(f"❌ Job {record['id']} failed: {e}")
+            traceback.print_exc()
+            record['status'] = 'failed'
+            record['error'] = str(e)
+
+        record['finished_at'] = time.time()
+        self.save(record, ('status', 'result', 'error', 'finished_at', 'stages'))
+
+    def fail_stale(self):
+        failed = JobsRepo.fail_stale(time.time() - self.stale_after, 'Job stopped responding')
+        for job_id in failed:
+            print(f"❌ Job {job_id} failed: stopped responding")
+        return len(failed)
+
+    def prune(self):
+        """Remove job records older than max_age"""
+        JobsRepo.prune(time.time() - self.max_age)
+
+    def work(self, once=False, poll_interval=JOB_POLL_INTERVAL):
+        """Run queued jobs, max_workers at a time (the JOB_RUNNER=worker process)"""
+        in_flight = set()
+        with ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='job') as pool:
+            while True:
+                try:
+                    if time.time() - self._pruned_at > 3600:
+                        self.prune()
+                        self._pruned_at = time.time()
+                    self.fail_stale()
+
+                    in_flight = {future for future in in_flight if not future.done()}
+                    free = self.max_workers - len(in_flight)
+                    queued = JobsRepo.queued(free) if free > 0 else []
+                except Exception as e:
+                    print(f"Job worker error: {e}")
+                    queued = []
+
+                for record in queued:
+                    in_flight.add(pool.submit(self._run, record))
+
+                if once and not queued and not in_flight:
+                    break
+                time.sleep(0.1 if queued else poll_interval)
+
+    @staticmethod
+    def public_status(record):
+        """Job fields safe to return to the browser"""
+        return {
+            'id': record['id'],
+            'status': record['status'],
+            'stages': record['stages'],
+            'error': record['error'],
+            'traffic_summary': (record['result'] or {}).get('traffic_summary'),
+            'queued_seconds': round((record['started_at'] or time.time()) - record['created_at'], 3),
+            'total_seconds': round(record['finished_at'] - record['created_at'], 3) if record['finished_at'] else None
+        }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Background job worker')
+    parser.add_argument('--once', action='store_true', help='run every queued job, then exit')
+    parser.add_argument('--workers', type=int, default=JOB_WORKERS)
+    args = parser.parse_args()
+
+    print(f"🛠️ Job worker running ({args.workers} at a time)")
+    JobQueue(runner='worker', max_workers=args.workers).work(once=args.once)
+
+
+if __name__ == '__main__':
+    main()
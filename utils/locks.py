@@ -0,0 +1,77 @@
+"""
+Coordination helpers: in-process single-flight and cross-process file locks
+"""
+import fcntl
+import hashlib
+import os
+import tempfile
+import threading
+import time
+from concurrent.futures import Future
+from contextlib import contextmanager
+
+LOCK_DIR = os.getenv('LOCK_DIR', os.path.join(tempfile.gettempdir(), 'reportriser_locks'))
+
+
+class SingleFlight:
+    """Coalesce concurrent calls for the same key onto one execution"""
+
+    def __init__(self):
+        self._flights = {}
+        self._lock = threading.Lock()
+
+    def do(self, key, fn):
+        with self._lock:
+            future = self._flights.get(key)
+            leader = future is None
+            if leader:
+                future = self._flights[key] = Future()
+
+        if not leader:
+            return future.result()
+
+        try:
+            future.set_result(fn())
+        except BaseException as e:
+            future.set_exception(e)
+        finally:
+            with self._lock:
+                self._flights.pop(key, None)
+
+        return future.result()
+
+    def in_flight(self, key):
+        with self._lock:
+            return key in self._flights
+
+
+@contextmanager
+def file_lock(name, timeout=None):
+    """Exclusive flock shared by every process on the host.
+
+    With a timeout, gives up waiting after that many seconds and raises
+    TimeoutError.
+    """
+    os.makedirs(LOCK_DIR, exist_ok=True)
+    path = os.path.join(LOCK_DIR, hashlib.sha1(name.encode()).hexdigest() + '.lock')
+    fd = os.open(path, os.O_CREAT | os.O_RDWR, 0o600)
+
+    try:
+        if timeout is None:
+            fcntl.flock(fd, fcntl.LOCK_EX)
+        else:
+            deadline = time.monotonic() + timeout
+            while True:
+                try:
+                    fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                    break
+                except BlockingIOError:
+                    if time.monotonic() >= deadline:
+                        raise TimeoutError(f"Timed out waiting for lock '{name}'")
+                    time.sleep(0.05)
+        try:
+            yield
+        finally:
+            fcntl.flock(fd, fcntl.LOCK_UN)
+    finally:
+        os.close(fd)
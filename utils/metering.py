@@ -0,0 +1,63 @@
+"""
+Report quota metering
+
+Usage is counted per user and calendar month (YYYY-MM) in Supabase, in
+users.reports_used / users.reports_period, so every app instance enforces
+the same count. A report reserves a unit before it is queued with one
+conditional increment (reserve_report_quota: reports_used + units <= limit,
+reset at the start of a month) and the unit is refunded if the job fails.
+Reservations nobody commits or refunds within METER_RESERVATION_TTL (a
+crashed job) are refunded on the user's next reserve, and for everyone by
+expire_reservations. The functions live in
+supabase/migrations/20261017090000_report_quota.sql.
+"""
+import os
+from datetime import datetime
+
+from utils.repository import QuotaRepo, UsersRepo
+
+METER_RESERVATION_TTL = float(os.getenv('METER_RESERVATION_TTL', 3600))
+
+
+def current_period(now=None):
+    return (now or datetime.now()).strftime('%Y-%m')
+
+
+class QuotaMeter:
+
+    def reserve(self, user_id, limit, units=1):
+        """Atomically take units from this month's quota. Returns a reservation id, or None if over limit.
+
+        Raises if Supabase can't be reached.
+        """
+        return QuotaRepo.reserve(user_id, current_period(), limit, units, METER_RESERVATION_TTL)
+
+    def commit(self, reservation_id):
+        """Mark a reservation as consumed (the report was delivered)"""
+        QuotaRepo.commit(reservation_id)
+
+    def refund(self, reservation_id, status='refunded'):
+        """Give a reserved unit back; a no-op if already committed or refunded"""
+        return QuotaRepo.refund(reservation_id, status)
+
+    def expire_reservations(self, ttl=None):
+        """Refund reservations left 'reserved' for longer than ttl seconds (their job died)"""
+        return QuotaRepo.expire(METER_RESERVATION_TTL if ttl is None else ttl)
+
+    def usage(self, user_id, period=None):
+        try:
+            row = UsersRepo.get_live(user_id)
+        except Exception as e:
+            print(f"Quota usage load error: {e}")
+            return 0
+        return self.period_usage(row, period)
+
+    @staticmethod
+    def period_usage(row, period=None):
+        """reports_used from a UsersRepo.get_live row, or 0 if it counts an earlier month"""
+        if not row or row.get('reports_period') != (period or current_period()):
+            return 0
+        return row.get('reports_used') or 0
+
+
+quota_meter = QuotaMeter()
@@ -0,0 +1,428 @@
+"""
+Persistent email outbox
+
+Routes enqueue messages into SQLite (shared by every worker on the host) and
+return immediately; a background sender drains due messages through the
+provider's batch endpoint where it can (messages without attachments, up to
+OUTBOX_BATCH_SIZE per call) and one by one otherwise. Each message carries an
+idempotency key: enqueueing the same key twice is a no-op and the key is sent
+to the provider so a retried request is not delivered twice. A batch is
+pinned when it is formed (same members, same key) and retried as one unit,
+so a batch whose response was lost is replayed rather than re-sent. Failures
+are retried with jittered exponential backoff; permanent failures, and
+messages that run out of attempts, are kept as dead letters for inspection
+and requeue.
+
+The background sender only runs while its process does. On serverless hosts
+(Vercel freezes the instance once the response is sent), anything that must
+go out now, like the login link, is sent inline with send_now() and the
+outbox only holds it for retries.
+
+Attachments are stored as artifact-store keys and only read when the message
+is actually sent, so nothing is copied into the outbox.
+
+    python -m utils.outbox            # run the sender in the foreground
+    python -m utils.outbox --dead     # list dead letters
+    python -m utils.outbox --requeue  # retry every dead letter
+"""
+import argparse
+import atexit
+import base64
+import hashlib
+import json
+import os
+import random
+import sqlite3
+import threading
+import time
+import uuid
+
+from utils.artifact_store import artifact_store
+from utils.cache import DEFAULT_CACHE_PATH
+from utils.http_client import http_client
+
+OUTBOX_BATCH_SIZE = int(os.getenv('OUTBOX_BATCH_SIZE', 100))  # Resend batch limit
+OUTBOX_MAX_ATTEMPTS = int(os.getenv('OUTBOX_MAX_ATTEMPTS', 8))
+OUTBOX_BACKOFF_BASE = float(os.getenv('OUTBOX_BACKOFF_BASE', 30))
+OUTBOX_BACKOFF_CAP = float(os.getenv('OUTBOX_BACKOFF_CAP', 3600))
+OUTBOX_POLL_INTERVAL = float(os.getenv('OUTBOX_POLL_INTERVAL', 2))
+OUTBOX_LEASE = float(os.getenv('OUTBOX_LEASE', 120))
+OUTBOX_KEEP_DAYS = int(os.getenv('OUTBOX_KEEP_DAYS', 14))
+
+CLAIM_COLUMNS = "id, idempotency_key, message, attachments, attempts, batch_key"
+
+# 4xx responses worth retrying; anything else in 4xx will never succeed
+TRANSIENT_CLIENT_STATUSES = {408, 409, 429}
+
+
+class PermanentSendError(Exception):
+    """The provider rejected the message; retrying will not help"""
+
+
+class ResendProvider:
+    """Resend HTTP API (single and batch sends) with Idempotency-Key headers"""
+
+    def __init__(self, api_key=None, api_url=None):
+        self.api_key = api_key
+        self.api_url = (api_url or os.getenv('RESEND_API_URL', 'https://api.resend.com')).rstrip('/')
+
+    def _post(self, path, body, idempotency_key):
+        response = http_client.post(
+            f"{self.api_url}{path}",
+            json=body,
+            # Key read per call so a .env loaded after import still applies
+            headers={
+                'Authorization': f"Bearer {self.api_key or os.getenv('RESEND_API_KEY')}",
+                'Idempotency-Key': idempotency_key
+            },
+            retry=False
+        )
+        if response.status_code >= 400:
+            message = f"{response.status_code} {response.text[:500]}"
+            if response.status_code < 500 and response.status_code not in TRANSIENT_CLIENT_STATUSES:
+                raise PermanentSendError(message)
+            raise RuntimeError(message)
+        return response.json()
+
+    def send(self, message, idempotency_key):
+        return self._post('/emails', message, idempotency_key).get('id')
+
+    def send_batch(self, messages, idempotency_key):
+        """Provider ids in the same order as messages"""
+        return [item.get('id') for item in self._post('/emails/batch', messages, idempotency_key).get('data', [])]
+
+
+def _backoff(attempts):
+    delay = min(OUTBOX_BACKOFF_CAP, OUTBOX_BACKOFF_BASE * (2 ** (attempts - 1)))
+    return random.uniform(delay / 2, delay)
+
+
+class Outbox:
+
+    def __init__(self, path=None, provider=None, poll_interval=OUTBOX_POLL_INTERVAL):
+        self.path = path or os.getenv('OUTBOX_PATH', DEFAULT_CACHE_PATH)
+        self.provider = provider or ResendProvider()
+        self.poll_interval = poll_interval
+        self._local = threading.local()
+        self._wake = threading.Event()
+        self._sender = None
+        self._sender_lock = threading.Lock()
+        self._pruned_at = 0
+        with self._conn() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS email_outbox ("
+                "id INTEGER PRIMARY KEY AUTOINCREMENT, idempotency_key TEXT NOT NULL UNIQUE, "
+                "message TEXT NOT NULL, attachments TEXT, status TEXT NOT NULL, "
+                "attempts INTEGER NOT NULL DEFAULT 0, next_attempt_at REAL NOT NULL, last_error TEXT, "
+                "provider_id TEXT, created_at REAL NOT NULL, sent_at REAL, batch_key TEXT)"
+            )
+            if 'batch_key' not in [column[1] for column in conn.execute("PRAGMA table_info(email_outbox)")]:
+                conn.execute("ALTER TABLE email_outbox ADD COLUMN batch_key TEXT")
+            conn.execute(
+                "CREATE INDEX IF NOT EXISTS email_outbox_due ON email_outbox (status, next_attempt_at)"
+            )
+            conn.execute(
+                "CREATE INDEX IF NOT EXISTS email_outbox_batch ON email_outbox (batch_key) WHERE batch_key IS NOT NULL"
+            )
+
+    def _conn(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            self._local.conn = conn
+        return conn
+
+    def enqueue(self, message, attachments=None, idempotency_key=None):
+        """Queue message (Resend params) for delivery and return its idempotency key.
+
+        attachments is a list of {'filename', 'artifact_key'}; the artifact is
+        read from the store when the message is sent.
+        """
+        idempotency_key = idempotency_key or uuid.uuid4().hex
+        now = time.time()
+        self._conn().execute(
+            "INSERT OR IGNORE INTO email_outbox "
+            "(idempotency_key, message, attachments, status, next_attempt_at, created_at) "
+            "VALUES (?, ?, ?, 'pending', ?, ?)",
+            (idempotency_key, json.dumps(message), json.dumps(attachments) if attachments else None, now, now)
+        )
+        self._ensure_sender()
+        self._wake.set()
+        return idempotency_key
+
+    def _claim(self, limit, idempotency_key=None):
+        """Lease up to limit due messages (or the one with idempotency_key) to this sender.
+
+        A pinned batch is always claimed whole, even if that goes past limit.
+        """
+        now = time.time()
+        conn = self._conn()
+        with conn:
+            conn.execute('BEGIN IMMEDIATE')
+            # 'sending' rows whose lease ran out belong to a sender that died mid-send
+            if idempotency_key is None:
+                rows = conn.execute(
+                    f"SELECT {CLAIM_COLUMNS} FROM email_outbox "
+                    "WHERE status IN ('pending', 'sending') AND next_attempt_at <= ? "
+                    "ORDER BY next_attempt_at LIMIT ?",
+                    (now, limit)
+                ).fetchall()
+            else:
+                rows = conn.execute(
+                    f"SELECT {CLAIM_COLUMNS} FROM email_outbox "
+                    "WHERE idempotency_key = ? AND status IN ('pending', 'sending') AND next_attempt_at <= ?",
+                    (idempotency_key, now)
+                ).fetchall()
+            claimed = {row[0] for row in rows}
+            for batch_key in {row[5] for row in rows if row[5]}:
+                for row in conn.execute(
+                    f"SELECT {CLAIM_COLUMNS} FROM email_outbox "
+                    "WHERE batch_key = ? AND status IN ('pending', 'sending') AND next_attempt_at <= ?",
+                    (batch_key, now)
+                ):
+                    if row[0] not in claimed:
+                        claimed.add(row[0])
+                        rows.append(row)
+            conn.executemany(
+                "UPDATE email_outbox SET status = 'sending', attempts = attempts + 1, next_attempt_at = ? WHERE id = ?",
+                [(now + OUTBOX_LEASE, row[0]) for row in rows]
+            )
+        return [
+            {
+                'id': row[0],
+                'idempotency_key': row[1],
+                'message': json.loads(row[2]),
+                'attachments': json.loads(row[3]) if row[3] else None,
+                'attempts': row[4] + 1,
+                'batch_key': row[5]
+            }
+            for row in rows
+        ]
+
+    def _sent(self, entry, provider_id):
+        self._conn().execute(
+            "UPDATE email_outbox SET status = 'sent', provider_id = ?, sent_at = ?, last_error = NULL WHERE id = ?",
+            (provider_id, time.time(), entry['id'])
+        )
+
+    def _failed(self, entry, error, permanent=False, next_attempt_at=None):
+        dead = permanent or entry['attempts'] >= OUTBOX_MAX_ATTEMPTS
+        print(f"Email {'dead-lettered' if dead else 'send error'} ({entry['idempotency_key']}): {error}")
+        if next_attempt_at is None:
+            next_attempt_at = time.time() + (0 if dead else _backoff(entry['attempts']))
+        self._conn().execute(
+            "UPDATE email_outbox SET status = ?, next_attempt_at = ?, last_error = ? WHERE id = ?",
+            ('dead' if dead else 'pending', next_attempt_at, str(error)[:1000], entry['id'])
+        )
+
+    @staticmethod
+    def _with_attachments(entry):
+        message = dict(entry['message'])
+        message['attachments'] = []
+        for attachment in entry['attachments']:
+            data = artifact_store.get(attachment['artifact_key'])
+            if data is None:
+                raise PermanentSendError(f"artifact {attachment['artifact_key']} is no longer stored")
+            message['attachments'].append({
+                'filename': attachment['filename'],
+                'content': base64.b64encode(data).decode('ascii')
+            })
+        return message
+
+    def _send_one(self, entry):
+        try:
+            message = self._with_attachments(entry) if entry['attachments'] else entry['message']
+            self._sent(entry, self.provider.send(message, entry['idempotency_key']))
+        except PermanentSendError as e:
+            self._failed(entry, e, permanent=True)
+        except Exception as e:
+            self._failed(entry, e)
+
+    def _pin_batch(self, entries):
+        """Record the batch before sending it, so every retry (even after a crash) reuses members and key"""
+        keys = '\n'.join(entry['idempotency_key'] for entry in entries)
+        batch_key = 'batch-' + hashlib.sha256(keys.encode()).hexdigest()
+        self._conn().executemany(
+            "UPDATE email_outbox SET batch_key = ? WHERE id = ?", [(batch_key, entry['id']) for entry in entries]
+        )
+        for entry in entries:
+            entry['batch_key'] = batch_key
+        return batch_key
+
+    def _unpin_batch(self, entries):
+        self._conn().executemany(
+            "UPDATE email_outbox SET batch_key = NULL WHERE id = ?", [(entry['id'],) for entry in entries]
+        )
+        for entry in entries:
+            entry['batch_key'] = None
+
+    def _send_batch(self, entries, batch_key):
+        try:
+            ids = self.provider.send_batch([entry['message'] for entry in entries], batch_key)
+        except PermanentSendError:
+            # The whole batch was rejected for one bad message, so nothing went out;
+            # find the bad one by sending singly under each message's own key
+            self._unpin_batch(entries)
+            for entry in entries:
+                self._send_one(entry)
+            return
+        except Exception as e:
+            # The request may have been delivered with the response lost: retry the
+            # same batch under the same key, all members at the same time
+            attempts = max(entry['attempts'] for entry in entries)
+            retry_at = time.time() + _backoff(attempts)
+            for entry in entries:
+                self._failed({**entry, 'attempts': attempts}, e, next_attempt_at=retry_at)
+            return
+
+        for entry, provider_id in zip(entries, ids):
+            self._sent(entry, provider_id)
+        # Delivery state unknown: don't resend blindly, leave them for inspection
+        for entry in entries[len(ids):]:
+            self._failed(entry, f"missing from the batch response ({len(ids)} ids for {len(entries)} messages)",
+                         permanent=True)
+
+    def send_now(self, idempotency_key):
+        """Send one queued message inline; on failure it stays queued for retry. Returns True if sent"""
+        entries = self._claim(1, idempotency_key=idempotency_key)
+        if not entries:
+            return False
+        self._send_entries(entries)
+        return self._conn().execute(
+            "SELECT status = 'sent' FROM email_outbox WHERE idempotency_key = ?", (idempotency_key,)
+        ).fetchone()[0] == 1
+
+    def _send_entries(self, entries):
+        batches = {}
+        plain = []
+        for entry in entries:
+            if entry['batch_key']:
+                batches.setdefault(entry['batch_key'], []).append(entry)
+            elif entry['attachments']:
+                # The batch endpoint does not take attachments
+                self._send_one(entry)
+            else:
+                plain.append(entry)
+
+        if len(plain) > 1:
+            batches[self._pin_batch(plain)] = plain
+        elif plain:
+            self._send_one(plain[0])
+
+        for batch_key, members in batches.items():
+            self._send_batch(members, batch_key)
+
+    def drain(self, limit=None):
+        """Send every due message (up to limit); returns how many were attempted"""
+        attempted = 0
+        while limit is None or attempted < limit:
+            size = OUTBOX_BATCH_SIZE if limit is None else min(OUTBOX_BATCH_SIZE, limit - attempted)
+            entries = self._claim(size)
+            if not entries:
+                break
+            attempted += len(entries)
+            self._send_entries(entries)
+
+        if time.time() - self._pruned_at > 3600:
+            self.prune()
+        return attempted
+
+    def prune(self, keep_days=OUTBOX_KEEP_DAYS):
+        """Forget sent messages older than keep_days (their keys can then be reused)"""
+        self._pruned_at = time.time()
+        self._conn().execute(
+            "DELETE FROM email_outbox WHERE status = 'sent' AND sent_at < ?",
+            (time.time() - keep_days * 86400,)
+        )
+
+    def dead_letters(self, limit=50):
+        rows = self._conn().execute(
+            "SELECT id, idempotency_key, message, attempts, last_error, created_at FROM email_outbox "
+            "WHERE status = 'dead' ORDER BY id DESC LIMIT ?",
+            (limit,)
+        ).fetchall()
+        return [
+            {
+                'id': row[0],
+                'idempotency_key': row[1],
+                'to': json.loads(row[2]).get('to'),
+                'subject': json.loads(row[2]).get('subject'),
+                'attempts': row[3],
+                'last_error': row[4],
+                'created_at': row[5]
+            }
+            for row in rows
+        ]
+
+    def requeue(self, ids=None):
+        """Give dead letters (all, or the given ids) a fresh set of attempts, each under its own key"""
+        conn = self._conn()
+        if ids is None:
+            cursor = conn.execute(
+                "UPDATE email_outbox SET status = 'pending', attempts = 0, next_attempt_at = ?, batch_key = NULL "
+                "WHERE status = 'dead'",
+                (time.time(),)
+            )
+        else:
+            cursor = conn.executemany(
+                "UPDATE email_outbox SET status = 'pending', attempts = 0, next_attempt_at = ?, batch_key = NULL "
+                "WHERE status = 'dead' AND id = ?",
+                [(time.time(), message_id) for message_id in ids]
+            )
+        self._wake.set()
+        return cursor.rowcount
+
+    def stats(self):
+        conn = self._conn()
+        counts = dict(conn.execute("SELECT status, COUNT(*) FROM email_outbox GROUP BY status").fetchall())
+        oldest = conn.execute(
+            "SELECT MIN(created_at) FROM email_outbox WHERE status IN ('pending', 'sending')"
+        ).fetchone()[0]
+        return {
+            'pending': counts.get('pending', 0) + counts.get('sending', 0),
+            'sent': counts.get('sent', 0),
+            'dead': counts.get('dead', 0),
+            'oldest_pending_seconds': round(time.time() - oldest, 1) if oldest else None
+        }
+
+    def _ensure_sender(self):
+        if self._sender is not None or self.poll_interval <= 0:
+            return
+        with self._sender_lock:
+            if self._sender is None:
+                self._sender = threading.Thread(target=self.run, name='outbox-sender', daemon=True)
+                self._sender.start()
+                atexit.register(self.drain, OUTBOX_BATCH_SIZE)
+
+    def run(self):
+        """Sender loop: drain, then sleep until woken by enqueue or the poll interval"""
+        while True:
+            try:
+                self.drain()
+            except Exception as e:
+                print(f"Outbox error: {e}")
+            self._wake.wait(self.poll_interval)
+            self._wake.clear()
+
+
+outbox = Outbox()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Email outbox sender and dead-letter tools')
+    parser.add_argument('--dead', action='store_true', help='list dead letters')
+    parser.add_argument('--requeue', action='store_true', help='retry every dead letter')
+    args = parser.parse_args()
+
+    if args.dead:
+        print(json.dumps(outbox.dead_letters(), indent=2))
+    elif args.requeue:
+        print(f"Requeued {outbox.requeue()} messages")
+    else:
+        print(f"Outbox sender running: {outbox.stats()}")
+        outbox.run()
+
+
+if __name__ == '__main__':
+    main()
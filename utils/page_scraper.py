@@ -0,0 +1,143 @@
+"""
+Streaming on-page SEO scraper for /audit
+
+Reads the page in chunks up to a byte budget and feeds an incremental
+HTML parser that collects title, meta description, H1 and image alt
+signals, stopping as soon as the document is complete.
+"""
+import codecs
+import os
+import re
+from html.parser import HTMLParser
+from utils.http_client import http_client
+
+MAX_PAGE_BYTES = int(os.getenv('AUDIT_MAX_PAGE_BYTES', 2 * 1024 * 1024))
+CHUNK_SIZE = 16 * 1024
+HTML_CONTENT_TYPES = ('text/html', 'application/xhtml+xml', 'text/plain', '')
+
+META_CHARSET = re.compile(rb'<meta[^>]+charset\s*=\s*["\']?\s*([a-zA-Z0-9_\-]+)', re.IGNORECASE)
+
+
+class SEOSignalParser(HTMLParser):
+    """Incremental parser matching the BeautifulSoup lookups /audit used to do"""
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.title = None
+        self.meta_description = None
+        self.h1_count = 0
+        self.image_count = 0
+        self.images_without_alt = 0
+        self.done = False
+        self._in_title = False
+        self._title_parts = []
+
+    def handle_starttag(self, tag, attrs):
+        if tag == 'title':
+            if self.title is None and not self._in_title:
+                self._in_title = True
+        elif tag == 'meta':
+            attributes = dict(attrs)
+            if self.meta_description is None and attributes.get('name') == 'description':
+                self.meta_description = attributes.get('content') or ''
+        elif tag == 'h1':
+            self.h1_count += 1
+        elif tag == 'img':
+            self.image_count += 1
+            if not dict(attrs).get('alt'):
+                self.images_without_alt += 1
+
+    def handle_endtag(self, tag):
+        if tag == 'title' and self._in_title:
+            self._in_title = False
+            self.title = ''.join(self._title_parts)
+        elif tag == 'html':
+            self.done = True
+
+    def handle_data(self, data):
+        if self._in_title:
+            self._title_parts.append(data)
+
+    def finish(self):
+        self.close()
+        if self._in_title:
+            self.title = ''.join(self._title_parts)
+            self._in_title = False
+
+
+def _sniff_encoding(content_type, head):
+    """Charset from the Content-Type header, a BOM or a <meta charset> in the first bytes"""
+    match = re.search(r'charset=["\']?([\w\-]+)', content_type or '', re.IGNORECASE)
+    candidates = [match.group(1)] if match else []
+
+    if head.startswith(codecs.BOM_UTF8):
+        candidates.insert(0, 'utf-8-sig')
+    elif head.startswith((codecs.BOM_UTF16_LE, codecs.BOM_UTF16_BE)):
+        candidates.insert(0, 'utf-16')
+
+    meta = META_CHARSET.search(head[:4096])
+    if meta:
+        candidates.append(meta.group(1).decode('ascii', 'ignore'))
+
+    for name in candidates + ['utf-8']:
+        try:
+            return codecs.lookup(name).name
+        except LookupError:
+            continue
+
+
+def fetch_seo_signals(url, max_bytes=MAX_PAGE_BYTES, timeout=10, user_agent='Mozilla/5.0', raise_for_status=False):
+    """Stream url through SEOSignalParser, reading at most max_bytes"""
+    response = http_client.get(url, timeout=timeout, headers={'User-Agent': user_agent}, stream=True)
+
+    try:
+        if raise_for_status:
+            response.raise_for_status()
+        content_type = response.headers.get('Content-Type', '')
+        if content_type.split(';')[0].strip().lower() not in HTML_CONTENT_TYPES:
+            raise ValueError(f"Not an HTML page ({content_type})")
+
+        parser = SEOSignalParser()
+        decoder = None
+        received = 0
+
+        for chunk in response.iter_content(chunk_size=CHUNK_SIZE):
+            if decoder is None:
+                decoder = codecs.getincrementaldecoder(_sniff_encoding(content_type, chunk))(errors='replace')
+
+            chunk = chunk[:max_bytes - received]
+            received += len(chunk)
+            parser.feed(decoder.decode(chunk))
+
+            if parser.done or received >= max_bytes:
+                break
+
+        if decoder is not None:
+            parser.feed(decoder.decode(b'', final=True))
+        parser.finish()
+        return parser
+    finally:
+        response.close()
+
+
+def build_seo_checks(signals):
+    """The seo_checks dict rendered by audit.html"""
+    title_length = len(signals.title or '')
+    meta_desc_length = len(signals.meta_description or '')
+    h1_count = signals.h1_count
+    missing_alt_percent = round((signals.images_without_alt / signals.image_count * 100), 1) if signals.image_count else 0
+
+    return {
+        'title_length': title_length,
+        'title_status': 'good' if 30 <= title_length <= 60 else 'warning',
+        'meta_desc_length': meta_desc_length,
+        'meta_desc_status': 'good' if 120 <= meta_desc_length <= 160 else 'warning',
+        'h1_count': h1_count,
+        'h1_status': 'good' if h1_count == 1 else 'warning',
+        'missing_alt_percent': missing_alt_percent,
+        'alt_status': 'good' if missing_alt_percent < 10 else 'warning'
+    }
+
+
+def get_seo_checks(url):
+    return build_seo_checks(fetch_seo_signals(url))
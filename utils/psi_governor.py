@@ -0,0 +1,240 @@
+"""
+Admission control for PageSpeed Insights calls
+
+Every PSI request goes through the governor, which enforces:
+  - a concurrency limit shared by all workers on the host (flock'd slot files)
+  - a token bucket matched to the PSI per-second rate limit, plus the daily
+    quota, both kept in SQLite so every worker draws from the same budget
+  - per-client-IP token buckets for the public /audit endpoint
+  - a bounded wait queue; callers beyond it are rejected immediately
+
+Retries go back through the governor too (PSIGovernor.get), so a 429 storm
+can't multiply calls past the rate limit or the daily count.
+"""
+import fcntl
+import os
+import random
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from datetime import date
+
+import requests
+
+from utils.cache import DEFAULT_CACHE_PATH
+from utils.http_client import http_client, RETRY_STATUSES
+from utils.locks import LOCK_DIR
+
+PSI_MAX_CONCURRENCY = int(os.getenv('PSI_MAX_CONCURRENCY', 4))
+PSI_RATE_PER_SECOND = float(os.getenv('PSI_RATE_PER_SECOND', 4))
+PSI_BURST = float(os.getenv('PSI_BURST', 4))
+PSI_DAILY_QUOTA = int(os.getenv('PSI_DAILY_QUOTA', 25000))
+PSI_MAX_QUEUE = int(os.getenv('PSI_MAX_QUEUE', 20))
+PSI_MAX_WAIT = float(os.getenv('PSI_MAX_WAIT', 20))
+PSI_MAX_ATTEMPTS = int(os.getenv('PSI_MAX_ATTEMPTS', 3))
+
+AUDIT_IP_RATE_PER_MINUTE = float(os.getenv('AUDIT_IP_RATE_PER_MINUTE', 6))
+AUDIT_IP_BURST = float(os.getenv('AUDIT_IP_BURST', 3))
+
+
+class PSIRejected(Exception):
+    """Raised when a PSI call is not admitted; carries the HTTP status to return"""
+
+    def __init__(self, message, status_code=503, retry_after=5):
+        super().__init__(message)
+        self.status_code = status_code
+        self.retry_after = retry_after
+
+
+class PSIGovernor:
+
+    def __init__(self, path=None):
+        self.path = path or os.getenv('PSI_GOVERNOR_PATH', DEFAULT_CACHE_PATH)
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self.waiting = 0
+        self.in_flight = 0
+        self.counters = {
+            'admitted': 0,
+            'rejected_queue_full': 0,
+            'rejected_wait_timeout': 0,
+            'rejected_daily_quota': 0,
+            'rejected_client_ip': 0
+        }
+        with self._conn() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS psi_buckets ("
+                "name TEXT PRIMARY KEY, tokens REAL NOT NULL, updated_at REAL NOT NULL, "
+                "day TEXT, day_count INTEGER NOT NULL DEFAULT 0)"
+            )
+
+    def _conn(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            self._local.conn = conn
+        return conn
+
+    def _count(self, name):
+        with self._lock:
+            self.counters[name] += 1
+
+    def _take_token(self, name, rate, burst, daily_quota=None):
+        """Atomically take one token. Returns seconds to wait (0 if taken), or None if the daily quota is spent"""
+        now = time.time()
+        today = date.today().isoformat()
+        conn = self._conn()
+
+        with conn:
+            conn.execute('BEGIN IMMEDIATE')
+            row = conn.execute(
+                "SELECT tokens, updated_at, day, day_count FROM psi_buckets WHERE name = ?", (name,)
+            ).fetchone()
+            tokens, updated_at, day, day_count = row if row else (burst, now, today, 0)
+
+            tokens = min(burst, tokens + (now - updated_at) * rate)
+            if day != today:
+                day, day_count = today, 0
+
+            if daily_quota is not None and day_count >= daily_quota:
+                wait = None
+            elif tokens >= 1:
+                tokens -= 1
+                day_count += 1
+                wait = 0
+            else:
+                wait = (1 - tokens) / rate
+
+            conn.execute(
+                "INSERT OR REPLACE INTO psi_buckets (name, tokens, updated_at, day, day_count) VALUES (?, ?, ?, ?, ?)",
+                (name, tokens, now, day, day_count)
+            )
+
+        return wait
+
+    def _try_slot(self):
+        """Grab a free concurrency slot file; returns its fd or None"""
+        os.makedirs(LOCK_DIR, exist_ok=True)
+        for slot in range(PSI_MAX_CONCURRENCY):
+            fd = os.open(os.path.join(LOCK_DIR, f"psi_slot_{slot}.lock"), os.O_CREAT | os.O_RDWR, 0o600)
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                return fd
+            except BlockingIOError:
+                os.close(fd)
+        return None
+
+    @contextmanager
+    def slot(self):
+        """Hold a PSI concurrency slot and one rate token for the duration of a call.
+
+        The slot is taken first, so a caller that times out waiting never spends a token.
+        """
+        with self._lock:
+            if self.waiting >= PSI_MAX_QUEUE:
+                self.counters['rejected_queue_full'] += 1
+                raise PSIRejected("PageSpeed Insights is busy, please retry shortly", 503, retry_after=5)
+            self.waiting += 1
+
+        deadline = time.monotonic() + PSI_MAX_WAIT
+        fd = None
+        try:
+            while True:
+                fd = self._try_slot()
+                if fd is not None:
+                    break
+                if time.monotonic() > deadline:
+                    self._count('rejected_wait_timeout')
+                    raise PSIRejected("PageSpeed Insights is busy, please retry shortly", 503, retry_after=5)
+                time.sleep(0.05)
+
+            while True:
+                wait = self._take_token('global', PSI_RATE_PER_SECOND, PSI_BURST, PSI_DAILY_QUOTA)
+                if wait is None:
+                    self._count('rejected_daily_quota')
+                    raise PSIRejected("Daily PageSpeed Insights quota reached, please try again tomorrow", 503, retry_after=3600)
+                if wait == 0:
+                    break
+                if time.monotonic() + wait > deadline:
+                    self._count('rejected_wait_timeout')
+                    raise PSIRejected("PageSpeed Insights is busy, please retry shortly", 503, retry_after=int(wait) + 1)
+                time.sleep(wait)
+        except BaseException:
+            if fd is not None:
+                fcntl.flock(fd, fcntl.LOCK_UN)
+                os.close(fd)
+            raise
+        finally:
+            with self._lock:
+                self.waiting -= 1
+
+        with self._lock:
+            self.in_flight += 1
+            self.counters['admitted'] += 1
+        try:
+            yield
+        finally:
+            with self._lock:
+                self.in_flight -= 1
+            fcntl.flock(fd, fcntl.LOCK_UN)
+            os.close(fd)
+
+    def get(self, url, max_attempts=None, **kwargs):
+        """GET a PSI URL, admitting every attempt separately.
+
+        429/5xx responses and connection errors are retried up to max_attempts
+        times, but each attempt takes its own slot and token (so it counts
+        against the daily quota) and the backoff sleeps outside the slot.
+        Returns the last response.
+        """
+        max_attempts = max_attempts or PSI_MAX_ATTEMPTS
+        for attempt in range(max_attempts):
+            last_attempt = attempt == max_attempts - 1
+            retry_after = None
+            try:
+                with self.slot():
+                    response = http_client.get(url, retry=False, **kwargs)
+            except requests.ConnectionError:
+                if last_attempt:
+                    raise
+            else:
+                if response.status_code not in RETRY_STATUSES or last_attempt:
+                    return response
+                retry_after = response.headers.get('Retry-After')
+                response.close()
+            time.sleep(http_client.backoff(attempt, retry_after))
+
+    def admit_client(self, client_ip):
+        """Per-IP token bucket for /audit; raises PSIRejected(429) when exhausted"""
+        if random.random() < 0.01:
+            self.prune_clients()
+
+        wait = self._take_token(f"ip:{client_ip}", AUDIT_IP_RATE_PER_MINUTE / 60, AUDIT_IP_BURST)
+        if wait:
+            self._count('rejected_client_ip')
+            raise PSIRejected("Too many audits from your address, please slow down", 429, retry_after=int(wait) + 1)
+
+    def prune_clients(self, max_idle=3600):
+        self._conn().execute(
+            "DELETE FROM psi_buckets WHERE name LIKE 'ip:%' AND updated_at < ?", (time.time() - max_idle,)
+        )
+
+    def stats(self):
+        row = self._conn().execute(
+            "SELECT tokens, day, day_count FROM psi_buckets WHERE name = 'global'"
+        ).fetchone()
+        with self._lock:
+            return {
+                **self.counters,
+                'waiting': self.waiting,
+                'in_flight': self.in_flight,
+                'max_concurrency': PSI_MAX_CONCURRENCY,
+                'tokens': round(row[0], 2) if row else PSI_BURST,
+                'daily_used': row[2] if row and row[1] == date.today().isoformat() else 0,
+                'daily_quota': PSI_DAILY_QUOTA
+            }
+
+
+psi_governor = PSIGovernor()
@@ -11,14 +11,92 @@ from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
 from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Table, TableStyle, PageBreak
 from reportlab.lib.units import inch
 from datetime import datetime
-import os
-import tempfile
+import io
+import copy
+import threading
 from utils.roi_calculator import ROICalculator
+from utils import traffic_analytics
 
 # Charts disabled on serverless
 CHARTS_ENABLED = False
 
 
+def _header_table_commands(header_color):
+    return [
+        ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor(header_color)),
+        ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
+        ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
+        ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+        ('FONTSIZE', (0, 0), (-1, 0), 11),
+        ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
+        ('BACKGROUND', (0, 1), (-1, -1), colors.lightgrey),
+        ('GRID', (0, 0), (-1, -1), 1, colors.grey)
+    ]
+
+
+class ReportTemplate:
+    """Styles, table styles and static flowables built once per process.
+
+    Only data-bound flowables are created per report. Static paragraphs are
+    handed out as shallow copies so concurrent builds never share layout state.
+    """
+    
+    _instance = None
+    _lock = threading.Lock()
+    
+    def __init__(self):
+        self.styles = getSampleStyleSheet()
+        self.normal = self.styles['Normal']
+        
+        self.title_style = ParagraphStyle(
+            'CustomTitle',
+            parent=self.styles['Heading1'],
+            fontSize=24,
+            textColor=colors.HexColor('#1e293b'),
+            spaceAfter=30,
+            alignment=1
+        )
+        
+        self.heading_style = ParagraphStyle(
+            'CustomHeading',
+            parent=self.styles['Heading2'],
+            fontSize=16,
+            textColor=colors.HexColor('#3b82f6'),
+            spaceAfter=12,
+            spaceBefore=20
+        )
+        
+        self.footer_style = ParagraphStyle('footer', parent=self.normal, fontSize=8, textColor=colors.grey, alignment=1)
+        
+        self.cwv_table_style = TableStyle(_header_table_commands('#10b981') + [('FONTSIZE', (0, 1), (-1, -1), 9)])
+        self.pages_table_style = TableStyle(_header_table_commands('#3b82f6'))
+        self.keywords_table_style = TableStyle(_header_table_commands('#10b981'))
+        
+        self._static = {
+            'title': Paragraph("SEO Performance Report", self.title_style),
+            'title_enterprise': Paragraph("Custom SEO Analytics Report", self.title_style),
+            'roi_heading': Paragraph("Organic ROI Summary", self.heading_style),
+            'cwv_heading': Paragraph("Core Web Vitals Assessment", self.heading_style),
+            'cwv_unavailable': Paragraph("<i>Core Web Vitals data was unavailable when this report was generated.</i>", self.normal),
+            'performance_heading': Paragraph("Additional Performance Metrics", self.heading_style),
+            'traffic_heading': Paragraph("Traffic Analysis", self.heading_style),
+            'pages_heading': Paragraph("Top Performing Pages", self.heading_style),
+            'keywords_heading': Paragraph("Top Keywords Details", self.heading_style),
+            'watermark': Paragraph("<i>Generated by ReportRiser.com — Prove SEO ROI in 60 Seconds</i>", self.footer_style)
+        }
+    
+    @classmethod
+    def get(cls):
+        if cls._instance is None:
+            with cls._lock:
+                if cls._instance is None:
+                    cls._instance = cls()
+        return cls._instance
+    
+    def static(self, name):
+        return copy.copy(self._static[name])
+
+
 class ReportGenerator:
     
     @staticmethod
@@ -71,46 +149,23 @@ class ReportGenerator:
     
     @staticmethod
     def generate_pdf(site_url, analytics_data, search_data, cwv_summary, roi_data, conversions_data, tier):
-        filename = f"report_{datetime.now().strftime('%Y%m%d_%H%M%S')}.pdf"
-        import tempfile
-        temp_dir = tempfile.gettempdir()
-        filepath = os.path.join(temp_dir, filename)
+        """Render the report and return the PDF bytes"""
+        buffer = io.BytesIO()
         
-        doc = SimpleDocTemplate(filepath, pagesize=letter, topMargin=0.5*inch, bottomMargin=0.5*inch)
+        doc = SimpleDocTemplate(buffer, pagesize=letter, topMargin=0.5*inch, bottomMargin=0.5*inch)
         story = []
-        styles = getSampleStyleSheet()
-        
-        # Custom styles
-        title_style = ParagraphStyle(
-            'CustomTitle',
-            parent=styles['Heading1'],
-            fontSize=24,
-            textColor=colors.HexColor('#1e293b'),
-            spaceAfter=30,
-            alignment=1
-        )
-        
-        heading_style = ParagraphStyle(
-            'CustomHeading',
-            parent=styles['Heading2'],
-            fontSize=16,
-            textColor=colors.HexColor('#3b82f6'),
-            spaceAfter=12,
-            spaceBefore=20
-        )
+        template = ReportTemplate.get()
+        normal = template.normal
         
         # Title
-        if tier != 'enterprise':
-            story.append(Paragraph("SEO Performance Report", title_style))
-        else:
-            story.append(Paragraph("Custom SEO Analytics Report", title_style))
+        story.append(template.static('title' if tier != 'enterprise' else 'title_enterprise'))
         
-        story.append(Paragraph(f"<b>Domain:</b> {site_url}", styles['Normal']))
-        story.append(Paragraph(f"<b>Report Date:</b> {datetime.now().strftime('%B %d, %Y')}", styles['Normal']))
+        story.append(Paragraph(f"<b>Domain:</b> {site_url}", normal))
+        story.append(Paragraph(f"<b>Report Date:</b> {datetime.now().strftime('%B %d, %Y')}", normal))
         story.append(Spacer(1, 0.3*inch))
         
         # ===== NEW: ROI SUMMARY SECTION =====
-        story.append(Paragraph("Organic ROI Summary", heading_style))
+        story.append(template.static('roi_heading'))
         
         roi_growth = ROICalculator.calculate_growth(
             conversions_data['conversion_value'],
@@ -124,74 +179,69 @@ class ReportGenerator:
         ({'+' if roi_growth > 0 else ''}{roi_growth}% vs last month).
         <br/><br/>
         <b>Conversion Rate:</b> {roi_data['conversion_rate']}% | 
-        <b>Avg Order Value:</b> ${conversions_data['conversion_value'] / conversions_data['conversions']:.0f}
+        <b>Avg Order Value:</b> ${conversions_data['conversion_value'] / conversions_data['conversions'] if conversions_data['conversions'] else 0:.0f}
         """
-        story.append(Paragraph(roi_text, styles['Normal']))
+        story.append(Paragraph(roi_text, normal))
         story.append(Spacer(1, 0.2*inch))
         
         # ===== NEW: CORE WEB VITALS SECTION =====
-        story.append(Paragraph("Core Web Vitals Assessment", heading_style))
+        story.append(template.static('cwv_heading'))
         
-        cwv_data = [
-            ['Metric', 'Value', 'Status', 'Impact'],
-            [
-                'LCP (Load Speed)', 
-                f"{cwv_summary['metrics']['lcp']['value']}s",
-                f"{cwv_summary['metrics']['lcp']['icon']} {cwv_summary['metrics']['lcp']['status'].replace('_', ' ').title()}",
-                'Load time affects conversions'
-            ],
-            [
-                'FID (Interactivity)', 
-                f"{cwv_summary['metrics']['fid']['value']}ms",
-                f"{cwv_summary['metrics']['fid']['icon']} {cwv_summary['metrics']['fid']['status'].replace('_', ' ').title()}",
-                'Response time affects engagement'
-            ],
-            [
-                'CLS (Visual Stability)', 
-                f"{cwv_summary['metrics']['cls']['value']}",
-                f"{cwv_summary['metrics']['cls']['icon']} {cwv_summary['metrics']['cls']['status'].replace('_', ' ').title()}",
-                'Layout shifts hurt UX'
+        if cwv_summary is None:
+            # PSI timed out or failed - render the rest of the report without it
+            story.append(template.static('cwv_unavailable'))
+            story.append(Spacer(1, 0.2*inch))
+        else:
+            cwv_data = [
+                ['Metric', 'Value', 'Status', 'Impact'],
+                [
+                    'LCP (Load Speed)', 
+                    f"{cwv_summary['metrics']['lcp']['value']}s",
+                    f"{cwv_summary['metrics']['lcp']['icon']} {cwv_summary['metrics']['lcp']['status'].replace('_', ' ').title()}",
+                    'Load time affects conversions'
+                ],
+                [
+                    'FID (Interactivity)', 
+                    f"{cwv_summary['metrics']['fid']['value']}ms",
+                    f"{cwv_summary['metrics']['fid']['icon']} {cwv_summary['metrics']['fid']['status'].replace('_', ' ').title()}",
+                    'Response time affects engagement'
+                ],
+                [
+                    'CLS (Visual Stability)', 
+                    f"{cwv_summary['metrics']['cls']['value']}",
+                    f"{cwv_summary['metrics']['cls']['icon']} {cwv_summary['metrics']['cls']['status'].replace('_', ' ').title()}",
+                    'Layout shifts hurt UX'
+                ]
             ]
-        ]
         
-        cwv_table = Table(cwv_data, colWidths=[1.8*inch, 1*inch, 1.8*inch, 1.6*inch])
-        cwv_table.setStyle(TableStyle([
-            ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#10b981')),
-            ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
-            ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
-            ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-            ('FONTSIZE', (0, 0), (-1, 0), 11),
-            ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
-            ('BACKGROUND', (0, 1), (-1, -1), colors.lightgrey),
-            ('GRID', (0, 0), (-1, -1), 1, colors.grey),
-            ('FONTSIZE', (0, 1), (-1, -1), 9)
-        ]))
+            cwv_table = Table(cwv_data, colWidths=[1.8*inch, 1*inch, 1.8*inch, 1.6*inch])
+            cwv_table.setStyle(template.cwv_table_style)
         
-        story.append(cwv_table)
-        story.append(Spacer(1, 0.15*inch))
+            story.append(cwv_table)
+            story.append(Spacer(1, 0.15*inch))
         
-        # CWV Score and Recommendation
-        cwv_score_text = f"""
-        <b>Overall CWV Score: {cwv_summary['score']}/100</b><br/>
-        <i>{cwv_summary['overall_recommendation']}</i>
-        """
-        story.append(Paragraph(cwv_score_text, styles['Normal']))
-        story.append(Spacer(1, 0.2*inch))
+            # CWV Score and Recommendation
+            cwv_score_text = f"""
+            <b>Overall CWV Score: {cwv_summary['score']}/100</b><br/>
+            <i>{cwv_summary['overall_recommendation']}</i>
+            """
+            story.append(Paragraph(cwv_score_text, normal))
+            story.append(Spacer(1, 0.2*inch))
         
-        # Priority Fix with detailed recommendation
-        priority_metric = None
-        for metric_key, metric_data in cwv_summary['metrics'].items():
-            if metric_data['status'] in ['poor', 'needs_improvement']:
-                priority_metric = metric_data
-                break
+            # Priority Fix with detailed recommendation
+            priority_metric = None
+            for metric_key, metric_data in cwv_summary['metrics'].items():
+                if metric_data['status'] in ['poor', 'needs_improvement']:
+                    priority_metric = metric_data
+                    break
         
-        if priority_metric:
-            fix_text = f"<b>Priority Fix:</b> {priority_metric['recommendation']}"
-            story.append(Paragraph(fix_text, styles['Normal']))
-            story.append(Spacer(1, 0.2*inch))
+            if priority_metric:
+                fix_text = f"<b>Priority Fix:</b> {priority_metric['recommendation']}"
+                story.append(Paragraph(fix_text, normal))
+                story.append(Spacer(1, 0.2*inch))
         
         # Original PageSpeed Scores (keep existing)
-        story.append(Paragraph("Additional Performance Metrics", heading_style))
+        story.append(template.static('performance_heading'))
         # ... keep your existing pagespeed table code ...
         
         # Generate and add charts (keep existing chart code)
@@ -201,21 +251,45 @@ class ReportGenerator:
         
         # Traffic Summary (instead of chart)
         story.append(PageBreak())
-        story.append(Paragraph("Traffic Analysis", heading_style))
+        story.append(template.static('traffic_heading'))
 
+        traffic = analytics_data.get('traffic_summary') or traffic_analytics.summarize(analytics_data['traffic_data'])
         traffic_summary = f"""
-        Over the past 30 days, your site received <b>{analytics_data['total_users']:,} organic visitors</b>.
+        Over the past {traffic['days'] if traffic else 30} days, your site received <b>{analytics_data['total_users']:,} organic visitors</b>.
+        """
+        if traffic:
+            traffic_summary += f"""
         <br/><br/>
-        <b>Peak traffic day:</b> {max(analytics_data['traffic_data'], key=lambda x: x['users'])['date']} 
-        ({max(analytics_data['traffic_data'], key=lambda x: x['users'])['users']} users)
+        <b>Peak traffic day:</b> {traffic['peak']['date']} ({traffic['peak']['users']:,} users)
+        <br/>
+        <b>Lowest traffic day:</b> {traffic['trough']['date']} ({traffic['trough']['users']:,} users)
+        <br/>
+        <b>Average daily visitors:</b> {traffic['mean']:,.0f}
+        """
+            if 'previous_users' in analytics_data:
+                # Month-over-month comes free from the warehouse's previous window
+                traffic_summary += f"""
+        <br/>
+        <b>vs previous 30 days:</b> {analytics_data['growth']:+}% ({analytics_data['previous_users']:,} visitors)
+        """
+            if traffic['wow_growth'] is not None:
+                traffic_summary += f"""
+        <br/>
+        <b>Last 7 days vs previous 7:</b> {traffic['wow_growth']:+}%
+        """
+            if traffic['anomalies']:
+                unusual = ', '.join(
+                    f"{day['date']} ({day['users']:,} vs ~{day['expected']:,.0f})" for day in traffic['anomalies'][:3]
+                )
+                traffic_summary += f"""
         <br/>
-        <b>Average daily visitors:</b> {analytics_data['total_users'] // 30:,}
+        <b>Unusual days:</b> {unusual}
         """
-        story.append(Paragraph(traffic_summary, styles['Normal']))
+        story.append(Paragraph(traffic_summary, normal))
         story.append(Spacer(1, 0.3*inch))
 
         # Top Pages Summary (instead of chart)
-        story.append(Paragraph("Top Performing Pages", heading_style))
+        story.append(template.static('pages_heading'))
 
         pages_data = [['Page', 'Clicks', '% of Total']]
         total_clicks = sum([p['clicks'] for p in search_data['top_pages']])
@@ -224,22 +298,13 @@ class ReportGenerator:
             pages_data.append([page['page'], f"{page['clicks']:,}", f"{percent}%"])
 
         pages_table = Table(pages_data, colWidths=[3.5*inch, 1.5*inch, 1.2*inch])
-        pages_table.setStyle(TableStyle([
-            ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#3b82f6')),
-            ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
-            ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
-            ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-            ('FONTSIZE', (0, 0), (-1, 0), 11),
-            ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
-            ('BACKGROUND', (0, 1), (-1, -1), colors.lightgrey),
-            ('GRID', (0, 0), (-1, -1), 1, colors.grey)
-        ]))
+        pages_table.setStyle(template.pages_table_style)
 
         story.append(pages_table)
         story.append(Spacer(1, 0.3*inch))
         
         # Keywords table (keep existing)
-        story.append(Paragraph("Top Keywords Details", heading_style))
+        story.append(template.static('keywords_heading'))
         keywords_data = [['Keyword', 'Clicks', 'Impressions', 'CTR', 'Position']]
         for kw in search_data['top_keywords']:
             keywords_data.append([
@@ -251,28 +316,16 @@ class ReportGenerator:
             ])
         
         keywords_table = Table(keywords_data, colWidths=[2.2*inch, 1*inch, 1.2*inch, 0.8*inch, 1*inch])
-        keywords_table.setStyle(TableStyle([
-            ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#10b981')),
-            ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
-            ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
-            ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-            ('FONTSIZE', (0, 0), (-1, 0), 11),
-            ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
-            ('BACKGROUND', (0, 1), (-1, -1), colors.lightgrey),
-            ('GRID', (0, 0), (-1, -1), 1, colors.grey)
-        ]))
+        keywords_table.setStyle(template.keywords_table_style)
         
         story.append(keywords_table)
         story.append(Spacer(1, 0.5*inch))
         
         # Watermark for non-enterprise
         if tier != 'enterprise':
-            story.append(Paragraph(
-                "<i>Generated by ReportRiser.com — Prove SEO ROI in 60 Seconds</i>", 
-                ParagraphStyle('footer', parent=styles['Normal'], fontSize=8, textColor=colors.grey, alignment=1)
-            ))
+            story.append(template.static('watermark'))
         
         doc.build(story)
         
-        return filepath
+        return buffer.getvalue()
 
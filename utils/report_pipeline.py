@@ -0,0 +1,144 @@
+"""
+End-to-end report pipeline: data fetch -> ROI math -> PDF render
+"""
+from utils.cwv import CWVAnalyzer
+from utils.roi_calculator import ROICalculator
+from utils.report_generator import ReportGenerator
+from utils.jobs import StageTimer
+from utils import data_sources
+from utils.artifact_store import artifact_store
+from utils.metering import quota_meter
+from utils.repository import GoogleTokensRepo
+from utils import traffic_analytics
+
+
+def get_mock_fetchers(site_url):
+    """Fetchers used until a Google account is connected"""
+    return {
+        'analytics': ReportGenerator.get_mock_analytics,
+        'search': ReportGenerator.get_mock_search_data,
+        # No mock fallback: a failed PSI call drops the CWV section instead of faking it
+        'cwv': lambda: CWVAnalyzer.get_cwv_data(site_url, fallback=False),
+        'conversions': ROICalculator.get_mock_conversions
+    }
+
+
+def get_report_fetchers(user_id, site_url):
+    """GA4 and Search Console fetchers when user_id has connected Google, else the mocks"""
+    if not user_id or not GoogleTokensRepo.get(user_id):
+        return get_mock_fetchers(site_url)
+
+    # The Google client libraries load only for users who connected an account
+    from utils.google_api import GoogleAPIClient
+
+    return GoogleAPIClient(user_id).get_report_fetchers(site_url)
+
+
+def collect_report_data(site_url, avg_order_value, timer=None, fetchers=None, user_id=None):
+    """Fetch and analyze everything a report needs (I/O-bound half of the pipeline)"""
+    timer = timer or StageTimer()
+    fetchers = fetchers or get_report_fetchers(user_id, site_url)
+
+    # Analytics, search, CWV and conversions are independent: fetch them in
+    # parallel. CWV is optional - a slow PSI run just drops that section.
+    with timer.stage('fetch'):
+        sources = data_sources.gather(fetchers, required=('analytics', 'search', 'conversions'))
+
+    for name, seconds in sources['timings'].items():
+        timer.record_stage(f"fetch:{name}", seconds)
+
+    analytics_data = sources['data']['analytics']
+    conversions_data = sources['data']['conversions']
+    cwv_data = sources['data'].get('cwv')
+
+    with timer.stage('analyze'):
+        cwv_summary = CWVAnalyzer.get_cwv_summary(cwv_data) if cwv_data else None
+        analytics_data = {**analytics_data, 'traffic_summary': traffic_analytics.summarize(analytics_data['traffic_data'])}
+        roi_data = ROICalculator.get_roi_summary(
+            analytics_data['total_users'],
+            conversions_data['conversions'],
+            avg_order_value,
+            revenue=conversions_data.get('revenue')  # measured GA4 value when available
+        )
+
+    return {
+        'site_url': site_url,
+        'analytics_data': analytics_data,
+        'search_data': sources['data']['search'],
+        'cwv_summary': cwv_summary,
+        'roi_data': roi_data,
+        'conversions_data': conversions_data,
+        'missing_sources': sorted(sources['errors'])
+    }
+
+
+def render_report(report_data, tier, timer=None):
+    """Render and store the PDF (CPU-bound half of the pipeline); returns the job result"""
+    timer = timer or StageTimer()
+
+    with timer.stage('render'):
+        pdf_bytes = ReportGenerator.generate_pdf(
+            report_data['site_url'],
+            report_data['analytics_data'],
+            report_data['search_data'],
+            report_data['cwv_summary'],
+            report_data['roi_data'],
+            report_data['conversions_data'],
+            tier
+        )
+
+    with timer.stage('store'):
+        artifact_key = artifact_store.put(pdf_bytes)
+
+    return {
+        'site_url': report_data['site_url'],
+        'artifact_key': artifact_key,
+        'size': len(pdf_bytes),
+        'traffic': report_data['analytics_data']['total_users'],
+        'roi': report_data['roi_data']['revenue'],
+        'traffic_summary': _dashboard_traffic(report_data['analytics_data'].get('traffic_summary')),
+        'missing_sources': report_data['missing_sources']
+    }
+
+
+def _dashboard_traffic(summary):
+    # The daily moving-average series stays in the PDF; the dashboard gets headline numbers
+    if not summary:
+        return None
+    return {
+        'mean': summary['mean'],
+        'peak': summary['peak'],
+        'wow_growth': summary['wow_growth'],
+        'anomalies': len(summary['anomalies'])
+    }
+
+
+def build_report(site_url, avg_order_value, tier, timer=None, fetchers=None, user_id=None):
+    """Generate a report PDF, recording per-stage timings on timer"""
+    timer = timer or StageTimer()
+
+    print(f"📊 Generating report for: {site_url}")
+
+    report_data = collect_report_data(site_url, avg_order_value, timer=timer, fetchers=fetchers, user_id=user_id)
+
+    print("✅ Data loaded (traffic, CWV, ROI)")
+
+    result = render_report(report_data, tier, timer=timer)
+
+    print(f"✅ PDF generated: {result['artifact_key'][:12]} ({result['size']:,} bytes)")
+
+    return result
+
+
+def report_job(job, site_url, avg_order_value, tier, reservation_id=None, user_id=None):
+    """JobQueue entry point for report generation; refunds the quota unit if it fails"""
+    try:
+        result = build_report(site_url, avg_order_value, tier, timer=job, user_id=user_id)
+    except Exception:
+        if reservation_id:
+            quota_meter.refund(reservation_id)
+        raise
+
+    if reservation_id:
+        quota_meter.commit(reservation_id)
+    return result
@@ -0,0 +1,427 @@
+"""
+Supabase data access layer
+
+One class per table, each selecting only the columns its callers use, all
+sharing one lazily created client. Every query goes through _execute so the
+query log can count round trips per route (QUERY_LOG=1).
+
+User rows and recent-report lists are cached read-through in a store shared
+by all workers; every write made through this module invalidates them.
+"""
+import os
+import threading
+import time
+from contextvars import ContextVar
+
+from utils.cache import TTLCache
+
+_client = None
+_client_lock = threading.Lock()
+
+RECENT_REPORTS_LIMIT = 10
+# PostgREST caps a response at its max-rows setting (1000 by default); full scans page below it
+PAGE_SIZE = int(os.getenv('SUPABASE_PAGE_SIZE', 1000))
+IN_CHUNK_SIZE = 200
+INSERT_CHUNK_SIZE = 500
+user_cache = TTLCache.from_env('USER', ttl=300, max_entries=10000, backend='sqlite')
+
+
+def get_client():
+    """The process-wide Supabase client (its HTTP session pools connections)"""
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                from supabase import create_client
+
+                supabase_url = os.environ.get("SUPABASE_URL")
+                supabase_key = os.environ.get("SUPABASE_ANON_KEY")  # this is correct for anon/public key
+
+                if not supabase_url or not supabase_key:
+                    raise ValueError("Missing SUPABASE_URL or SUPABASE_ANON_KEY in environment variables")
+
+                _client = create_client(supabase_url, supabase_key)
+    return _client
+
+
+class QueryLog:
+    """Per-request record of Supabase round trips, aggregated per route"""
+
+    def __init__(self):
+        self.enabled = os.getenv('QUERY_LOG', '') not in ('', '0', 'false')
+        self._current = ContextVar('supabase_queries', default=None)
+        self._totals = {}
+        self._lock = threading.Lock()
+
+    def start(self):
+        self._current.set([])
+
+    def record(self, table, operation, seconds):
+        queries = self._current.get()
+        if queries is not None:
+            queries.append((table, operation, seconds))
+
+    def finish(self, route):
+        queries = self._current.get() or []
+        self._current.set(None)
+
+        with self._lock:
+            totals = self._totals.setdefault(route, {'requests': 0, 'queries': 0, 'seconds': 0.0})
+            totals['requests'] += 1
+            totals['queries'] += len(queries)
+            totals['seconds'] += sum(q[2] for q in queries)
+
+        if self.enabled and queries:
+            detail = ', '.join(f"{op} {table}" for table, op, _ in queries)
+            print(f"🗄️ {route}: {len(queries)} queries, {sum(q[2] for q in queries) * 1000:.0f} ms ({detail})")
+        return queries
+
+    def stats(self):
+        with self._lock:
+            return {
+                route: {
+                    **totals,
+                    'queries_per_request': round(totals['queries'] / totals['requests'], 2),
+                    'seconds': round(totals['seconds'], 3)
+                }
+                for route, totals in self._totals.items()
+            }
+
+
+query_log = QueryLog()
+
+
+def _execute(table, operation, query):
+    started = time.perf_counter()
+    try:
+        return query.execute()
+    finally:
+        query_log.record(table, operation, time.perf_counter() - started)
+
+
+def _first(result):
+    return result.data[0] if result.data else None
+
+
+def _paged(table, build_query, page_size=None):
+    """All rows of build_query() fetched with .range() pages; the query must have a stable order"""
+    page_size = page_size or PAGE_SIZE
+    rows = []
+    while True:
+        page = _execute(table, 'select', build_query().range(len(rows), len(rows) + page_size - 1)).data
+        rows.extend(page)
+        if len(page) < page_size:
+            return rows
+
+
+def invalidate_user(user_id):
+    """Drop the cached user row and recent reports for user_id"""
+    user_cache.delete(f"user:{user_id}")
+    user_cache.delete(f"reports:{user_id}")
+
+
+def get_cache_stats():
+    return user_cache.stats()
+
+
+def _bulk_update(table, key_column, updates):
+    """Apply {key: fields} updates with one round trip per distinct fields dict"""
+    groups = {}
+    for key, fields in updates.items():
+        groups.setdefault(tuple(sorted(fields.items())), []).append(key)
+
+    for fields, keys in groups.items():
+        _execute(table, 'update', get_client().table(table).update(dict(fields)).in_(key_column, keys))
+
+    return len(groups)
+
+
+def _insert_many(table, rows, chunk_size=None):
+    """Insert rows with one round trip per chunk of chunk_size; returns the inserted rows"""
+    chunk_size = chunk_size or INSERT_CHUNK_SIZE
+    inserted = []
+    for start in range(0, len(rows), chunk_size):
+        inserted.extend(_execute(table, 'insert', get_client().table(table).insert(rows[start:start + chunk_size])).data)
+    return inserted
+
+
+class UsersRepo:
+
+    COLUMNS = ('id', 'email', 'tier', 'reports_used', 'sites_used', 'stripe_customer_id')
+
+    @staticmethod
+    def get(user_id):
+        return _first(_execute('users', 'select', get_client().table('users').select(*UsersRepo.COLUMNS).eq('id', user_id)))
+
+    @staticmethod
+    def get_cached(user_id):
+        """UsersRepo.get through the shared user cache"""
+        return user_cache.get_or_compute(f"user:{user_id}", lambda: UsersRepo.get(user_id))
+
+    @staticmethod
+    def get_live(user_id):
+        """tier, reports_used and the YYYY-MM period it counts (see utils.metering), never cached.
+
+        invalidate_user only clears this instance's cache, so a Stripe webhook handled
+        elsewhere would leave a cached tier stale for up to the cache TTL. Anything that
+        enforces or shows the tier reads it here instead of from get_cached.
+        """
+        return _first(_execute('users', 'select', get_client().table('users')
+                               .select('tier', 'reports_used', 'reports_period').eq('id', user_id)))
+
+    @staticmethod
+    def get_by_email(email):
+        return _first(_execute('users', 'select', get_client().table('users').select('id', 'email', 'tier').eq('email', email)))
+
+    @staticmethod
+    def get_tiers(user_ids):
+        """{user_id: tier}, querying IN_CHUNK_SIZE ids at a time to keep URLs short"""
+        user_ids = sorted(set(user_ids))
+        tiers = {}
+        for start in range(0, len(user_ids), IN_CHUNK_SIZE):
+            result = _execute('users', 'select', get_client().table('users').select('id', 'tier')
+                              .in_('id', user_ids[start:start + IN_CHUNK_SIZE]))
+            tiers.update((row['id'], row['tier']) for row in result.data)
+        return tiers
+
+    @staticmethod
+    def create(email):
+        return _first(_execute('users', 'insert', get_client().table('users').insert({
+            'email': email,
+            'tier': 'free',
+            'reports_used': 0,
+            'sites_used': 0
+        })))
+
+    @staticmethod
+    def update(user_id, fields):
+        _execute('users', 'update', get_client().table('users').update(fields).eq('id', user_id))
+        invalidate_user(user_id)
+
+    @staticmethod
+    def update_by_subscription(subscription_id, fields):
+        """Update the user owning a Stripe subscription; returns the affected user ids"""
+        result = _execute('users', 'update', get_client().table('users').update(fields).eq('stripe_subscription_id', subscription_id))
+        user_ids = [row['id'] for row in result.data or []]
+        for user_id in user_ids:
+            invalidate_user(user_id)
+        return user_ids
+
+    @staticmethod
+    def bulk_update(updates):
+        """{user_id: fields} -> one UPDATE per distinct fields dict"""
+        queries = _bulk_update('users', 'id', updates)
+        for user_id in updates:
+            invalidate_user(user_id)
+        return queries
+
+
+class QuotaRepo:
+    """users.reports_used, changed only through the functions in supabase/migrations/*_report_quota.sql"""
+
+    @staticmethod
+    def reserve(user_id, period, limit, units, ttl):
+        """A reservation id, or None if the units don't fit under limit"""
+        row = _first(_execute('reserve_report_quota', 'rpc', get_client().rpc('reserve_report_quota', {
+            'p_user_id': user_id,
+            'p_period': period,
+            'p_limit': limit,
+            'p_units': units,
+            'p_ttl_seconds': int(ttl)
+        })))
+        return row['reservation_id'] if row else None
+
+    @staticmethod
+    def commit(reservation_id):
+        _execute('report_reservations', 'update', get_client().table('report_reservations')
+                 .update({'status': 'committed'}).eq('id', reservation_id).eq('status', 'reserved'))
+
+    @staticmethod
+    def refund(reservation_id, status):
+        result = _execute('refund_report_quota', 'rpc', get_client().rpc('refund_report_quota', {
+            'p_reservation_id': reservation_id,
+            'p_status': status
+        }))
+        return bool(result.data)
+
+    @staticmethod
+    def expire(ttl):
+        return len(_execute('expire_report_quota', 'rpc', get_client().rpc('expire_report_quota', {
+            'p_ttl_seconds': int(ttl)
+        })).data)
+
+
+class ReportsRepo:
+
+    COLUMNS = ('id', 'site_url', 'traffic', 'roi', 'created_at')
+
+    @staticmethod
+    def recent(user_id, limit=RECENT_REPORTS_LIMIT):
+        return _execute('reports', 'select', get_client().table('reports').select(*ReportsRepo.COLUMNS)
+                        .eq('user_id', user_id).order('created_at', desc=True).limit(limit)).data
+
+    @staticmethod
+    def recent_cached(user_id):
+        """The last RECENT_REPORTS_LIMIT reports through the shared user cache"""
+        return user_cache.get_or_compute(f"reports:{user_id}", lambda: ReportsRepo.recent(user_id))
+
+    @staticmethod
+    def insert(row):
+        result = _first(_execute('reports', 'insert', get_client().table('reports').insert(row)))
+        invalidate_user(row['user_id'])
+        return result
+
+    @staticmethod
+    def insert_many(rows):
+        """Insert report rows INSERT_CHUNK_SIZE at a time (bulk runs)"""
+        result = _insert_many('reports', rows)
+        for user_id in {row['user_id'] for row in rows}:
+            invalidate_user(user_id)
+        return result
+
+
+class SitesRepo:
+
+    @staticmethod
+    def exists(user_id, url):
+        result = _execute('sites', 'select', get_client().table('sites').select('id').eq('user_id', user_id).eq('url', url).limit(1))
+        return bool(result.data)
+
+    @staticmethod
+    def count(user_id):
+        # Server-side count; only one id comes back over the wire
+        result = _execute('sites', 'count', get_client().table('sites').select('id', count='exact').eq('user_id', user_id).limit(1))
+        return result.count or 0
+
+    @staticmethod
+    def insert(user_id, url):
+        return _first(_execute('sites', 'insert', get_client().table('sites').insert({'user_id': user_id, 'url': url})))
+
+    @staticmethod
+    def all_targets():
+        """(user_id, url) for every site, paged so no row is lost to the response cap"""
+        return _paged('sites', lambda: get_client().table('sites').select('user_id', 'url').order('id'))
+
+
+class SchedulesRepo:
+    """report_schedules: one row per (user_id, site_url), times in UTC epoch seconds (see utils.scheduler)"""
+
+    COLUMNS = ('id', 'user_id', 'site_url', 'frequency', 'day', 'hour', 'avg_order_value',
+               'next_due_at', 'next_run_at', 'attempts')
+
+    @staticmethod
+    def upsert(row):
+        return _first(_execute('report_schedules', 'upsert', get_client().table('report_schedules')
+                               .upsert(row, on_conflict='user_id,site_url')))
+
+    @staticmethod
+    def for_user(user_id):
+        return _execute('report_schedules', 'select', get_client().table('report_schedules')
+                        .select('id', 'site_url', 'frequency', 'day', 'hour', 'avg_order_value', 'next_run_at')
+                        .eq('user_id', user_id).eq('active', True).order('site_url')).data
+
+    @staticmethod
+    def delete(user_id, schedule_id):
+        result = _execute('report_schedules', 'delete', get_client().table('report_schedules').delete()
+                          .eq('id', schedule_id).eq('user_id', user_id))
+        return bool(result.data)
+
+    @staticmethod
+    def update(schedule_id, fields):
+        _execute('report_schedules', 'update', get_client().table('report_schedules').update(fields).eq('id', schedule_id))
+
+    @staticmethod
+    def due(now, limit):
+        return _execute('report_schedules', 'select', get_client().table('report_schedules').select(*SchedulesRepo.COLUMNS)
+                        .eq('active', True).lte('next_run_at', now).order('next_run_at').limit(limit)).data
+
+    @staticmethod
+    def claim(schedule_id, next_run_at, fields):
+        """Apply fields only if next_run_at is unchanged (no other worker claimed it); True if applied"""
+        result = _execute('report_schedules', 'update', get_client().table('report_schedules')
+                          .update(fields).eq('id', schedule_id).eq('next_run_at', next_run_at))
+        return bool(result.data)
+
+    @staticmethod
+    def next_run_at():
+        """Earliest next_run_at among active schedules, or None"""
+        row = _first(_execute('report_schedules', 'select', get_client().table('report_schedules')
+                              .select('next_run_at').eq('active', True).order('next_run_at').limit(1)))
+        return row['next_run_at'] if row else None
+
+    @staticmethod
+    def count(due_by=None):
+        """Active schedules (only those due by due_by, if given), counted server-side"""
+        query = get_client().table('report_schedules').select('id', count='exact').eq('active', True)
+        if due_by is not None:
+            query = query.lte('next_run_at', due_by)
+        return _execute('report_schedules', 'count', query.limit(1)).count or 0
+
+
+class JobsRepo:
+    """report_jobs: background job records (see utils.jobs), times in epoch seconds"""
+
+    @staticmethod
+    def insert(record):
+        _execute('report_jobs', 'insert', get_client().table('report_jobs').insert(record))
+
+    @staticmethod
+    def get(job_id):
+        return _first(_execute('report_jobs', 'select', get_client().table('report_jobs').select('*').eq('id', job_id)))
+
+    @staticmethod
+    def update(job_id, fields, status=None):
+        """Apply fields (only while the job is in status, if given); True if a row changed"""
+        query = get_client().table('report_jobs').update(fields).eq('id', job_id)
+        if status is not None:
+            query = query.eq('status', status)
+        return bool(_execute('report_jobs', 'update', query).data)
+
+    @staticmethod
+    def queued(limit):
+        return _execute('report_jobs', 'select', get_client().table('report_jobs').select('*')
+                        .eq('status', 'queued').order('created_at').limit(limit)).data
+
+    @staticmethod
+    def fail_stale(cutoff, error):
+        """Fail queued or running jobs not updated since cutoff; returns their ids"""
+        result = _execute('report_jobs', 'update', get_client().table('report_jobs')
+                          .update({'status': 'failed', 'error': error, 'finished_at': time.time()})
+                          .in_('status', ['queued', 'running']).lt('updated_at', cutoff))
+        return [row['id'] for row in result.data]
+
+    @staticmethod
+    def prune(cutoff):
+        _execute('report_jobs', 'delete', get_client().table('report_jobs').delete().lt('created_at', cutoff))
+
+
+class MagicLinksRepo:
+
+    @staticmethod
+    def create(email, token, expires_at):
+        _execute('magic_links', 'insert', get_client().table('magic_links').insert({
+            'email': email,
+            'token': token,
+            'expires_at': expires_at.isoformat()
+        }))
+
+    @staticmethod
+    def consume(token):
+        """Delete a token and return its row (one round trip), or None if unknown"""
+        return _first(_execute('magic_links', 'delete', get_client().table('magic_links').delete().eq('token', token)))
+
+
+class GoogleTokensRepo:
+
+    @staticmethod
+    def get(user_id):
+        return _first(_execute('google_tokens', 'select', get_client().table('google_tokens')
+                               .select('access_token', 'refresh_token', 'expires_at').eq('user_id', user_id)))
+
+    @staticmethod
+    def upsert(row):
+        _execute('google_tokens', 'upsert', get_client().table('google_tokens').upsert(row))
+
+    @staticmethod
+    def update(user_id, fields):
+        _execute('google_tokens', 'update', get_client().table('google_tokens').update(fields).eq('user_id', user_id))
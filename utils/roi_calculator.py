@@ -18,20 +18,9 @@ class ROICalculator:
     
     @staticmethod
     def get_ga4_conversions(google_client, site_url):
-        """Pull conversions from GA4"""
+        """Pull conversions from GA4 (same batchRunReports call as the traffic data)"""
         try:
-            # This would use the google_client to fetch real GA4 data
-            # For now returning structure for integration
-            service = google_client.credentials  # Simplified
-            
-            # GA4 API call would go here
-            # response = service.properties().runReport(...)
-            
-            return {
-                'conversions': 45,
-                'conversion_rate': 3.75,
-                'previous_conversions': 38
-            }
+            return google_client.get_conversions_data(site_url)
         except:
             return None
     
@@ -52,9 +41,10 @@ class ROICalculator:
         return f"${amount:,.0f}"
     
     @staticmethod
-    def get_roi_summary(organic_traffic, conversions, avg_order_value=100):
-        """Generate ROI summary text"""
-        revenue = ROICalculator.calculate_roi(conversions, avg_order_value)
+    def get_roi_summary(organic_traffic, conversions, avg_order_value=100, revenue=None):
+        """Generate ROI summary text (revenue defaults to conversions x avg_order_value)"""
+        if revenue is None:
+            revenue = ROICalculator.calculate_roi(conversions, avg_order_value)
         conversion_rate = (conversions / organic_traffic * 100) if organic_traffic > 0 else 0
         
         return {
@@ -0,0 +1,343 @@
+"""
+Scheduled report delivery (the email_scheduling tier feature)
+
+Schedules live in Supabase (report_schedules, one row per user and site)
+with a weekly or monthly cadence at a UTC hour; times are epoch seconds.
+Each schedule's next run time is kept in an indexed next_run_at column, so
+finding due work, or how long to sleep, is a single index lookup however
+many schedules exist. Every run is offset from its nominal time by a stable
+per-schedule jitter (up to SCHEDULE_JITTER seconds), so "9:00 on the 1st"
+turns into a spread of runs instead of a stampede on PSI, the Google APIs
+and ReportLab.
+
+A worker claims a due schedule by moving its next_run_at SCHEDULE_LEASE
+seconds ahead with a conditional update (safe with several workers), and
+only advances it to the next period once the run is sent or skipped. A
+failed run (or a worker that died mid-run) is retried after
+SCHEDULE_RETRY_DELAY, doubling each time, up to SCHEDULE_MAX_ATTEMPTS; the
+email idempotency key stays the same across retries. At most
+SCHEDULER_CONCURRENCY reports run at once through the normal report
+pipeline, and each run's lag and latency go to the worker's local run log.
+
+    python -m utils.scheduler           # run the worker
+    python -m utils.scheduler --once    # run what is due now and exit
+    python -m utils.scheduler --stats
+"""
+import argparse
+import calendar
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+
+from utils.cache import DEFAULT_CACHE_PATH
+from utils.email_sender import EmailSender
+from utils.jobs import StageTimer, percentile
+from utils.metering import quota_meter
+from utils.outbox import outbox
+from utils.repository import ReportsRepo, SchedulesRepo, UsersRepo
+from utils.throttler import Throttler
+
+SCHEDULE_JITTER = float(os.getenv('SCHEDULE_JITTER', 2 * 3600))
+SCHEDULE_LEASE = int(os.getenv('SCHEDULE_LEASE', 3600))
+SCHEDULE_RETRY_DELAY = int(os.getenv('SCHEDULE_RETRY_DELAY', 15 * 60))
+SCHEDULE_MAX_ATTEMPTS = int(os.getenv('SCHEDULE_MAX_ATTEMPTS', 3))
+SCHEDULER_CONCURRENCY = int(os.getenv('SCHEDULER_CONCURRENCY', 4))
+SCHEDULER_POLL_INTERVAL = float(os.getenv('SCHEDULER_POLL_INTERVAL', 30))
+SCHEDULE_RUNS_KEPT = int(os.getenv('SCHEDULE_RUNS_KEPT', 10000))
+
+FREQUENCIES = ('weekly', 'monthly')
+
+
+def next_occurrence(frequency, day, hour, after):
+    """First nominal run strictly after `after` (UTC timestamp).
+
+    weekly: day is the weekday (0 = Monday); monthly: day of month, 1-28.
+    """
+    now = datetime.fromtimestamp(after, timezone.utc)
+    if frequency == 'weekly':
+        candidate = now.replace(hour=hour, minute=0, second=0, microsecond=0) + timedelta(days=(day - now.weekday()) % 7)
+        if candidate.timestamp() <= after:
+            candidate += timedelta(days=7)
+    else:
+        candidate = now.replace(day=day, hour=hour, minute=0, second=0, microsecond=0)
+        if candidate.timestamp() <= after:
+            year, month = (now.year + 1, 1) if now.month == 12 else (now.year, now.month + 1)
+            candidate = candidate.replace(year=year, month=month, day=min(day, calendar.monthrange(year, month)[1]))
+    return candidate.timestamp()
+
+
+def jitter(schedule_id, nominal):
+    """Stable offset in [0, SCHEDULE_JITTER) for one schedule's run"""
+    digest = hashlib.sha256(f"{schedule_id}:{int(nominal)}".encode()).digest()
+    return int.from_bytes(digest[:4], 'big') / 2 ** 32 * SCHEDULE_JITTER
+
+
+class Scheduler:
+
+    def __init__(self, path=None, concurrency=SCHEDULER_CONCURRENCY):
+        # Local run log only; the schedules themselves are in Supabase
+        self.path = path or os.getenv('SCHEDULER_PATH', DEFAULT_CACHE_PATH)
+        self.concurrency = concurrency
+        self._local = threading.local()
+        with self._conn() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS schedule_runs ("
+                "id INTEGER PRIMARY KEY AUTOINCREMENT, schedule_id TEXT NOT NULL, due_at REAL NOT NULL, "
+                "started_at REAL NOT NULL, finished_at REAL, status TEXT NOT NULL, "
+                "lag_seconds REAL, seconds REAL, artifact_key TEXT, stages TEXT, error TEXT)"
+            )
+
+    def _conn(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            self._local.conn = conn
+        return conn
+
+    @staticmethod
+    def _times(user_id, site_url, frequency, day, hour, after):
+        due = next_occurrence(frequency, day, hour, after)
+        return int(due), int(due + jitter(f"{user_id}:{site_url}", due))
+
+    def upsert(self, user_id, site_url, frequency='monthly', day=1, hour=9, avg_order_value=100):
+        """Create or change the schedule for (user_id, site_url); returns it"""
+        if frequency not in FREQUENCIES:
+            raise ValueError(f"frequency must be one of {', '.join(FREQUENCIES)}")
+        if not (0 <= day <= 6 if frequency == 'weekly' else 1 <= day <= 28) or not 0 <= hour <= 23:
+            raise ValueError('day must be 0-6 (weekly) or 1-28 (monthly) and hour 0-23')
+
+        due, run_at = self._times(user_id, site_url, frequency, day, hour, time.time())
+        return SchedulesRepo.upsert({
+            'user_id': user_id,
+            'site_url': site_url,
+            'frequency': frequency,
+            'day': day,
+            'hour': hour,
+            'avg_order_value': avg_order_value,
+            'active': True,
+            'next_due_at': due,
+            'next_run_at': run_at,
+            'attempts': 0
+        })
+
+    def for_user(self, user_id):
+        return SchedulesRepo.for_user(user_id)
+
+    def delete(self, user_id, schedule_id):
+        return SchedulesRepo.delete(user_id, schedule_id)
+
+    def next_wakeup(self):
+        """Earliest next_run_at among active schedules, or None"""
+        return SchedulesRepo.next_run_at()
+
+    def claim(self, limit, now=None):
+        """Take up to limit due schedules, leasing each for SCHEDULE_LEASE seconds so no other worker takes them"""
+        now = int(now or time.time())
+        claimed = []
+        for schedule in SchedulesRepo.due(now, limit):
+            schedule['attempts'] = (schedule.get('attempts') or 0) + 1
+            if not SchedulesRepo.claim(schedule['id'], schedule['next_run_at'],
+                                       {'next_run_at': now + SCHEDULE_LEASE, 'attempts': schedule['attempts']}):
+                continue
+            schedule['run_id'] = self._conn().execute(
+                "INSERT INTO schedule_runs (schedule_id, due_at, started_at, status) VALUES (?, ?, ?, 'running')",
+                (str(schedule['id']), schedule['next_due_at'], now)
+            ).lastrowid
+            claimed.append(schedule)
+        return claimed
+
+    def _advance(self, schedule, fields=None):
+        """Move a schedule on to its next period"""
+        due, run_at = self._times(schedule['user_id'], schedule['site_url'], schedule['frequency'],
+                                  schedule['day'], schedule['hour'], time.time())
+        SchedulesRepo.update(schedule['id'], {'next_due_at': due, 'next_run_at': run_at, 'attempts': 0, **(fields or {})})
+
+    def _retry(self, schedule):
+        """Run a failed schedule again for the same period, or give up on it after SCHEDULE_MAX_ATTEMPTS"""
+        if schedule['attempts'] >= SCHEDULE_MAX_ATTEMPTS:
+            print(f"Scheduled report for {schedule['site_url']} failed {schedule['attempts']} times; skipping to next period")
+            self._advance(schedule)
+            return
+        delay = SCHEDULE_RETRY_DELAY * 2 ** (schedule['attempts'] - 1)
+        SchedulesRepo.update(schedule['id'], {'next_run_at': int(time.time() + delay)})
+
+    def _finish(self, run_id, status, started, lag, timer=None, artifact_key=None, error=None):
+        self._conn().execute(
+            "UPDATE schedule_runs SET status = ?, finished_at = ?, lag_seconds = ?, seconds = ?, "
+            "artifact_key = ?, stages = ?, error = ? WHERE id = ?",
+            (status, time.time(), round(lag, 1), round(time.perf_counter() - started, 3), artifact_key,
+             json.dumps(timer.stages) if timer else None, error, run_id)
+        )
+
+    def run_schedule(self, schedule):
+        """Generate and email one scheduled report, recording the run"""
+        # The web app only manages schedules; the pipeline (ReportLab, NumPy) loads in the worker
+        from utils.report_pipeline import report_job
+        
+        started = time.perf_counter()
+        # How late the run started relative to its nominal time (includes jitter)
+        lag = time.time() - schedule['next_due_at']
+
+        timer = StageTimer()
+        try:
+            user = UsersRepo.get(schedule['user_id'])
+            if not user or not Throttler.can_schedule_reports(user)[0]:
+                self._advance(schedule, {'active': False})
+                self._finish(schedule['run_id'], 'skipped', started, lag, error='email scheduling not in plan')
+                return 'skipped'
+
+            reservation_id, error = Throttler.reserve_report(user)
+            if error:
+                self._advance(schedule)
+                self._finish(schedule['run_id'], 'skipped', started, lag, error=error)
+                return 'skipped'
+
+            result = report_job(timer, schedule['site_url'], schedule['avg_order_value'], user['tier'],
+                                reservation_id, user_id=user['id'])
+            with timer.stage('email'):
+                EmailSender.send_report(
+                    user['email'],
+                    schedule['site_url'],
+                    result['artifact_key'],
+                    idempotency_key=f"schedule:{schedule['id']}:{int(schedule['next_due_at'])}"
+                )
+        except Exception as e:
+            print(f"Scheduled report error for {schedule['site_url']} (attempt {schedule['attempts']}): {e}")
+            self._finish(schedule['run_id'], 'failed', started, lag, timer=timer, error=str(e)[:1000])
+            try:
+                self._retry(schedule)
+            except Exception as e:
+                # The lease runs out and the schedule is claimed again
+                print(f"Schedule update error for {schedule['site_url']}: {e}")
+            return 'failed'
+
+        try:
+            ReportsRepo.insert({
+                'user_id': user['id'],
+                'site_url': schedule['site_url'],
+                'traffic': result['traffic'],
+                'roi': result['roi']
+            })
+        except Exception as e:
+            print(f"Report history error: {e}")
+
+        try:
+            self._advance(schedule)
+        except Exception as e:
+            # Rerun after the lease; the email key is unchanged so nothing is sent twice
+            print(f"Schedule update error for {schedule['site_url']}: {e}")
+
+        self._finish(schedule['run_id'], 'sent', started, lag, timer=timer, artifact_key=result['artifact_key'])
+        return 'sent'
+
+    def run_due(self, pool, in_flight):
+        """Submit due schedules to pool without exceeding the concurrency limit"""
+        in_flight.difference_update({future for future in in_flight if future.done()})
+        free = self.concurrency - len(in_flight)
+        if free <= 0:
+            return 0
+        schedules = self.claim(free)
+        for schedule in schedules:
+            in_flight.add(pool.submit(self.run_schedule, schedule))
+        return len(schedules)
+
+    def run_forever(self, poll_interval=SCHEDULER_POLL_INTERVAL, once=False):
+        in_flight = set()
+        pruned_at = 0
+        with ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix='schedule') as pool:
+            while True:
+                if time.time() - pruned_at > 3600:
+                    self.prune()
+                    try:
+                        # Quota held by report jobs that died on any instance
+                        quota_meter.expire_reservations()
+                    except Exception as e:
+                        print(f"Quota expiry error: {e}")
+                    pruned_at = time.time()
+
+                try:
+                    started = self.run_due(pool, in_flight)
+                except Exception as e:
+                    print(f"Scheduler error: {e}")
+                    started = 0
+
+                if once:
+                    if not started and not in_flight:
+                        break
+                    time.sleep(0.1 if started else 1)
+                    continue
+
+                # Sleep until the next schedule is due (or a slot frees up), capped at poll_interval
+                try:
+                    wakeup = self.next_wakeup()
+                except Exception as e:
+                    print(f"Scheduler error: {e}")
+                    wakeup = None
+                delay = poll_interval if wakeup is None else min(poll_interval, max(wakeup - time.time(), 0))
+                if in_flight and len(in_flight) >= self.concurrency:
+                    delay = min(delay, 1)
+                time.sleep(max(delay, 0.05))
+
+    def prune(self, keep=SCHEDULE_RUNS_KEPT):
+        self._conn().execute(
+            "DELETE FROM schedule_runs WHERE id <= (SELECT MAX(id) FROM schedule_runs) - ?", (keep,)
+        )
+
+    def stats(self, recent=1000):
+        conn = self._conn()
+        rows = conn.execute(
+            "SELECT status, lag_seconds, seconds FROM schedule_runs WHERE finished_at IS NOT NULL "
+            "ORDER BY id DESC LIMIT ?",
+            (recent,)
+        ).fetchall()
+        sent = [row for row in rows if row[0] == 'sent']
+        statuses = {}
+        for status, _, _ in rows:
+            statuses[status] = statuses.get(status, 0) + 1
+
+        try:
+            schedules, due = SchedulesRepo.count(), SchedulesRepo.count(due_by=int(time.time()))
+        except Exception as e:
+            print(f"Scheduler stats error: {e}")
+            schedules = due = None
+
+        return {
+            'schedules': schedules,
+            'due': due,
+            'running': conn.execute("SELECT COUNT(*) FROM schedule_runs WHERE status = 'running'").fetchone()[0],
+            'recent_runs': statuses,
+            'latency_p50': percentile([row[2] for row in sent], 50),
+            'latency_p95': percentile([row[2] for row in sent], 95),
+            'lag_p95': percentile([row[1] for row in sent], 95)
+        }
+
+
+scheduler = Scheduler()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Scheduled report delivery worker')
+    parser.add_argument('--once', action='store_true', help='run every due schedule, then exit')
+    parser.add_argument('--stats', action='store_true', help='print run statistics and exit')
+    parser.add_argument('--concurrency', type=int, default=SCHEDULER_CONCURRENCY)
+    args = parser.parse_args()
+
+    if args.stats:
+        print(json.dumps(scheduler.stats(), indent=2))
+        return
+
+    scheduler.concurrency = args.concurrency
+    print(f"⏰ Scheduler running ({scheduler.concurrency} concurrent reports): {scheduler.stats()}")
+    scheduler.run_forever(once=args.once)
+    # Deliver the queued report emails before a --once run exits
+    outbox.drain()
+
+
+if __name__ == '__main__':
+    main()
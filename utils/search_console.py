@@ -0,0 +1,215 @@
+"""
+Paginated Search Console ingestion with streaming aggregation
+
+searchanalytics.query returns at most 25,000 rows per call, so the report
+pages through every (query, page) row with startRow and folds each page into
+per-query and per-page totals before requesting the next. Rows are never
+held beyond one page, and each dimension keeps at most max_keys entries (the
+lowest-click keys are pruned when it overflows), so memory stays bounded
+for very large properties. Top-k lists are taken with a heap at the end.
+"""
+import heapq
+import os
+from datetime import timedelta
+
+SEARCH_PAGE_SIZE = int(os.getenv('SEARCH_PAGE_SIZE', 25000))
+SEARCH_MAX_ROWS = int(os.getenv('SEARCH_MAX_ROWS', 250000))
+SEARCH_MAX_KEYS = int(os.getenv('SEARCH_MAX_KEYS', 200000))
+
+
+class SearchRows:
+    """Rows of one query, fetched page by page with startRow until the API runs out or max_rows is reached.
+
+    After iteration, truncated is True if max_rows stopped the paging while
+    the API still had full pages to return.
+    """
+
+    def __init__(self, service, site_url, body, page_size=SEARCH_PAGE_SIZE, max_rows=SEARCH_MAX_ROWS):
+        self.service = service
+        self.site_url = site_url
+        self.body = body
+        self.page_size = page_size
+        self.max_rows = max_rows
+        self.truncated = False
+
+    def __iter__(self):
+        start_row = 0
+        while start_row < self.max_rows:
+            rows = self.service.searchanalytics().query(
+                siteUrl=self.site_url,
+                body={**self.body, 'rowLimit': min(self.page_size, self.max_rows - start_row), 'startRow': start_row}
+            ).execute().get('rows', [])
+
+            yield from rows
+
+            if len(rows) < min(self.page_size, self.max_rows - start_row):
+                return
+            start_row += len(rows)
+        self.truncated = True
+
+
+def iter_search_rows(service, site_url, body, page_size=SEARCH_PAGE_SIZE, max_rows=SEARCH_MAX_ROWS):
+    """Iterable over every row of the query (see SearchRows; check .truncated afterwards)"""
+    return SearchRows(service, site_url, body, page_size, max_rows)
+
+
+class DimensionTotals:
+    """Clicks, impressions and impression-weighted position per key, bounded to max_keys"""
+
+    def __init__(self, max_keys=SEARCH_MAX_KEYS):
+        self.max_keys = max_keys
+        self.totals = {}
+        self.pruned_keys = 0
+        self.pruned_max_clicks = 0
+
+    def add(self, key, clicks, impressions, position):
+        entry = self.totals.get(key)
+        if entry is None:
+            if len(self.totals) >= self.max_keys:
+                self._prune()
+            self.totals[key] = [clicks, impressions, position * impressions]
+        else:
+            entry[0] += clicks
+            entry[1] += impressions
+            entry[2] += position * impressions
+
+    def _prune(self):
+        # Keep the top half by clicks; every dropped key had at most pruned_max_clicks at the time
+        keep = heapq.nlargest(self.max_keys // 2, self.totals.items(), key=lambda item: item[1][0])
+        self.pruned_keys += len(self.totals) - len(keep)
+        self.pruned_max_clicks = max(
+            self.pruned_max_clicks,
+            min((entry[0] for _, entry in keep), default=0)
+        )
+        self.totals = dict(keep)
+
+    def top(self, k):
+        """[(key, clicks, impressions, ctr, position)] for the k keys with the most clicks"""
+        top = heapq.nlargest(k, self.totals.items(), key=lambda item: (item[1][0], item[1][1]))
+        return [
+            (key, clicks, impressions, clicks / impressions if impressions else 0.0, weighted / impressions if impressions else 0.0)
+            for key, (clicks, impressions, weighted) in top
+        ]
+
+
+class SearchAggregator:
+    """Folds (query, page) rows into per-query and per-page totals"""
+
+    def __init__(self, max_keys=SEARCH_MAX_KEYS):
+        self.queries = DimensionTotals(max_keys)
+        self.pages = DimensionTotals(max_keys)
+        self.rows = 0
+        self.clicks = 0
+        self.impressions = 0
+        self.truncated = False
+
+    def add_row(self, row):
+        keys = row['keys']
+        clicks = row['clicks']
+        impressions = row['impressions']
+        position = row['position']
+
+        self.rows += 1
+        self.clicks += clicks
+        self.impressions += impressions
+        self.queries.add(keys[0], clicks, impressions, position)
+        if len(keys) > 1:
+            self.pages.add(keys[1], clicks, impressions, position)
+
+    def consume(self, rows):
+        for row in rows:
+            self.add_row(row)
+        # SearchRows stopped by max_rows: the totals miss the rest of the property
+        self.truncated = self.truncated or getattr(rows, 'truncated', False)
+        return self
+
+    def summary(self, top_keywords=5, top_pages=10):
+        """search_data in the shape the report expects, plus totals"""
+        return _search_data(self.queries.top(top_keywords), self.pages.top(top_pages), {
+            'rows': self.rows,
+            'clicks': self.clicks,
+            'impressions': self.impressions,
+            'queries': len(self.queries.totals),
+            'pages': len(self.pages.totals),
+            'approximate': bool(self.truncated or self.queries.pruned_keys or self.pages.pruned_keys),
+            'truncated': self.truncated
+        })
+
+
+def _search_data(top_queries, top_pages, totals):
+    return {
+        'top_keywords': [
+            {
+                'keyword': keyword,
+                'clicks': clicks,
+                'impressions': impressions,
+                'ctr': round(ctr * 100, 2),
+                'position': round(position, 1)
+            }
+            for keyword, clicks, impressions, ctr, position in top_queries
+        ],
+        'top_pages': [
+            {'page': page, 'clicks': clicks}
+            for page, clicks, _, _, _ in top_pages
+        ],
+        'totals': totals
+    }
+
+
+def fetch_daily_totals(service, site_url, start, end, keys_per_day=1000, max_rows=SEARCH_MAX_ROWS):
+    """{date: payload} of per-query/per-page totals for each day in [start, end]
+
+    Each day is its own paginated ['query', 'page'] query, so max_rows caps a
+    single day. (In one query over the whole range the API sorts rows by
+    clicks across all days, and a cap would cut the tail of every day.) Each
+    day keeps its top keys_per_day queries and pages as [key, clicks,
+    impressions, impression-weighted position sum]; truncated records whether
+    max_rows cut that day short.
+    """
+    payloads = {}
+    day = start
+    while day <= end:
+        rows = iter_search_rows(service, site_url, {
+            'startDate': day.isoformat(),
+            'endDate': day.isoformat(),
+            'dimensions': ['query', 'page']
+        }, max_rows=max_rows)
+        aggregator = SearchAggregator().consume(rows)
+        payloads[day] = {
+            'rows': aggregator.rows,
+            'clicks': aggregator.clicks,
+            'impressions': aggregator.impressions,
+            'queries': _top_entries(aggregator.queries, keys_per_day),
+            'pages': _top_entries(aggregator.pages, keys_per_day),
+            'truncated': aggregator.truncated
+        }
+        day += timedelta(days=1)
+    return payloads
+
+
+def _top_entries(totals, k):
+    top = heapq.nlargest(k, totals.totals.items(), key=lambda item: item[1][0])
+    return [[key, clicks, impressions, weighted] for key, (clicks, impressions, weighted) in top]
+
+
+def search_data_from_totals(payload, top_keywords=5, top_pages=10, days=None):
+    """search_data (as SearchAggregator.summary returns) from a merged warehouse payload.
+
+    days is how many days of the window the payload covers (fewer while a backfill is under way).
+    """
+    def entries(name, k):
+        return [
+            (key, clicks, impressions, clicks / impressions if impressions else 0.0, weighted / impressions if impressions else 0.0)
+            for key, clicks, impressions, weighted in payload.get(name, [])[:k]
+        ]
+
+    return _search_data(entries('queries', top_keywords), entries('pages', top_pages), {
+        'rows': payload.get('rows', 0),
+        'clicks': payload.get('clicks', 0),
+        'impressions': payload.get('impressions', 0),
+        'queries': len(payload.get('queries', [])),
+        'pages': len(payload.get('pages', [])),
+        'approximate': True,
+        'truncated': payload.get('truncated', False),
+        'days': days
+    })
@@ -0,0 +1,258 @@
+"""
+Site-level SEO crawl
+
+Discovers pages from robots.txt Sitemap: lines (falling back to
+/sitemap.xml), following sitemap indexes and gzipped sitemaps, then fetches
+up to a page budget with asyncio: a global concurrency limit, a minimum
+delay between requests to the same host (or the robots.txt Crawl-delay if
+larger) and robots.txt Disallow rules. Every page goes through the same
+streaming parser and checks as /audit; the result is aggregate statistics
+plus the worst pages.
+
+    python -m utils.site_crawler https://example.com --max-pages 200
+"""
+import argparse
+import asyncio
+import json
+import os
+import time
+import zlib
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urljoin, urlsplit
+from urllib.robotparser import RobotFileParser
+from xml.etree import ElementTree
+
+from utils.http_client import http_client
+from utils.page_scraper import build_seo_checks, fetch_seo_signals
+
+CRAWL_MAX_PAGES = int(os.getenv('CRAWL_MAX_PAGES', 200))
+CRAWL_CONCURRENCY = int(os.getenv('CRAWL_CONCURRENCY', 8))
+CRAWL_HOST_DELAY = float(os.getenv('CRAWL_HOST_DELAY', 0.25))
+CRAWL_MAX_SITEMAPS = int(os.getenv('CRAWL_MAX_SITEMAPS', 50))
+SITEMAP_MAX_BYTES = 50 * 1024 * 1024  # sitemaps.org limit, uncompressed
+USER_AGENT = 'ReportRiserBot/1.0 (+https://reportriser.com)'
+WORST_PAGES = 10
+
+CHECKS = ('title', 'meta_desc', 'h1', 'alt')
+
+
+def _host(url):
+    host = (urlsplit(url).hostname or '').lower()
+    return host[4:] if host.startswith('www.') else host
+
+
+def _read_capped(url, timeout=15):
+    """Response body of url, gunzipped if needed, never more than SITEMAP_MAX_BYTES"""
+    response = http_client.get(url, timeout=timeout, headers={'User-Agent': USER_AGENT}, stream=True)
+    try:
+        response.raise_for_status()
+        raw = bytearray()
+        for chunk in response.iter_content(chunk_size=64 * 1024):
+            raw += chunk
+            if len(raw) > SITEMAP_MAX_BYTES:
+                raise ValueError(f"{url} exceeds {SITEMAP_MAX_BYTES} bytes")
+    finally:
+        response.close()
+
+    if raw[:2] == b'\x1f\x8b':
+        decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        data = decompressor.decompress(bytes(raw), SITEMAP_MAX_BYTES + 1)
+        if len(data) > SITEMAP_MAX_BYTES or decompressor.unconsumed_tail:
+            raise ValueError(f"{url} expands beyond {SITEMAP_MAX_BYTES} bytes")
+        return data
+    return bytes(raw)
+
+
+def parse_sitemap(data):
+    """('index', [child sitemap URLs]) or ('urlset', [page URLs])"""
+    root = ElementTree.fromstring(data)
+    kind = 'index' if root.tag.endswith('sitemapindex') else 'urlset'
+    locs = [
+        element.text.strip()
+        for element in root.iter()
+        if element.tag.endswith('loc') and element.text and element.text.strip()
+    ]
+    return kind, locs
+
+
+class SiteCrawler:
+
+    def __init__(self, site_url, max_pages=CRAWL_MAX_PAGES, concurrency=CRAWL_CONCURRENCY,
+                 host_delay=CRAWL_HOST_DELAY, max_sitemaps=CRAWL_MAX_SITEMAPS):
+        if '://' not in site_url:
+            site_url = f"https://{site_url}"
+        parts = urlsplit(site_url)
+        self.origin = f"{parts.scheme}://{parts.netloc}"
+        self.site_url = site_url
+        self.host = _host(site_url)
+        self.max_pages = max_pages
+        self.concurrency = concurrency
+        self.host_delay = host_delay
+        self.max_sitemaps = max_sitemaps
+        self.robots = None
+
+        self._executor = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix='crawl')
+        self._host_locks = {}
+        self._next_request_at = {}
+
+    async def _call(self, fn, *args, **kwargs):
+        # Blocking I/O runs on the crawler's own pool, sized to the concurrency limit
+        return await asyncio.get_running_loop().run_in_executor(self._executor, lambda: fn(*args, **kwargs))
+
+    async def _polite(self, url):
+        """Wait until url's host may be hit again, then book the next slot"""
+        host = urlsplit(url).netloc
+        lock = self._host_locks.setdefault(host, asyncio.Lock())
+        async with lock:
+            wait = self._next_request_at.get(host, 0) - time.monotonic()
+            if wait > 0:
+                await asyncio.sleep(wait)
+            self._next_request_at[host] = time.monotonic() + self.host_delay
+
+    async def _load_robots(self):
+        self.robots = RobotFileParser()
+        try:
+            text = (await self._call(_read_capped, f"{self.origin}/robots.txt")).decode('utf-8', 'replace')
+        except Exception:
+            text = ''
+        self.robots.parse(text.splitlines())
+
+        crawl_delay = self.robots.crawl_delay(USER_AGENT)
+        if crawl_delay:
+            self.host_delay = max(self.host_delay, float(crawl_delay))
+
+        return self.robots.site_maps() or [f"{self.origin}/sitemap.xml"]
+
+    async def discover(self):
+        """Page URLs on this site from the sitemaps (breadth-first, up to max_pages)"""
+        pending = await self._load_robots()
+        seen_sitemaps = set()
+        pages = []
+        seen_pages = set()
+
+        while pending and len(pages) < self.max_pages and len(seen_sitemaps) < self.max_sitemaps:
+            batch = [url for url in pending if url not in seen_sitemaps][:self.concurrency]
+            pending = [url for url in pending if url not in seen_sitemaps][self.concurrency:]
+            seen_sitemaps.update(batch)
+
+            results = await asyncio.gather(*(self._call(_read_capped, url) for url in batch), return_exceptions=True)
+            for url, result in zip(batch, results):
+                if isinstance(result, Exception):
+                    print(f"Sitemap error for {url}: {result}")
+                    continue
+                try:
+                    kind, locs = parse_sitemap(result)
+                except ElementTree.ParseError as e:
+                    print(f"Sitemap parse error for {url}: {e}")
+                    continue
+
+                if kind == 'index':
+                    pending.extend(locs)
+                    continue
+                for loc in locs:
+                    if _host(loc) == self.host and loc not in seen_pages and self.robots.can_fetch(USER_AGENT, loc):
+                        seen_pages.add(loc)
+                        pages.append(loc)
+
+        if not pages:
+            pages = [urljoin(self.origin, urlsplit(self.site_url).path or '/')]
+        return pages[:self.max_pages]
+
+    async def _audit_page(self, url, semaphore):
+        async with semaphore:
+            await self._polite(url)
+            started = time.perf_counter()
+            try:
+                signals = await self._call(fetch_seo_signals, url, user_agent=USER_AGENT, raise_for_status=True)
+            except Exception as e:
+                return {'url': url, 'error': str(e), 'seconds': time.perf_counter() - started}
+
+        checks = build_seo_checks(signals)
+        return {
+            'url': url,
+            'title': signals.title,
+            'checks': checks,
+            'issues': [check for check in CHECKS if checks[f"{check}_status"] != 'good'],
+            'seconds': time.perf_counter() - started
+        }
+
+    async def crawl(self):
+        started = time.perf_counter()
+        try:
+            urls = await self.discover()
+            discovered_at = time.perf_counter()
+
+            semaphore = asyncio.Semaphore(self.concurrency)
+            pages = await asyncio.gather(*(self._audit_page(url, semaphore) for url in urls))
+        finally:
+            self._executor.shutdown(wait=False)
+
+        finished = time.perf_counter()
+        return summarize_crawl(self.site_url, pages, discovery_seconds=discovered_at - started, crawl_seconds=finished - discovered_at)
+
+
+def summarize_crawl(site_url, pages, discovery_seconds=0.0, crawl_seconds=0.0):
+    """Aggregate per-page audits into site statistics and the worst pages"""
+    audited = [page for page in pages if 'checks' in page]
+    failed = [page for page in pages if 'error' in page]
+    count = len(audited)
+
+    def passing(check):
+        return round(sum(1 for page in audited if check not in page['issues']) / count * 100, 1) if count else 0
+
+    titles = Counter(page['title'].strip() for page in audited if page['title'] and page['title'].strip())
+    worst = sorted(
+        (page for page in audited if page['issues']),
+        key=lambda page: (-len(page['issues']), -page['checks']['missing_alt_percent'], page['url'])
+    )[:WORST_PAGES]
+
+    return {
+        'site': site_url,
+        'pages_crawled': len(pages),
+        'pages_audited': count,
+        'pages_failed': len(failed),
+        'discovery_seconds': round(discovery_seconds, 2),
+        'crawl_seconds': round(crawl_seconds, 2),
+        'pages_per_second': round(len(pages) / crawl_seconds, 1) if crawl_seconds else None,
+        'aggregates': {
+            'title_pass_percent': passing('title'),
+            'meta_desc_pass_percent': passing('meta_desc'),
+            'h1_pass_percent': passing('h1'),
+            'alt_pass_percent': passing('alt'),
+            'missing_title': sum(1 for page in audited if not page['checks']['title_length']),
+            'missing_meta_desc': sum(1 for page in audited if not page['checks']['meta_desc_length']),
+            'duplicate_titles': sum(n for n in titles.values() if n > 1),
+            'avg_missing_alt_percent': round(sum(page['checks']['missing_alt_percent'] for page in audited) / count, 1) if count else 0
+        },
+        'worst_pages': [
+            {'url': page['url'], 'issues': page['issues'], 'checks': page['checks']}
+            for page in worst
+        ],
+        'failed_pages': [{'url': page['url'], 'error': page['error']} for page in failed[:WORST_PAGES]]
+    }
+
+
+def crawl_site(site_url, **options):
+    """Blocking entry point: crawl site_url and return the summary"""
+    return asyncio.run(SiteCrawler(site_url, **options).crawl())
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Crawl a site from its sitemaps and audit every page')
+    parser.add_argument('site_url')
+    parser.add_argument('--max-pages', type=int, default=CRAWL_MAX_PAGES)
+    parser.add_argument('--concurrency', type=int, default=CRAWL_CONCURRENCY)
+    parser.add_argument('--host-delay', type=float, default=CRAWL_HOST_DELAY)
+    args = parser.parse_args()
+
+    print(json.dumps(crawl_site(
+        args.site_url,
+        max_pages=args.max_pages,
+        concurrency=args.concurrency,
+        host_delay=args.host_delay
+    ), indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -1,3 +1,8 @@
+from utils.locks import file_lock
+from utils.metering import quota_meter
+from utils.repository import SitesRepo, UsersRepo
+
+
 class Throttler:
     
     LIMITS = {
@@ -44,39 +49,59 @@ class Throttler:
         tier = user['tier']
         limits = Throttler.get_limits(tier)
         
-        # Check report limit
-        if user['reports_used'] >= limits['reports_per_month']:
+        # Check report limit (this month's metered usage)
+        if quota_meter.usage(user['id']) >= limits['reports_per_month']:
             return False, f"You've reached your monthly limit of {limits['reports_per_month']} reports. Upgrade to generate more reports."
         
         return True, None
     
     @staticmethod
-    def can_add_site(user, site_url, supabase):
+    def reserve_report(user):
+        """Atomically reserve one report from this month's quota. Returns (reservation_id, error).
+
+        Raises if Supabase can't be reached, rather than guessing.
+        """
+        limits = Throttler.get_limits(user['tier'])
+        
+        reservation_id = quota_meter.reserve(user['id'], limits['reports_per_month'])
+        if reservation_id is None:
+            return None, f"You've reached your monthly limit of {limits['reports_per_month']} reports. Upgrade to generate more reports."
+        
+        return reservation_id, None
+    
+    @staticmethod
+    def can_schedule_reports(user):
+        if not Throttler.get_limits(user['tier'])['email_scheduling']:
+            return False, "Scheduled email reports are available on Premium and Enterprise plans."
+        
+        return True, None
+    
+    @staticmethod
+    def can_add_site(user, site_url):
+        # One add-site sequence per user at a time, across all workers
+        with file_lock(f"sites:{user['id']}"):
+            return Throttler._add_site(user, site_url)
+    
+    @staticmethod
+    def _add_site(user, site_url):
         tier = user['tier']
         limits = Throttler.get_limits(tier)
         
         # Check if site already exists
-        existing_site = supabase.table('sites').select('*').eq('user_id', user['id']).eq('url', site_url).execute()
-        
-        if existing_site.data:
+        if SitesRepo.exists(user['id'], site_url):
             return True, None  # Site already added
         
-        # Count user's sites
-        sites_count = len(supabase.table('sites').select('*').eq('user_id', user['id']).execute().data)
+        # Count user's sites (server-side count, no rows fetched)
+        sites_count = SitesRepo.count(user['id'])
         
         if sites_count >= limits['sites']:
             return False, f"You've reached your limit of {limits['sites']} sites. Upgrade to add more sites."
         
         # Add site
-        supabase.table('sites').insert({
-            'user_id': user['id'],
-            'url': site_url
-        }).execute()
+        SitesRepo.insert(user['id'], site_url)
         
         # Update user's site count
-        supabase.table('users').update({
-            'sites_used': sites_count + 1
-        }).eq('id', user['id']).execute()
+        UsersRepo.update(user['id'], {'sites_used': sites_count + 1})
         
         return True, None
     
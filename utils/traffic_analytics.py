@@ -0,0 +1,118 @@
+"""
+Vectorized daily-traffic analytics
+
+Series are held as NumPy arrays shaped (sites, days) so one pass covers any
+number of sites and any history length: peak/trough, the true daily mean,
+trailing 7-day moving averages, week-over-week growth and anomaly flags
+(days far from their moving average, measured in robust MADs).
+"""
+import numpy as np
+
+WINDOW = 7
+ANOMALY_THRESHOLD = 3.5
+
+
+def to_series(traffic_data):
+    """(labels, dates, users) from traffic_data, missing days filled with 0.
+
+    Dates may be 'YYYYMMDD' (GA4) or 'YYYY-MM-DD'; labels keep the original
+    strings for display, None where a day was filled in.
+    """
+    if not traffic_data:
+        return [], np.array([], dtype='datetime64[D]'), np.zeros(0)
+
+    raw = [row['date'] for row in traffic_data]
+    iso = [d if '-' in d else f"{d[:4]}-{d[4:6]}-{d[6:]}" for d in raw]
+    dates = np.array(iso, dtype='datetime64[D]')
+    values = np.array([row['users'] for row in traffic_data], dtype=np.float64)
+
+    start = dates.min()
+    offsets = (dates - start).astype(np.int64)
+    span = int(offsets.max()) + 1
+
+    users = np.zeros(span)
+    np.add.at(users, offsets, values)
+    labels = [None] * span
+    for offset, label in zip(offsets.tolist(), raw):
+        labels[offset] = label
+
+    return labels, start + np.arange(span), users
+
+
+def moving_average(users, window=WINDOW):
+    """Trailing moving average along the last axis; NaN until a full window is available"""
+    users = np.atleast_2d(users)
+    sums = np.cumsum(np.pad(users, ((0, 0), (1, 0))), axis=1)
+    averages = np.full(users.shape, np.nan)
+    if users.shape[1] >= window:
+        averages[:, window - 1:] = (sums[:, window:] - sums[:, :-window]) / window
+    return averages
+
+
+def analyze_matrix(users, window=WINDOW, threshold=ANOMALY_THRESHOLD):
+    """Per-site statistics for a (sites, days) array in one vectorized pass"""
+    users = np.atleast_2d(np.asarray(users, dtype=np.float64))
+    sites, days = users.shape
+
+    averages = moving_average(users, window)
+
+    if days >= 2 * window:
+        this_week = users[:, -window:].sum(axis=1)
+        last_week = users[:, -2 * window:-window].sum(axis=1)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            wow = np.where(last_week > 0, (this_week - last_week) / last_week * 100, np.nan)
+    else:
+        wow = np.full(sites, np.nan)
+
+    # Compare each day with the average of the window before it
+    expected = np.full(users.shape, np.nan)
+    expected[:, 1:] = averages[:, :-1]
+    residuals = users - expected
+    median = np.nanmedian(residuals, axis=1, keepdims=True) if days > window else np.zeros((sites, 1))
+    mad = np.nanmedian(np.abs(residuals - median), axis=1, keepdims=True) if days > window else np.zeros((sites, 1))
+    scale = np.maximum(1.4826 * mad, 1.0)
+    with np.errstate(invalid='ignore'):
+        anomalies = np.abs(residuals - median) > threshold * scale
+
+    return {
+        'total': users.sum(axis=1),
+        'mean': users.mean(axis=1) if days else np.zeros(sites),
+        'peak_index': users.argmax(axis=1) if days else np.zeros(sites, dtype=int),
+        'trough_index': users.argmin(axis=1) if days else np.zeros(sites, dtype=int),
+        'moving_average': averages,
+        'expected': expected,
+        'wow_growth': wow,
+        'anomalies': anomalies
+    }
+
+
+def summarize(traffic_data, window=WINDOW, threshold=ANOMALY_THRESHOLD):
+    """JSON-friendly summary of one site's traffic_data for the PDF and dashboard"""
+    labels, dates, users = to_series(traffic_data)
+    if not len(users):
+        return None
+
+    stats = analyze_matrix(users, window, threshold)
+
+    def label(index):
+        return labels[index] or str(dates[index])
+
+    peak, trough = int(stats['peak_index'][0]), int(stats['trough_index'][0])
+    wow = stats['wow_growth'][0]
+    averages = stats['moving_average'][0]
+
+    return {
+        'days': len(users),
+        'start': str(dates[0]),
+        'end': str(dates[-1]),
+        'total': int(stats['total'][0]),
+        'mean': round(float(stats['mean'][0]), 1),
+        'peak': {'date': label(peak), 'users': int(users[peak])},
+        'trough': {'date': label(trough), 'users': int(users[trough])},
+        'moving_average': [None if np.isnan(v) else round(float(v), 1) for v in averages],
+        'wow_growth': None if np.isnan(wow) else round(float(wow), 1),
+        'anomalies': [
+            {'date': label(i), 'users': int(users[i]), 'expected': round(float(stats['expected'][0][i]), 1)}
+            for i in np.flatnonzero(stats['anomalies'][0])
+        ]
+    }
@@ -0,0 +1,273 @@
+"""
+Local analytics warehouse: day-partitioned snapshots per site and source
+
+Each (site, source, day) is stored once as a JSON partition. A sync only
+fetches the days after the source's watermark, plus the last few days again
+because GA4 and Search Console keep revising recent data. A sync can be
+capped at max_days (newest first); the days of the window it skipped are
+filled in by later syncs, one capped range at a time. Report windows
+(the last 30 days, and the 30 before them for month-over-month) are then
+read locally. Old daily partitions are compacted into monthly ones:
+
+    python -m utils.warehouse --compact
+"""
+import argparse
+import json
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+from datetime import date, timedelta
+
+from utils.search_console import DimensionTotals
+
+WAREHOUSE_PATH = os.getenv('WAREHOUSE_PATH', os.path.join(tempfile.gettempdir(), 'reportriser_warehouse.sqlite3'))
+WAREHOUSE_RESTATE_DAYS = int(os.getenv('WAREHOUSE_RESTATE_DAYS', 3))
+WAREHOUSE_COMPACT_AFTER_DAYS = int(os.getenv('WAREHOUSE_COMPACT_AFTER_DAYS', 400))
+SEARCH_KEYS_PER_DAY = int(os.getenv('WAREHOUSE_SEARCH_KEYS_PER_DAY', 1000))
+# Search Console is one paged query per day, so a cold 30-day backfill is spread over several reports
+SEARCH_SYNC_MAX_DAYS = int(os.getenv('WAREHOUSE_SEARCH_SYNC_MAX_DAYS', 7))
+
+
+def merge_ga4(payloads):
+    """Sum daily GA4 metrics ({'users', 'conversions', 'value'})"""
+    merged = {'users': 0, 'conversions': 0, 'value': 0}
+    for payload in payloads:
+        for metric in merged:
+            merged[metric] += payload.get(metric, 0)
+    merged['value'] = round(merged['value'], 2)
+    return merged
+
+
+def merge_search(payloads, keys_per_dimension=SEARCH_KEYS_PER_DAY):
+    """Combine per-day Search Console totals, keeping the top keys per dimension"""
+    merged = {'rows': 0, 'clicks': 0, 'impressions': 0}
+    dimensions = {'queries': DimensionTotals(), 'pages': DimensionTotals()}
+    truncated = False
+
+    for payload in payloads:
+        for field in merged:
+            merged[field] += payload.get(field, 0)
+        truncated = truncated or payload.get('truncated', False)
+        for name, totals in dimensions.items():
+            for key, clicks, impressions, weighted in payload.get(name, []):
+                # add() takes a position and weights it by impressions itself
+                totals.add(key, clicks, impressions, weighted / impressions if impressions else 0.0)
+
+    for name, totals in dimensions.items():
+        top = sorted(totals.totals.items(), key=lambda item: -item[1][0])[:keys_per_dimension]
+        merged[name] = [[key, clicks, impressions, weighted] for key, (clicks, impressions, weighted) in top]
+    # Some day hit the per-day row cap, so its totals are undercounted
+    merged['truncated'] = truncated
+    return merged
+
+
+# How partitions of each source are combined (windows and compaction)
+SOURCES = {
+    'ga4': merge_ga4,
+    'search': merge_search
+}
+
+
+class Warehouse:
+
+    def __init__(self, path=None):
+        self.path = path or WAREHOUSE_PATH
+        self._local = threading.local()
+        self.counters = {'days_fetched': 0, 'days_served': 0, 'syncs': 0, 'noop_syncs': 0}
+        self._lock = threading.Lock()
+        with self._conn() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS partitions ("
+                "site TEXT NOT NULL, source TEXT NOT NULL, grain TEXT NOT NULL, period TEXT NOT NULL, "
+                "payload TEXT NOT NULL, fetched_at REAL NOT NULL, "
+                "PRIMARY KEY (site, source, grain, period))"
+            )
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS watermarks ("
+                "site TEXT NOT NULL, source TEXT NOT NULL, last_day TEXT NOT NULL, synced_at REAL NOT NULL, "
+                "PRIMARY KEY (site, source))"
+            )
+
+    def _conn(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+        return conn
+
+    def _count(self, name, amount=1):
+        with self._lock:
+            self.counters[name] += amount
+
+    def watermark(self, site, source):
+        row = self._conn().execute(
+            "SELECT last_day FROM watermarks WHERE site = ? AND source = ?", (site, source)
+        ).fetchone()
+        return date.fromisoformat(row[0]) if row else None
+
+    def missing_range(self, site, source, days, today=None, max_days=None):
+        """(start, end) of days to fetch so the last `days` complete days are present, or None.
+
+        New days (and the restated ones before them) come first; once the
+        watermark is current, the newest gap left by an earlier capped sync.
+        The range is at most max_days long.
+        """
+        end = (today or date.today()) - timedelta(days=1)
+        start = end - timedelta(days=days - 1)
+
+        watermark = self.watermark(site, source)
+        if watermark is not None and watermark >= end:
+            present = self._present_days(site, source, start, end)
+            gaps = [start + timedelta(days=i) for i in range(days) if start + timedelta(days=i) not in present]
+            if not gaps:
+                return None
+            start, end = gaps[0], gaps[-1]
+        elif watermark is not None:
+            start = max(start, watermark + timedelta(days=1) - timedelta(days=WAREHOUSE_RESTATE_DAYS))
+
+        if max_days:
+            start = max(start, end - timedelta(days=max_days - 1))
+        return (start, end) if start <= end else None
+
+    def put_days(self, site, source, payloads, watermark):
+        """Store {date: payload} partitions and advance the watermark in one transaction"""
+        now = time.time()
+        conn = self._conn()
+        with conn:
+            conn.execute('BEGIN IMMEDIATE')
+            conn.executemany(
+                "INSERT OR REPLACE INTO partitions (site, source, grain, period, payload, fetched_at) "
+                "VALUES (?, ?, 'day', ?, ?, ?)",
+                [(site, source, day.isoformat(), json.dumps(payload), now) for day, payload in payloads.items()]
+            )
+            conn.execute(
+                "INSERT OR REPLACE INTO watermarks (site, source, last_day, synced_at) VALUES (?, ?, ?, ?)",
+                (site, source, watermark.isoformat(), now)
+            )
+
+    def sync(self, site, source, fetch, days, today=None, max_days=None):
+        """Fetch the missing days with fetch(start, end) -> {date: payload}; returns days fetched.
+
+        At most max_days days are fetched per call.
+        """
+        self._count('syncs')
+        missing = self.missing_range(site, source, days, today, max_days)
+        if missing is None:
+            self._count('noop_syncs')
+            return 0
+
+        start, end = missing
+        payloads = fetch(start, end)
+        # Days the API returned nothing for still count as synced (empty partitions)
+        day = start
+        while day <= end:
+            payloads.setdefault(day, {})
+            day += timedelta(days=1)
+
+        # Filling a gap behind the watermark must not move it back
+        self.put_days(site, source, payloads, max(end, self.watermark(site, source) or end))
+        self._count('days_fetched', len(payloads))
+        return len(payloads)
+
+    def _present_days(self, site, source, start, end):
+        rows = self._conn().execute(
+            "SELECT period FROM partitions WHERE site = ? AND source = ? AND grain = 'day' AND period BETWEEN ? AND ?",
+            (site, source, start.isoformat(), end.isoformat())
+        ).fetchall()
+        return {date.fromisoformat(period) for period, in rows}
+
+    def read_days(self, site, source, start, end):
+        """{date: payload} for the daily partitions in [start, end]"""
+        rows = self._conn().execute(
+            "SELECT period, payload FROM partitions "
+            "WHERE site = ? AND source = ? AND grain = 'day' AND period BETWEEN ? AND ? ORDER BY period",
+            (site, source, start.isoformat(), end.isoformat())
+        ).fetchall()
+        self._count('days_served', len(rows))
+        return {date.fromisoformat(period): json.loads(payload) for period, payload in rows}
+
+    def window(self, site, source, days, offset=0, today=None):
+        """(daily payloads, merged payload) for `days` complete days ending `offset` days before yesterday"""
+        end = (today or date.today()) - timedelta(days=1 + offset)
+        start = end - timedelta(days=days - 1)
+        daily = self.read_days(site, source, start, end)
+        return daily, SOURCES[source](daily.values())
+
+    def compact(self, older_than_days=WAREHOUSE_COMPACT_AFTER_DAYS, today=None):
+        """Merge daily partitions older than the cutoff into monthly partitions; returns days compacted"""
+        cutoff = ((today or date.today()) - timedelta(days=older_than_days)).replace(day=1)
+        conn = self._conn()
+        compacted = 0
+
+        groups = conn.execute(
+            "SELECT DISTINCT site, source, substr(period, 1, 7) FROM partitions "
+            "WHERE grain = 'day' AND period < ?",
+            (cutoff.isoformat(),)
+        ).fetchall()
+
+        for site, source, month in groups:
+            merge = SOURCES.get(source)
+            if merge is None:
+                continue
+            with conn:
+                conn.execute('BEGIN IMMEDIATE')
+                rows = conn.execute(
+                    "SELECT payload FROM partitions WHERE site = ? AND source = ? AND grain = 'day' AND period LIKE ?",
+                    (site, source, f"{month}-%")
+                ).fetchall()
+                existing = conn.execute(
+                    "SELECT payload FROM partitions WHERE site = ? AND source = ? AND grain = 'month' AND period = ?",
+                    (site, source, month)
+                ).fetchone()
+                payloads = [json.loads(row[0]) for row in rows] + ([json.loads(existing[0])] if existing else [])
+                conn.execute(
+                    "INSERT OR REPLACE INTO partitions (site, source, grain, period, payload, fetched_at) "
+                    "VALUES (?, ?, 'month', ?, ?, ?)",
+                    (site, source, month, json.dumps(merge(payloads)), time.time())
+                )
+                conn.execute(
+                    "DELETE FROM partitions WHERE site = ? AND source = ? AND grain = 'day' AND period LIKE ?",
+                    (site, source, f"{month}-%")
+                )
+            compacted += len(rows)
+
+        if compacted:
+            conn.execute('PRAGMA wal_checkpoint(TRUNCATE)')
+        return compacted
+
+    def read_months(self, site, source):
+        """{'YYYY-MM': payload} for compacted history"""
+        rows = self._conn().execute(
+            "SELECT period, payload FROM partitions WHERE site = ? AND source = ? AND grain = 'month' ORDER BY period",
+            (site, source)
+        ).fetchall()
+        return {period: json.loads(payload) for period, payload in rows}
+
+    def stats(self):
+        row = self._conn().execute(
+            "SELECT COUNT(*), COALESCE(SUM(LENGTH(payload)), 0) FROM partitions"
+        ).fetchone()
+        with self._lock:
+            return {**self.counters, 'partitions': row[0], 'payload_bytes': row[1]}
+
+
+warehouse = Warehouse()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Analytics warehouse maintenance')
+    parser.add_argument('--compact', action='store_true', help='Fold old daily partitions into monthly ones')
+    parser.add_argument('--older-than-days', type=int, default=WAREHOUSE_COMPACT_AFTER_DAYS)
+    args = parser.parse_args()
+
+    if args.compact:
+        print(f"Compacted {warehouse.compact(args.older_than_days)} daily partitions")
+    print(warehouse.stats())
+
+
+if __name__ == '__main__':
+    main()